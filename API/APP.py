@@ -1,12 +1,18 @@
 from flask import Flask, jsonify, request, abort
 from flask_cors import CORS
 from datetime import datetime
+from profiler import RequestProfiler, create_blueprint, token_required
 import json
 import os
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
+# 采样分析器，通过 X-Profiler-Token 头访问（未设置 PROFILER_TOKEN 时不可用）
+app.config['PROFILER_TOKEN'] = os.getenv('PROFILER_TOKEN')
+profiler = RequestProfiler(app)
+app.register_blueprint(create_blueprint(profiler, token_required))
+
 # 简单的内存数据存储（生产环境应使用数据库）
 sayings_data = []
 next_id = 1
@@ -1,6 +1,10 @@
 from datetime import datetime
 from database import db
+from sqlalchemy import event
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
+import hashlib
+import unicodedata
 import uuid
 
 class User(db.Model):
@@ -15,11 +19,17 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)  # account closed; data is being removed in the background
     
-    # Relationships
-    sayings = db.relationship('Saying', backref='user', lazy=True, cascade='all, delete-orphan')
-    login_history = db.relationship('LoginHistory', backref='user', lazy=True, cascade='all, delete-orphan')
-    backups = db.relationship('Backup', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Relationships; the database deletes children (ON DELETE CASCADE), so
+    # deleting a user does not load them
+    sayings = db.relationship('Saying', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    login_history = db.relationship('LoginHistory', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    backups = db.relationship('Backup', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    
+    __table_args__ = (
+        db.Index('idx_users_deleted_at', 'deleted_at'),
+    )
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -44,7 +54,8 @@ class Saying(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
-    content = db.Column(db.Text, nullable=False, index=True)
+    content = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64))  # sha256 of normalized content, see hash_content
     author = db.Column(db.String(200), default="Unknown", index=True)
     category = db.Column(db.String(100), default="General", index=True)
     tags = db.Column(db.JSON)  # List of tags
@@ -57,14 +68,31 @@ class Saying(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign keys
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     # Indexes
     __table_args__ = (
-        db.Index('idx_sayings_search', 'content', 'author', 'category'),
-        db.Index('idx_sayings_user', 'user_id', 'created_at'),
+        # id in the key keeps exports in id order without a sort on PostgreSQL too,
+        # not just through SQLite's rowid
+        db.Index('idx_sayings_user', 'user_id', 'id'),
+        db.Index('idx_sayings_user_category', 'user_id', 'category'),
+        db.Index('idx_sayings_user_views', 'user_id', 'view_count'),
+        # One saying per normalized content and user; NULL hashes never collide
+        db.Index('idx_sayings_user_hash', 'user_id', 'content_hash', unique=True),
+        db.Index('idx_sayings_user_updated', 'user_id', 'updated_at'),
     )
     
+    @staticmethod
+    def hash_content(content):
+        """Hash content after Unicode, case and whitespace normalization"""
+        normalized = ' '.join(unicodedata.normalize('NFKC', content).casefold().split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    @validates('content')
+    def _update_content_hash(self, key, content):
+        self.content_hash = Saying.hash_content(content) if content is not None else None
+        return content
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -87,34 +115,196 @@ class LoginHistory(db.Model):
     __tablename__ = 'login_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.Text)
     login_time = db.Column(db.DateTime, default=datetime.utcnow)
     logout_time = db.Column(db.DateTime)
     status = db.Column(db.String(20))  # success, failed, locked
+    
+    __table_args__ = (
+        db.Index('idx_login_history_user', 'user_id', 'login_time'),
+    )
 
 class Backup(db.Model):
     __tablename__ = 'backups'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500))
     file_size = db.Column(db.Integer)
     backup_type = db.Column(db.String(20))  # full, incremental
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='completed')  # pending, processing, completed, failed
+    status = db.Column(db.String(20), default='completed')  # pending, processing, completed, failed, missing
+    watermark = db.Column(db.DateTime)  # changes up to this time are included
+    parent_id = db.Column(db.Integer, db.ForeignKey('backups.id'))  # previous backup in an incremental chain
+    checksum = db.Column(db.String(64))  # sha256 of the backup file
+    locations = db.Column(db.JSON)  # where copies exist: local, s3, gcs
+    verified_at = db.Column(db.DateTime)  # last time the reconciler checked the locations
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    error_message = db.Column(db.Text)
+    
+    parent = db.relationship('Backup', remote_side=[id])
+    
+    __table_args__ = (
+        db.Index('idx_backups_user_created', 'user_id', 'created_at'),
+        db.Index('idx_backups_filename', 'filename'),
+        db.Index('idx_backups_status', 'status'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'backup_type': self.backup_type,
+            'status': self.status,
+            'file_size': self.file_size,
+            'checksum': self.checksum,
+            'locations': self.locations or [],
+            'parent_id': self.parent_id,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'watermark': self.watermark.isoformat() if self.watermark else None
+        }
+
+class BackupChunk(db.Model):
+    __tablename__ = 'backup_chunks'
+    
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of the uncompressed chunk
+    size = db.Column(db.Integer, nullable=False)  # stored (compressed) bytes
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # backups referencing the chunk
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_backup_chunks_ref_count', 'ref_count'),
+    )
+
+class BackupChunkRef(db.Model):
+    __tablename__ = 'backup_chunk_refs'
+    
+    # One row per chunk a backup holds a reference on, so deleting the
+    # backup can release them without reading its manifest
+    backup_id = db.Column(db.Integer, db.ForeignKey('backups.id', ondelete='CASCADE'), primary_key=True)
+    digest = db.Column(db.String(64), primary_key=True)
+
+class SayingTombstone(db.Model):
+    __tablename__ = 'saying_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    saying_uuid = db.Column(db.String(36), nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_saying_tombstones_user_deleted', 'user_id', 'deleted_at'),
+    )
+
+@event.listens_for(Saying, 'after_delete')
+def _record_saying_tombstone(mapper, connection, target):
+    """Remember deleted sayings so incremental backups can replay deletions"""
+    connection.execute(SayingTombstone.__table__.insert().values(
+        user_id=target.user_id,
+        saying_uuid=target.uuid,
+        deleted_at=datetime.utcnow()
+    ))
+
+class UserShard(db.Model):
+    """Directory of which shard holds each user's sayings"""
+    __tablename__ = 'user_shards'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.String(50), nullable=False)  # bind key from SHARD_BINDS
+    assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    moved_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('idx_user_shards_shard', 'shard'),
+    )
 
 class UsageStatistics(db.Model):
     __tablename__ = 'usage_statistics'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, default=datetime.utcnow().date)
     sayings_created = db.Column(db.Integer, default=0)
     sayings_updated = db.Column(db.Integer, default=0)
     sayings_deleted = db.Column(db.Integer, default=0)
     api_calls = db.Column(db.Integer, default=0)
     login_count = db.Column(db.Integer, default=0)
-    total_view_count = db.Column(db.Integer, default=0)
\ No newline at end of file
+    total_view_count = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.Index('idx_usage_statistics_user_date', 'user_id', 'date'),
+    )
+
+class EndpointStatistics(db.Model):
+    __tablename__ = 'endpoint_statistics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(200), nullable=False)  # "GET /api/sayings"
+    date = db.Column(db.Date, nullable=False)
+    call_count = db.Column(db.Integer, default=0)
+    unique_users_sketch = db.Column(db.LargeBinary)  # HyperLogLog
+    latency_sketch = db.Column(db.LargeBinary)  # DDSketch, milliseconds
+    
+    __table_args__ = (
+        db.UniqueConstraint('endpoint', 'date', name='uq_endpoint_statistics_endpoint_date'),
+        db.Index('idx_endpoint_statistics_date', 'date'),
+    )
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(500), nullable=False)
+    file_format = db.Column(db.String(10), nullable=False)  # csv, ndjson
+    on_duplicate = db.Column(db.String(10))  # skip, update, error
+    source_fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the uploaded file
+    source_size = db.Column(db.BigInteger)
+    status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
+    
+    # Checkpoint, committed with the rows it covers (just after them when sharded)
+    byte_offset = db.Column(db.BigInteger, default=0)  # source bytes fully imported
+    line_offset = db.Column(db.Integer, default=0)  # source lines fully imported
+    total_count = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    duplicate_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    error_samples = db.Column(db.JSON)  # first few "Line N: message" strings
+    error_message = db.Column(db.Text)  # why a failed job stopped
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # last checkpoint; stale = worker died
+    completed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('idx_import_jobs_status', 'status', 'heartbeat_at'),
+        db.Index('idx_import_jobs_user_source', 'user_id', 'source_fingerprint'),
+    )
+    
+    def to_dict(self):
+        return {
+            'job_id': self.uuid,
+            'filename': self.filename,
+            'file_format': self.file_format,
+            'status': self.status,
+            'progress': round(self.byte_offset / self.source_size, 4) if self.source_size else 1.0,
+            'total_count': self.total_count,
+            'success_count': self.success_count,
+            'duplicate_count': self.duplicate_count,
+            'error_count': self.error_count,
+            'errors': self.error_samples or [],
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
\ No newline at end of file
@@ -0,0 +1,160 @@
+import atexit
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from models import db, User, Saying, SayingTombstone, LoginHistory, UsageStatistics, Backup, ImportJob, UserShard
+from sharding import shards
+
+class AccountDeletionWorker:
+    """Deletes closed accounts in the background, one chunk per transaction.
+
+    tombstone() only marks the user deleted and inactive, so the account
+    stops working at once. The worker then removes the user's rows table
+    by table with set-based DELETEs of ACCOUNT_DELETE_CHUNK_SIZE rows, each
+    committed on its own, and finally the user row. No table is locked for
+    longer than one chunk however large the account is, and an interrupted
+    deletion simply carries on from what is left.
+
+    Accounts with a backup or import still running are retried on a later
+    pass once it finishes.
+    """
+
+    def __init__(self, app, backup_manager, chunk_size=None, poll_interval=None, stale_after=None):
+        self.app = app
+        self.backup_manager = backup_manager
+        self.chunk_size = chunk_size or app.config.get('ACCOUNT_DELETE_CHUNK_SIZE', 5000)
+        self.poll_interval = poll_interval or app.config.get('ACCOUNT_DELETE_POLL_INTERVAL', 30)
+        # Same limit as the import worker uses to call a job abandoned
+        self.stale_after = timedelta(seconds=stale_after or app.config.get('IMPORT_JOB_STALE_SECONDS', 300))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background deletion thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='account-deletion', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop after the chunk in progress; deletion resumes on next start"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def tombstone(self, user_id):
+        """Close user's account now and queue its data for deletion"""
+        user = db.session.get(User, user_id)
+        if not user or user.deleted_at is not None:
+            return False, "User not found"
+
+        user.is_active = False
+        user.deleted_at = datetime.utcnow()
+        db.session.commit()
+
+        self._wake.set()
+        return True, "Account scheduled for deletion"
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    user_ids = db.session.execute(
+                        select(User.id).where(User.deleted_at.isnot(None)).order_by(User.deleted_at)
+                    ).scalars().all()
+                    for user_id in user_ids:
+                        if self._stop.is_set():
+                            break
+                        if self.purge(user_id):
+                            self.app.logger.info(f"Deleted account {user_id}")
+            except Exception:
+                with self.app.app_context():
+                    db.session.rollback()
+                self.app.logger.exception("Account deletion failed")
+
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def purge(self, user_id):
+        """Delete a tombstoned user's data; False if it has to wait for running jobs.
+
+        Every step is idempotent, so workers in several processes may work
+        on the same account.
+        """
+        # Queued work would otherwise recreate data after it is deleted
+        db.session.execute(delete(ImportJob.__table__).where(
+            ImportJob.user_id == user_id, ImportJob.status == 'pending'
+        ))
+        db.session.execute(delete(Backup.__table__).where(
+            Backup.user_id == user_id, Backup.status == 'pending'
+        ))
+        db.session.commit()
+        if self._busy(user_id):
+            return False
+
+        with shards.for_user(user_id):
+            self._delete_in_chunks(Saying.__table__, user_id)
+            self._delete_in_chunks(SayingTombstone.__table__, user_id)
+        self._delete_backups(user_id)
+        self._delete_import_jobs(user_id)
+        self._delete_in_chunks(LoginHistory.__table__, user_id)
+        self._delete_in_chunks(UsageStatistics.__table__, user_id)
+
+        # Anything written since is removed by ON DELETE CASCADE
+        db.session.execute(delete(UserShard.__table__).where(UserShard.user_id == user_id))
+        db.session.execute(delete(User.__table__).where(User.id == user_id))
+        db.session.commit()
+        return True
+
+    def _busy(self, user_id):
+        recent = datetime.utcnow() - self.stale_after
+        return bool(
+            db.session.execute(select(ImportJob.id).where(
+                ImportJob.user_id == user_id, ImportJob.status == 'processing', ImportJob.heartbeat_at >= recent
+            ).limit(1)).first()
+            or db.session.execute(select(Backup.id).where(
+                Backup.user_id == user_id, Backup.status == 'processing'
+            ).limit(1)).first()
+        )
+
+    def _delete_in_chunks(self, table, user_id):
+        while True:
+            ids = db.session.execute(
+                select(table.c.id).where(table.c.user_id == user_id).limit(self.chunk_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete(table).where(table.c.id.in_(ids)))
+            db.session.commit()
+
+    def _delete_backups(self, user_id):
+        """Delete backups with their files and chunk references, newest first"""
+        while True:
+            # Incrementals have higher ids than the backups they build on
+            backups = Backup.query.filter_by(user_id=user_id).order_by(Backup.id.desc()).limit(100).all()
+            if not backups:
+                break
+            for backup in backups:
+                success, message = self.backup_manager.delete_backup(backup)
+                if not success:
+                    raise RuntimeError(f"Cannot delete backup {backup.id}: {message}")
+
+    def _delete_import_jobs(self, user_id):
+        jobs = ImportJob.__table__
+        while True:
+            rows = db.session.execute(
+                select(jobs.c.id, jobs.c.file_path).where(jobs.c.user_id == user_id).limit(self.chunk_size)
+            ).all()
+            if not rows:
+                break
+            db.session.execute(delete(jobs).where(jobs.c.id.in_([row.id for row in rows])))
+            db.session.commit()
+            for row in rows:
+                if row.file_path and os.path.exists(row.file_path):
+                    os.remove(row.file_path)
@@ -1,15 +1,154 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
-from models import db, UsageStatistics, Saying, User
-import pandas as pd
-import matplotlib.pyplot as plt
+from sqlalchemy import func, and_, select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from models import db, UsageStatistics, Saying, User, EndpointStatistics
+from sketches import HyperLogLog, DDSketch
+from sharding import shards
 import io
 import base64
+import atexit
+import threading
+
+# INSERT constructs with ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+class EndpointSketchBuffer:
+    """Per-process endpoint sketches, merged into endpoint_statistics on flush.
+
+    Requests only update the in-memory sketches. A background thread
+    started by start() merges them every ENDPOINT_STATS_FLUSH_INTERVAL
+    seconds on its own connection, so flushing never touches a request's
+    session or holds up its response.
+    """
+    
+    def __init__(self, flush_interval=60):
+        self.flush_interval = flush_interval
+        self.app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (endpoint, date) -> [call_count, HyperLogLog, DDSketch]
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self, app):
+        """Start the background flush thread"""
+        if self._thread is not None:
+            return
+        self.app = app
+        self.flush_interval = app.config.get('ENDPOINT_STATS_FLUSH_INTERVAL', self.flush_interval)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='endpoint-sketches', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self):
+        """Stop the flush thread and write out anything still buffered"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with self.app.app_context():
+            self.flush()
+    
+    def record(self, endpoint, user_id=None, latency_ms=None):
+        key = (endpoint, datetime.utcnow().date())
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = [0, HyperLogLog(), DDSketch()]
+            entry[0] += 1
+            if user_id is not None:
+                entry[1].add(user_id)
+            if latency_ms is not None:
+                entry[2].add(latency_ms)
+    
+    def flush(self):
+        """Merge pending sketches into the database. Needs an app context."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            
+            if not pending:
+                return
+            
+            try:
+                with db.engine.begin() as connection:
+                    for (endpoint, day), (calls, users, latency) in pending.items():
+                        self._merge(connection, endpoint, day, calls, users, latency)
+            except SQLAlchemyError:
+                self._requeue(pending)
+                raise
+    
+    @staticmethod
+    def _merge(connection, endpoint, day, calls, users, latency):
+        table = EndpointStatistics.__table__
+        # Create the day's row unless another process already has. Writing
+        # first also takes SQLite's write lock, where FOR UPDATE is a no-op,
+        # so concurrent flushes cannot lose each other's merge.
+        values = {'endpoint': endpoint, 'date': day, 'call_count': 0}
+        dialect_insert = UPSERT_INSERTS.get(connection.dialect.name)
+        if dialect_insert is not None:
+            connection.execute(
+                dialect_insert(table).values(values).on_conflict_do_nothing(index_elements=['endpoint', 'date'])
+            )
+        else:
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(values))
+            except IntegrityError:
+                pass
+        
+        row = connection.execute(
+            select(table.c.id, table.c.call_count, table.c.unique_users_sketch, table.c.latency_sketch)
+            .where(table.c.endpoint == endpoint, table.c.date == day)
+            .with_for_update()
+        ).one()
+        if row.unique_users_sketch:
+            users = HyperLogLog.from_bytes(row.unique_users_sketch).merge(users)
+        if row.latency_sketch:
+            latency = DDSketch.from_bytes(row.latency_sketch).merge(latency)
+        connection.execute(update(table).where(table.c.id == row.id).values(
+            call_count=(row.call_count or 0) + calls,
+            unique_users_sketch=users.to_bytes(),
+            latency_sketch=latency.to_bytes()
+        ))
+    
+    def _requeue(self, pending):
+        """Put sketches from a failed flush back so the next flush retries them"""
+        with self._lock:
+            for key, (calls, users, latency) in pending.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [calls, users, latency]
+                else:
+                    entry[0] += calls
+                    entry[1].merge(users)
+                    entry[2].merge(latency)
+    
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                # Sketches were requeued; the next flush retries them
+                self.app.logger.exception("Failed to flush endpoint statistics")
+
+endpoint_sketches = EndpointSketchBuffer()
 
 class AnalyticsManager:
     @staticmethod
-    def track_api_call(user_id, endpoint):
+    def track_request(endpoint, user_id=None, latency_ms=None):
+        """Record a request in the endpoint sketches without touching the database"""
+        endpoint_sketches.record(endpoint, user_id, latency_ms)
+    
+    @staticmethod
+    def track_api_call(user_id, endpoint, latency_ms=None):
         """Track API call for analytics"""
+        AnalyticsManager.track_request(endpoint, user_id, latency_ms)
+        
         today = datetime.utcnow().date()
         
         stats = UsageStatistics.query.filter_by(
@@ -84,6 +223,12 @@ class AnalyticsManager:
     @staticmethod
     def generate_chart(data, chart_type='line'):
         """Generate chart image"""
+        # matplotlib costs ~0.5s and tens of MB to import, so only pay for it
+        # when a chart is actually rendered
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        
         plt.figure(figsize=(10, 6))
         
         if chart_type == 'line':
@@ -116,22 +261,121 @@ class AnalyticsManager:
         return image_base64
     
     @staticmethod
-    def get_category_distribution(user_id):
-        """Get saying distribution by category"""
-        distribution = db.session.query(
+    def get_category_distribution(user_id=None):
+        """Get saying distribution by category, for user or (user_id=None) everyone"""
+        if user_id is None:
+            # Sum the per-shard counts
+            totals = {}
+            for rows in shards.fan_out(AnalyticsManager._count_categories, None).values():
+                for category, count in rows:
+                    totals[category] = totals.get(category, 0) + count
+            distribution = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        else:
+            distribution = AnalyticsManager._count_categories(user_id)
+        
+        return {
+            'categories': [cat for cat, _ in distribution],
+            'counts': [count for _, count in distribution]
+        }
+    
+    @staticmethod
+    def _count_categories(user_id):
+        query = db.session.query(
             Saying.category,
             func.count(Saying.id).label('count')
-        ).filter_by(
-            user_id=user_id
-        ).group_by(
+        )
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        
+        return query.group_by(
             Saying.category
         ).order_by(
             func.count(Saying.id).desc()
         ).all()
+    
+    @staticmethod
+    def _merge_endpoint_rows(rows):
+        """Merge endpoint_statistics rows into (calls, HyperLogLog, DDSketch)"""
+        calls = 0
+        users = HyperLogLog()
+        latency = DDSketch()
+        for row in rows:
+            calls += row.call_count or 0
+            if row.unique_users_sketch:
+                users.merge(HyperLogLog.from_bytes(row.unique_users_sketch))
+            if row.latency_sketch:
+                latency.merge(DDSketch.from_bytes(row.latency_sketch))
+        return calls, users, latency
+    
+    @staticmethod
+    def get_endpoint_stats(endpoint=None, start_date=None, end_date=None):
+        """Get approximate unique users and latency quantiles per endpoint"""
+        if not start_date:
+            start_date = datetime.utcnow() - timedelta(days=7)
+        if not end_date:
+            end_date = datetime.utcnow()
+        
+        # Include sketches not yet flushed by this process
+        endpoint_sketches.flush()
+        
+        query = EndpointStatistics.query.filter(
+            EndpointStatistics.date.between(start_date.date(), end_date.date())
+        )
+        if endpoint:
+            query = query.filter_by(endpoint=endpoint)
+        
+        rows_by_endpoint = {}
+        for row in query.all():
+            rows_by_endpoint.setdefault(row.endpoint, []).append(row)
+        
+        endpoints = []
+        for name, rows in sorted(rows_by_endpoint.items()):
+            calls, users, latency = AnalyticsManager._merge_endpoint_rows(rows)
+            endpoints.append({
+                'endpoint': name,
+                'calls': calls,
+                'unique_users': users.count(),
+                'latency_ms': {
+                    'p50': latency.quantile(0.50),
+                    'p95': latency.quantile(0.95),
+                    'p99': latency.quantile(0.99),
+                    'max': latency.max if latency.count else None
+                }
+            })
         
         return {
-            'categories': [cat for cat, _ in distribution],
-            'counts': [count for _, count in distribution]
+            'period': {
+                'start': start_date.isoformat(),
+                'end': end_date.isoformat()
+            },
+            'endpoints': endpoints
+        }
+    
+    @staticmethod
+    def get_daily_active_users(start_date=None, end_date=None):
+        """Get approximate distinct users per day across all endpoints"""
+        if not start_date:
+            start_date = datetime.utcnow() - timedelta(days=30)
+        if not end_date:
+            end_date = datetime.utcnow()
+        
+        endpoint_sketches.flush()
+        
+        rows = EndpointStatistics.query.filter(
+            EndpointStatistics.date.between(start_date.date(), end_date.date())
+        ).order_by(EndpointStatistics.date).all()
+        
+        rows_by_date = {}
+        for row in rows:
+            rows_by_date.setdefault(row.date, []).append(row)
+        
+        dates = sorted(rows_by_date)
+        return {
+            'dates': [day.isoformat() for day in dates],
+            'active_users': [
+                AnalyticsManager._merge_endpoint_rows(rows_by_date[day])[1].count()
+                for day in dates
+            ]
         }
     
     @staticmethod
@@ -1,11 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 import os
+import time
 from database import db
 from models import User, Saying
-from auth import init_auth
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
+from auth import init_auth, admin_required
+from report_jobs import ReportJobQueue, REPORT_TYPES
+from analytics import AnalyticsManager, endpoint_sketches
+from view_counter import ViewCounter
+from import_jobs import ImportJobWorker
+from backup_manager import BackupManager
+from backup_reconciler import BackupReconciler
+from backup_scheduler import BackupScheduler
+from account_deletion import AccountDeletionWorker
+from sharding import shards
+from profiler import RequestProfiler, create_blueprint as create_profiler_blueprint
+from batch_processor import BatchProcessor
+from import_engine import DUPLICATE_POLICIES
+from columnar import COLUMNAR_FORMATS, MIMETYPES as COLUMNAR_MIMETYPES, ColumnarUnavailable
+from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import IntegrityError
 import hashlib
 
 app = Flask(__name__)
@@ -15,7 +30,13 @@ CORS(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///sayings.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# 初始化数据库
+# 用户分片数据库（可选），逗号分隔的连接串，如 sqlite:///shard0.db,sqlite:///shard1.db
+shard_urls = os.getenv('SHARD_DATABASE_URLS')
+if shard_urls:
+    app.config['SHARD_BINDS'] = {f'shard{i}': url.strip() for i, url in enumerate(shard_urls.split(','))}
+
+# 初始化数据库（配置 SHARD_BINDS 时按用户分片，需在 db.init_app 之前）
+shards.init_app(app)
 db.init_app(app)
 
 # 初始化JWT
@@ -24,6 +45,75 @@ jwt = init_auth(app)
 # 创建数据库表
 with app.app_context():
     db.create_all()
+    shards.create_all()
+
+# 报表后台任务队列
+report_jobs = ReportJobQueue(app)
+
+# 大文件导入任务（持久化，后台执行，中断后从检查点继续）
+import_jobs = ImportJobWorker(app)
+import_jobs.start()
+
+# 备份目录：备份记录在 backups 表中，定期与本地及云端存储核对
+backup_manager = BackupManager(app)
+backup_reconciler = BackupReconciler(app, backup_manager)
+backup_reconciler.start()
+
+# 备份任务在后台线程池中执行（每个用户限制并发数，可配置定时计划）
+backup_scheduler = BackupScheduler(app, backup_manager)
+backup_scheduler.start()
+
+# 注销账户：立即停用，数据由后台线程分块删除
+account_deletion = AccountDeletionWorker(app, backup_manager)
+account_deletion.start()
+
+# 浏览次数缓冲计数（定期批量写入数据库）
+view_counter = ViewCounter(app)
+view_counter.start()
+
+# 接口统计草图在后台线程中定期合并到数据库，不占用请求的会话
+endpoint_sketches.start(app)
+
+# 采样分析器：管理员按比例或时间窗口开启，按路由汇总调用栈，可下载火焰图数据（关闭时无开销）
+profiler = RequestProfiler(app)
+app.register_blueprint(create_profiler_blueprint(profiler, admin_required))
+
+# 按登录用户把说法相关的查询路由到该用户的分片
+@app.before_request
+def route_to_user_shard():
+    if not shards.enabled:
+        return
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        # 无效令牌由 jwt_required 拒绝
+        return
+    user_id = get_jwt_identity()
+    if user_id is not None:
+        g.shard_token = shards.push(user_id)
+
+@app.teardown_request
+def leave_user_shard(exc=None):
+    token = g.pop('shard_token', None)
+    if token is not None:
+        shards.pop(token)
+
+# 记录每个接口的调用耗时和独立用户（内存草图，定期合并到数据库）
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if request.url_rule is not None and 'request_started' in g:
+        latency_ms = (time.perf_counter() - g.request_started) * 1000
+        try:
+            user_id = get_jwt_identity()
+        except RuntimeError:
+            # 未经过 jwt_required 的接口没有身份信息
+            user_id = None
+        AnalyticsManager.track_request(f'{request.method} {request.url_rule.rule}', user_id, latency_ms)
+    return response
 
 # 用户注册
 @app.route('/api/auth/register', methods=['POST'])
@@ -53,7 +143,7 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
-    user = User.query.filter_by(username=username).first()
+    user = User.query.filter_by(username=username, deleted_at=None).first()
     if not user:
         return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
 
@@ -65,12 +155,87 @@ def login():
     access_token = create_access_token(identity=user.id)
     return jsonify({'success': True, 'access_token': access_token, 'user_id': user.id})
 
+# 注销账户（需要登录），立即生效，数据在后台删除
+@app.route('/api/account', methods=['DELETE'])
+@jwt_required()
+def delete_account():
+    current_user_id = get_jwt_identity()
+    success, message = account_deletion.tombstone(current_user_id)
+    if not success:
+        return jsonify({'success': False, 'message': message}), 404
+
+    return jsonify({'success': True, 'message': message}), 202
+
+# 说法列表可返回的字段及对应的列
+SAYING_LIST_FIELDS = {
+    'id': Saying.id,
+    'content': Saying.content,
+    'author': Saying.author,
+    'category': Saying.category,
+    'created_date': Saying.created_at,
+    'last_modified': Saying.updated_at
+}
+MAX_IDS_PER_REQUEST = 500
+
 # 获取所有说法（需要登录）
+# ?ids=1,2,3 一次查询取多条（按请求顺序返回，并计入浏览次数），?fields=id,content 只查询并返回这些字段
 @app.route('/api/sayings', methods=['GET'])
 @jwt_required()
 def get_all_sayings():
     current_user_id = get_jwt_identity()
-    sayings = Saying.query.filter_by(user_id=current_user_id).all()
+
+    fields = list(SAYING_LIST_FIELDS)
+    if 'fields' in request.args:
+        fields = list(dict.fromkeys(name.strip() for name in request.args['fields'].split(',') if name.strip()))
+        unknown = [name for name in fields if name not in SAYING_LIST_FIELDS]
+        if unknown or not fields:
+            problem = f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields given'
+            return jsonify({
+                'success': False,
+                'message': f"{problem}; available: {', '.join(SAYING_LIST_FIELDS)}"
+            }), 400
+
+    ids = None
+    if 'ids' in request.args:
+        try:
+            ids = list(dict.fromkeys(int(value) for value in request.args['ids'].split(',') if value.strip()))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'ids must be comma-separated integers'}), 400
+        if len(ids) > MAX_IDS_PER_REQUEST:
+            return jsonify({'success': False, 'message': f'At most {MAX_IDS_PER_REQUEST} ids per request'}), 400
+
+    # id 用于按请求顺序排列，user_id 用于计数，总是查询
+    columns = [Saying.id, Saying.user_id] + [SAYING_LIST_FIELDS[name] for name in fields if name != 'id']
+    query = Saying.query.filter_by(user_id=current_user_id).with_entities(*columns)
+    if ids is not None:
+        query = query.filter(Saying.id.in_(ids))
+    rows = query.all()
+
+    data = []
+    for row in rows:
+        values = dict(zip(['id'] + [name for name in fields if name != 'id'], (row[0], *row[2:])))
+        for name in ('created_date', 'last_modified'):
+            if values.get(name) is not None:
+                values[name] = values[name].isoformat()
+        data.append({name: values[name] for name in fields})
+
+    response = {'success': True, 'count': len(data), 'data': data}
+    if ids is not None:
+        by_id = {row[0]: item for row, item in zip(rows, data)}
+        response['data'] = [by_id[saying_id] for saying_id in ids if saying_id in by_id]
+        response['missing'] = [saying_id for saying_id in ids if saying_id not in by_id]
+        # 按 id 取回等同于逐条查看，与单条接口一样计入浏览次数
+        for row in rows:
+            view_counter.increment(row[0], row[1])
+    return jsonify(response)
+
+# 获取浏览次数最多的说法（需要登录）
+@app.route('/api/sayings/most-viewed', methods=['GET'])
+@jwt_required()
+def get_most_viewed_sayings():
+    current_user_id = get_jwt_identity()
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    sayings = ViewCounter.most_viewed(current_user_id, limit)
     return jsonify({
         'success': True,
         'count': len(sayings),
@@ -79,8 +244,7 @@ def get_all_sayings():
             'content': s.content,
             'author': s.author,
             'category': s.category,
-            'created_date': s.created_date.isoformat() if s.created_date else None,
-            'last_modified': s.last_modified.isoformat() if s.last_modified else None
+            'view_count': s.view_count or 0
         } for s in sayings]
     })
 
@@ -93,6 +257,8 @@ def get_saying(saying_id):
     if not saying:
         return jsonify({'success': False, 'message': 'Saying not found'}), 404
 
+    view_counter.increment(saying.id, saying.user_id)
+
     return jsonify({
         'success': True,
         'data': {
@@ -100,8 +266,8 @@ def get_saying(saying_id):
             'content': saying.content,
             'author': saying.author,
             'category': saying.category,
-            'created_date': saying.created_date.isoformat() if saying.created_date else None,
-            'last_modified': saying.last_modified.isoformat() if saying.last_modified else None
+            'created_date': saying.created_at.isoformat() if saying.created_at else None,
+            'last_modified': saying.updated_at.isoformat() if saying.updated_at else None
         }
     })
 
@@ -122,14 +288,30 @@ def create_saying():
     author = data.get('author', 'Unknown').strip() or 'Unknown'
     category = data.get('category', 'General').strip() or 'General'
 
-    new_saying = Saying(
-        content=content,
-        author=author,
-        category=category,
-        user_id=current_user_id
-    )
-    db.session.add(new_saying)
-    db.session.commit()
+    content_hash = Saying.hash_content(content)
+    existing = Saying.query.filter_by(user_id=current_user_id, content_hash=content_hash).first()
+    if not existing:
+        new_saying = Saying(
+            content=content,
+            author=author,
+            category=category,
+            user_id=current_user_id
+        )
+        db.session.add(new_saying)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 并发请求刚插入了相同内容，唯一索引 (user_id, content_hash) 拒绝了这一条
+            db.session.rollback()
+            existing = Saying.query.filter_by(user_id=current_user_id, content_hash=content_hash).first()
+            if not existing:
+                raise
+    if existing:
+        return jsonify({
+            'success': False,
+            'message': 'Saying already exists',
+            'data': {'id': existing.id}
+        }), 409
 
     return jsonify({
         'success': True,
@@ -139,8 +321,8 @@ def create_saying():
             'content': new_saying.content,
             'author': new_saying.author,
             'category': new_saying.category,
-            'created_date': new_saying.created_date.isoformat() if new_saying.created_date else None,
-            'last_modified': new_saying.last_modified.isoformat() if new_saying.last_modified else None
+            'created_date': new_saying.created_at.isoformat() if new_saying.created_at else None,
+            'last_modified': new_saying.updated_at.isoformat() if new_saying.updated_at else None
         }
     }), 201
 
@@ -169,8 +351,12 @@ def update_saying(saying_id):
     if 'category' in data:
         saying.category = data['category'].strip() or 'General'
 
-    saying.last_modified = datetime.utcnow()
-    db.session.commit()
+    saying.updated_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Saying already exists'}), 409
 
     return jsonify({
         'success': True,
@@ -180,8 +366,8 @@ def update_saying(saying_id):
             'content': saying.content,
             'author': saying.author,
             'category': saying.category,
-            'created_date': saying.created_date.isoformat() if saying.created_date else None,
-            'last_modified': saying.last_modified.isoformat() if saying.last_modified else None
+            'created_date': saying.created_at.isoformat() if saying.created_at else None,
+            'last_modified': saying.updated_at.isoformat() if saying.updated_at else None
         }
     })
 
@@ -202,6 +388,90 @@ def delete_saying(saying_id):
         'message': f'Saying with ID {saying_id} deleted successfully'
     })
 
+# 批量导入说法（需要登录）
+@app.route('/api/sayings/import', methods=['POST'])
+@jwt_required()
+def import_sayings():
+    current_user_id = get_jwt_identity()
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'message': 'File is required'}), 400
+
+    # 根据扩展名选择格式：.csv / .json / .ndjson、.jsonl / .parquet / .arrow、.feather
+    extension = os.path.splitext(upload.filename or '')[1].lower()
+    file_format = request.form.get('format') or extension.lstrip('.') or 'csv'
+
+    # 重复内容的处理方式：skip（默认）/ update / error
+    on_duplicate = request.form.get('on_duplicate', 'skip')
+    if on_duplicate not in DUPLICATE_POLICIES:
+        return jsonify({'success': False, 'message': f'Unsupported on_duplicate policy: {on_duplicate}'}), 400
+
+    # CSV 和 NDJSON 在多个进程中并行解析（IMPORT_WORKERS，默认为 CPU 核数）
+    workers = app.config.get('IMPORT_WORKERS', os.cpu_count() or 1)
+
+    # 上传文件由 werkzeug 缓存在临时文件中，按块流式读取
+    if file_format == 'csv':
+        success, result = BatchProcessor.import_csv(
+            upload.stream, current_user_id, workers=workers, on_duplicate=on_duplicate
+        )
+    elif file_format == 'json':
+        success, result = BatchProcessor.import_json(
+            upload.stream, current_user_id, workers=workers, on_duplicate=on_duplicate
+        )
+    elif file_format in ('ndjson', 'jsonl'):
+        success, result = BatchProcessor.import_json(
+            upload.stream, current_user_id, json_format='ndjson', workers=workers, on_duplicate=on_duplicate
+        )
+    elif file_format in ('parquet', 'arrow', 'feather'):
+        success, result = BatchProcessor.import_columnar(
+            upload.stream, current_user_id, file_format='parquet' if file_format == 'parquet' else 'arrow',
+            on_duplicate=on_duplicate
+        )
+    else:
+        return jsonify({'success': False, 'message': f'Unsupported import format: {file_format}'}), 400
+
+    if not success:
+        return jsonify({'success': False, 'message': result}), 400
+
+    return jsonify({'success': True, 'data': result})
+
+# 导出说法（需要登录），流式输出 CSV / JSON / Parquet / Arrow，CSV 和 JSON 在客户端支持时使用 gzip 压缩
+@app.route('/api/sayings/export', methods=['GET'])
+@jwt_required()
+def export_sayings():
+    current_user_id = get_jwt_identity()
+    file_format = request.args.get('format', 'csv').lower()
+
+    filters = {key: request.args[key] for key in ('category', 'author') if key in request.args}
+    if 'is_public' in request.args:
+        filters['is_public'] = request.args['is_public'].lower() in ('1', 'true', 'yes')
+
+    if file_format == 'csv':
+        chunks = BatchProcessor.iter_export_csv(current_user_id, filters)
+        mimetype = 'text/csv'
+    elif file_format == 'json':
+        chunks = BatchProcessor.iter_export_json(current_user_id, filters)
+        mimetype = 'application/json'
+    elif file_format in COLUMNAR_FORMATS:
+        try:
+            chunks = BatchProcessor.iter_export_columnar(current_user_id, filters, file_format)
+        except ColumnarUnavailable as e:
+            return jsonify({'success': False, 'message': str(e)}), 501
+        mimetype = COLUMNAR_MIMETYPES[file_format]
+    else:
+        return jsonify({'success': False, 'message': f'Unsupported export format: {file_format}'}), 400
+
+    headers = {
+        'Content-Disposition': f'attachment; filename=sayings.{file_format}',
+        'Vary': 'Accept-Encoding'
+    }
+    # Parquet/Arrow 列已在文件内压缩，不再 gzip
+    if file_format not in COLUMNAR_FORMATS and 'gzip' in request.accept_encodings:
+        chunks = BatchProcessor.gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 # 搜索说法（需要登录）
 @app.route('/api/sayings/search', methods=['GET'])
 @jwt_required()
@@ -233,10 +503,119 @@ def search_sayings():
             'content': s.content,
             'author': s.author,
             'category': s.category,
-            'created_date': s.created_date.isoformat() if s.created_date else None,
-            'last_modified': s.last_modified.isoformat() if s.last_modified else None
+            'created_date': s.created_at.isoformat() if s.created_at else None,
+            'last_modified': s.updated_at.isoformat() if s.updated_at else None
         } for s in sayings]
     })
 
+# 提交报表生成任务（需要登录）
+@app.route('/api/reports', methods=['POST'])
+@jwt_required()
+def submit_report():
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    report_type = data.get('report_type', 'weekly')
+
+    if report_type not in REPORT_TYPES:
+        return jsonify({'success': False, 'message': f'report_type must be one of {", ".join(REPORT_TYPES)}'}), 400
+
+    job = report_jobs.submit(current_user_id, report_type)
+    return jsonify({'success': True, 'data': job.to_dict()}), 202
+
+# 查询报表任务状态（需要登录）
+@app.route('/api/reports/<job_id>', methods=['GET'])
+@jwt_required()
+def get_report_status(job_id):
+    current_user_id = get_jwt_identity()
+    job = report_jobs.get(job_id, current_user_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Report job not found'}), 404
+
+    return jsonify({'success': True, 'data': job.to_dict()})
+
+# 获取报表结果（需要登录）
+@app.route('/api/reports/<job_id>/result', methods=['GET'])
+@jwt_required()
+def get_report_result(job_id):
+    current_user_id = get_jwt_identity()
+    job = report_jobs.get(job_id, current_user_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Report job not found'}), 404
+
+    if job.status == 'failed':
+        return jsonify({'success': False, 'message': f'Report generation failed: {job.error}'}), 500
+
+    if job.status != 'completed':
+        return jsonify({'success': True, 'data': job.to_dict()}), 202
+
+    return jsonify({'success': True, 'data': job.result})
+
+# 提交后台导入任务（需要登录），支持 .csv / .ndjson、.jsonl
+@app.route('/api/import-jobs', methods=['POST'])
+@jwt_required()
+def submit_import_job():
+    current_user_id = get_jwt_identity()
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'message': 'File is required'}), 400
+
+    extension = os.path.splitext(upload.filename or '')[1].lower()
+    file_format = request.form.get('format') or extension.lstrip('.') or 'csv'
+    if file_format == 'jsonl':
+        file_format = 'ndjson'
+
+    success, result = import_jobs.submit(
+        current_user_id, upload.stream, upload.filename, file_format,
+        on_duplicate=request.form.get('on_duplicate', 'skip')
+    )
+    if not success:
+        return jsonify({'success': False, 'message': result}), 400
+
+    return jsonify({'success': True, 'data': result.to_dict()}), 202
+
+# 查询导入任务进度（需要登录）
+@app.route('/api/import-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_import_job(job_id):
+    current_user_id = get_jwt_identity()
+    job = ImportJobWorker.get(job_id, current_user_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+
+    return jsonify({'success': True, 'data': job.to_dict()})
+
+# 获取备份列表（需要登录，分页）
+@app.route('/api/backups', methods=['GET'])
+@jwt_required()
+def list_backups():
+    current_user_id = get_jwt_identity()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    return jsonify({'success': True, 'data': BackupManager.list_backups(current_user_id, page, per_page)})
+
+# 提交备份任务（需要登录），立即返回，后台执行
+@app.route('/api/backups', methods=['POST'])
+@jwt_required()
+def submit_backup():
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    success, result = backup_scheduler.enqueue(current_user_id, data.get('backup_type', 'full'))
+    if not success:
+        return jsonify({'success': False, 'message': result}), 400
+
+    return jsonify({'success': True, 'data': result.to_dict()}), 202
+
+# 查询备份任务状态（需要登录）
+@app.route('/api/backups/<int:backup_id>', methods=['GET'])
+@jwt_required()
+def get_backup(backup_id):
+    current_user_id = get_jwt_identity()
+    backup = BackupScheduler.get(backup_id, current_user_id)
+    if not backup:
+        return jsonify({'success': False, 'message': 'Backup not found'}), 404
+
+    return jsonify({'success': True, 'data': backup.to_dict()})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,10 +1,11 @@
 from flask import jsonify, request
 from flask_jwt_extended import (
     JWTManager, create_access_token, create_refresh_token,
-    jwt_required, get_jwt_identity, get_jwt,
+    jwt_required, get_jwt_identity, get_jwt, get_current_user,
     verify_jwt_in_request, decode_token
 )
 from datetime import datetime, timedelta
+from functools import wraps
 import pytz
 from models import User, LoginHistory
 from database import db
@@ -29,7 +30,8 @@ def init_auth(app):
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         identity = jwt_data["sub"]
-        return User.query.filter_by(uuid=identity).one_or_none()
+        # Tokens of deleted accounts stop working at once
+        return User.query.filter_by(uuid=identity, deleted_at=None).one_or_none()
     
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -65,6 +67,21 @@ def init_auth(app):
     
     return jwt
 
+def admin_required(fn):
+    """Like jwt_required, but only for admin users"""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        user = get_current_user()
+        if not user or not user.is_admin:
+            return jsonify({
+                'success': False,
+                'message': 'Admin access required',
+                'error': 'admin_required'
+            }), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
 def log_login_attempt(user, success=True, failure_reason=None):
     """Log login attempt to database"""
     try:
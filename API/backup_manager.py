@@ -1,147 +1,799 @@
 import os
+import re
 import json
+import hashlib
 import zipfile
-import shutil
-from datetime import datetime
+import threading
+from itertools import islice
+from datetime import datetime, timedelta
 from pathlib import Path
-import boto3
-from google.cloud import storage
-import psycopg2
-from sqlalchemy import create_engine
-import pandas as pd
+from sqlalchemy import select, update, insert, delete, bindparam
+from models import db, User, Saying, Backup, BackupChunk, BackupChunkRef, SayingTombstone
+from chunk_store import ChunkStore, ChunkedBackupWriter, iter_entry
+from cloud_upload import CloudUploader, S3Target, GCSTarget
+from sharding import shards
+
+BACKUP_FORMAT_VERSION = 3
+
+# Saying columns written to and restored from backups
+SAYING_FIELDS = ['uuid', 'content', 'author', 'category', 'tags', 'language', 'source',
+                 'rating', 'view_count', 'is_public', 'created_at', 'updated_at']
+
+# Backups kept in the chunk store are a manifest file next to the zips
+MANIFEST_SUFFIX = '.manifest.json'
+
+RESTORE_MODES = ('merge', 'replace')
+
+# backup_<user id>_<local timestamp>_<type>, as named by BackupManager.backup_filename
+BACKUP_NAME = re.compile(r'^backup_(\d+)_(\d{8}_\d{6})_(full|incremental)(\.zip|\.manifest\.json)$')
+
+class BackupArchiveWriter:
+    """Writes a backup zip in a single pass.
+    
+    Entries are streamed straight into the archive and checksummed as they
+    are written; the manifest, which lists every entry's size and sha256,
+    is the last entry. Nothing is staged on disk or held in memory whole.
+    """
+    
+    def __init__(self, path, compresslevel=6):
+        self.path = Path(path)
+        self.entries = {}  # name -> {'size', 'sha256', 'records'}
+        self._zip = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._zip.close()
+        if exc_type is not None and self.path.exists():
+            self.path.unlink()
+    
+    def write_lines(self, name, items, batch_size=1000):
+        """Write items as NDJSON to entry name; returns the number written"""
+        digest = hashlib.sha256()
+        size = 0
+        count = 0
+        with self._zip.open(name, 'w', force_zip64=True) as entry:
+            batch = []
+            for item in items:
+                batch.append(json.dumps(item, ensure_ascii=False))
+                count += 1
+                if len(batch) >= batch_size:
+                    size += self._write(entry, digest, batch)
+                    batch = []
+            if batch:
+                size += self._write(entry, digest, batch)
+        
+        self.entries[name] = {'size': size, 'sha256': digest.hexdigest(), 'records': count}
+        return count
+    
+    def write_json(self, name, data):
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        self._zip.writestr(name, payload)
+        self.entries[name] = {'size': len(payload), 'sha256': hashlib.sha256(payload).hexdigest()}
+    
+    def write_manifest(self, manifest):
+        """Write manifest.json, which must be the last entry"""
+        self.write_json('manifest.json', dict(manifest, files=dict(self.entries)))
+    
+    @staticmethod
+    def _write(entry, digest, lines):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        digest.update(data)
+        entry.write(data)
+        return len(data)
 
 class BackupManager:
+    # Users with a restore in progress in this process
+    _restoring = set()
+    _restoring_lock = threading.Lock()
+    
     def __init__(self, app):
         self.app = app
         self.backup_dir = Path(app.config.get('BACKUP_DIR', './backups'))
         self.backup_dir.mkdir(exist_ok=True)
         
-        # Cloud storage clients
-        self.s3_client = None
-        self.gcs_client = None
+        # 'archive' writes one zip per backup; 'chunks' deduplicates backups
+        # through the content-addressed chunk store under backup_dir/chunks
+        self.storage = app.config.get('BACKUP_STORAGE', 'archive')
+        self._chunk_store = None
         
-        if app.config.get('AWS_ACCESS_KEY'):
-            self.s3_client = boto3.client(
+        # Cloud storage clients are created on first use; boto3 and
+        # google-cloud-storage are optional and expensive to import
+        self._s3_client = None
+        self._gcs_client = None
+    
+    @property
+    def chunk_store(self):
+        if self._chunk_store is None:
+            self._chunk_store = ChunkStore(self.backup_dir / 'chunks')
+        return self._chunk_store
+    
+    @property
+    def s3_client(self):
+        """S3 client, or None if AWS is not configured or boto3 is missing"""
+        if self._s3_client is None and self.app.config.get('AWS_ACCESS_KEY'):
+            try:
+                import boto3
+            except ImportError:
+                self.app.logger.warning("AWS_ACCESS_KEY is set but boto3 is not installed")
+                return None
+            
+            self._s3_client = boto3.client(
                 's3',
-                aws_access_key_id=app.config['AWS_ACCESS_KEY'],
-                aws_secret_access_key=app.config['AWS_SECRET_KEY']
+                aws_access_key_id=self.app.config['AWS_ACCESS_KEY'],
+                aws_secret_access_key=self.app.config['AWS_SECRET_KEY']
             )
-        
-        if app.config.get('GOOGLE_APPLICATION_CREDENTIALS'):
-            self.gcs_client = storage.Client()
+        return self._s3_client
+    
+    @property
+    def gcs_client(self):
+        """GCS client, or None if GCP is not configured or the SDK is missing"""
+        if self._gcs_client is None and self.app.config.get('GOOGLE_APPLICATION_CREDENTIALS'):
+            try:
+                from google.cloud import storage
+            except ImportError:
+                self.app.logger.warning(
+                    "GOOGLE_APPLICATION_CREDENTIALS is set but google-cloud-storage is not installed"
+                )
+                return None
+            
+            self._gcs_client = storage.Client()
+        return self._gcs_client
     
-    def create_backup(self, user_id, backup_type='full'):
-        """Create a backup for user"""
+    def backup_filename(self, user_id, backup_type):
+        """File name for a new backup of user in the configured storage"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_name = f"backup_{user_id}_{timestamp}_{backup_type}"
-        backup_path = self.backup_dir / backup_name
+        suffix = MANIFEST_SUFFIX if self.storage == 'chunks' else '.zip'
+        return f"backup_{user_id}_{timestamp}_{backup_type}{suffix}"
+    
+    def create_backup(self, user_id, backup_type='full', backup=None):
+        """Create a backup for user.
+        
+        An incremental backup holds only the sayings changed and deleted
+        since the user's previous backup (its watermark) and chains to it;
+        without a previous backup it falls back to a full one.
+        
+        backup is the queued Backup row to complete, when run by the
+        BackupScheduler; it is written to the file named in the row and
+        marked completed or failed either way.
+        """
+        parent = None
+        if backup_type == 'incremental':
+            parent = self._latest_backup(user_id)
+            if parent is None:
+                backup_type = 'full'
+        
+        # A queued backup's file name was fixed by the scheduler
+        if backup is not None and BACKUP_NAME.match(backup.filename or ''):
+            filename = backup.filename
+        else:
+            filename = self.backup_filename(user_id, backup_type)
+        backup_path = self.backup_dir / filename
+        chunked = filename.endswith(MANIFEST_SUFFIX)
+        if chunked:
+            backup_name = filename[:-len(MANIFEST_SUFFIX)]
+            writer = ChunkedBackupWriter(self.chunk_store, backup_path)
+        else:
+            backup_name = backup_path.stem
+            writer = BackupArchiveWriter(backup_path)
+        
+        # Changes committed with an updated_at just before the previous
+        # watermark may have been invisible to it; re-export an overlap
+        # window, restores are idempotent upserts
+        watermark = datetime.utcnow()
+        since = None
+        if parent:
+            since = parent.watermark - timedelta(seconds=self.app.config.get('BACKUP_WATERMARK_OVERLAP', 300))
         
         try:
-            # Create backup directory
-            backup_path.mkdir()
-            
-            # 1. Backup database data
-            self._backup_database(user_id, backup_path)
-            
-            # 2. Backup files (if any)
-            self._backup_files(user_id, backup_path)
-            
-            # 3. Create manifest
-            self._create_manifest(user_id, backup_path, backup_type)
+            # 1-3. Stream database data, files and finally the manifest into the archive
+            with writer as archive:
+                counts = self._backup_database(user_id, archive, since)
+                
+                self._backup_files(user_id, archive)
+                
+                chain = [ancestor.filename for ancestor in self._chain(parent)] if parent else []
+                archive.write_manifest({
+                    'version': BACKUP_FORMAT_VERSION,
+                    'user_id': user_id,
+                    'backup_type': backup_type,
+                    'created_at': datetime.utcnow().isoformat(),
+                    'watermark': watermark.isoformat(),
+                    'since': since.isoformat() if since else None,
+                    'parent': parent.filename if parent else None,
+                    'chain': chain,
+                    **counts
+                })
             
-            # 4. Create zip archive
-            zip_path = self.backup_dir / f"{backup_name}.zip"
-            self._create_zip(backup_path, zip_path)
+            # 4. Upload to cloud (optional); only chunks new to the store
+            # need mirroring, the others were uploaded with earlier backups.
+            # The manifest goes last so it never references missing chunks
+            locations = ['local']
+            uploader = self._uploader()
+            if uploader:
+                chunks = [(self.chunk_store.path(digest), f'chunks/{digest}') for digest in getattr(archive, 'new_chunks', [])]
+                if chunks:
+                    uploader.upload(chunks)
+                uploader.upload([(backup_path, backup_path.name)])
+                locations += [target.name for target in uploader.targets]
             
-            # 5. Cleanup
-            shutil.rmtree(backup_path)
+            file_size = backup_path.stat().st_size
+            if chunked:
+                file_size += sum(archive.chunks.values())
             
-            # 6. Upload to cloud (optional)
-            if self.s3_client and self.app.config.get('S3_BACKUP_BUCKET'):
-                self._upload_to_s3(zip_path)
-            
-            if self.gcs_client and self.app.config.get('GCS_BACKUP_BUCKET'):
-                self._upload_to_gcs(zip_path)
+            if backup is None:
+                backup = Backup(user_id=user_id)
+                db.session.add(backup)
+            backup.filename = backup_path.name
+            backup.file_path = str(backup_path)
+            backup.file_size = file_size
+            backup.backup_type = backup_type
+            backup.status = 'completed'
+            backup.watermark = watermark
+            backup.parent_id = parent.id if parent else None
+            backup.checksum = self._file_checksum(backup_path)
+            backup.locations = locations
+            backup.completed_at = datetime.utcnow()
+            if chunked:
+                db.session.flush()
+                self._add_chunk_refs(backup.id, archive.chunks)
+            db.session.commit()
             
             return True, {
                 'backup_name': backup_name,
-                'file_path': str(zip_path),
-                'file_size': zip_path.stat().st_size,
-                'created_at': datetime.now().isoformat()
+                'backup_type': backup_type,
+                'parent': parent.filename if parent else None,
+                'file_path': str(backup_path),
+                'file_size': backup.file_size,
+                'created_at': datetime.now().isoformat(),
+                **counts
             }
             
         except Exception as e:
+            db.session.rollback()
+            if backup is not None:
+                backup.status = 'failed'
+                backup.error_message = str(e)
+                backup.completed_at = datetime.utcnow()
+                db.session.commit()
             return False, f"Backup failed: {str(e)}"
     
-    def _backup_database(self, user_id, backup_path):
-        """Export user data from database"""
-        # Export sayings
-        sayings_data = self._export_user_sayings(user_id)
+    def _uploader(self):
+        """CloudUploader for the configured buckets, or None without any"""
+        config = self.app.config
+        part_size = config.get('BACKUP_UPLOAD_PART_SIZE', 8 << 20)
+        targets = []
+        if config.get('S3_BACKUP_BUCKET') and self.s3_client:
+            targets.append(S3Target(self.s3_client, config['S3_BACKUP_BUCKET'], part_size,
+                                    bandwidth=config.get('S3_UPLOAD_BANDWIDTH')))
+        
+        if config.get('GCS_BACKUP_BUCKET') and self.gcs_client:
+            targets.append(GCSTarget(self.gcs_client, config['GCS_BACKUP_BUCKET'], part_size,
+                                     bandwidth=config.get('GCS_UPLOAD_BANDWIDTH')))
+        
+        if not targets:
+            return None
+        return CloudUploader(
+            targets,
+            workers=config.get('BACKUP_UPLOAD_WORKERS', 8),
+            retries=config.get('BACKUP_UPLOAD_RETRIES', 5),
+            logger=self.app.logger
+        )
+    
+    def _delete_remote(self, key):
+        if self.app.config.get('S3_BACKUP_BUCKET') and self.s3_client:
+            self.s3_client.delete_object(Bucket=self.app.config['S3_BACKUP_BUCKET'], Key=key)
+        
+        if self.app.config.get('GCS_BACKUP_BUCKET') and self.gcs_client:
+            blob = self.gcs_client.bucket(self.app.config['GCS_BACKUP_BUCKET']).blob(key)
+            if blob.exists():
+                blob.delete()
+    
+    @staticmethod
+    def _add_chunk_refs(backup_id, chunks, batch_size=500):
+        """Count one more reference to each chunk (digest -> stored size) and record it as backup's"""
+        table = BackupChunk.__table__
+        digests = list(chunks)
+        for start in range(0, len(digests), batch_size):
+            batch = digests[start:start + batch_size]
+            db.session.execute(insert(BackupChunkRef.__table__), [
+                {'backup_id': backup_id, 'digest': digest} for digest in batch
+            ])
+            existing = set(db.session.execute(
+                select(table.c.digest).where(table.c.digest.in_(batch))
+            ).scalars())
+            if existing:
+                db.session.execute(
+                    update(table)
+                    .where(table.c.digest == bindparam('b_digest'))
+                    .values(ref_count=table.c.ref_count + 1),
+                    [{'b_digest': digest} for digest in existing]
+                )
+            inserts = [
+                {'digest': digest, 'size': chunks[digest], 'ref_count': 1, 'created_at': datetime.utcnow()}
+                for digest in batch if digest not in existing
+            ]
+            if inserts:
+                db.session.execute(insert(table), inserts)
+    
+    @staticmethod
+    def _release_chunk_refs(digests, batch_size=500):
+        """Drop one reference to each chunk; unreferenced ones await collect_garbage"""
+        table = BackupChunk.__table__
+        digests = list(digests)
+        for start in range(0, len(digests), batch_size):
+            db.session.execute(
+                update(table)
+                .where(table.c.digest.in_(digests[start:start + batch_size]))
+                .values(ref_count=table.c.ref_count - 1)
+            )
+    
+    def delete_backup(self, backup):
+        """Delete a backup and release its chunks.
+        
+        Backups that later incrementals build on cannot be deleted before
+        those incrementals.
+        """
+        if Backup.query.filter_by(parent_id=backup.id).first():
+            return False, "Backup has dependent incremental backups"
+        
+        # Failed backups may never have been written
+        path = Path(backup.file_path) if backup.file_path else None
+        refs = BackupChunkRef.__table__
+        digests = set(db.session.execute(select(refs.c.digest).where(refs.c.backup_id == backup.id)).scalars())
+        if digests:
+            db.session.execute(delete(refs).where(refs.c.backup_id == backup.id))
+        elif path and backup.filename.endswith(MANIFEST_SUFFIX) and path.exists():
+            # Made before references were recorded per backup
+            manifest = self._read_manifest(path)
+            digests = {digest for entry in manifest['files'].values() for digest in entry['chunks']}
+        self._release_chunk_refs(digests)
+        
+        db.session.delete(backup)
+        db.session.commit()
+        if path and path.exists():
+            path.unlink()
+        if set(backup.locations or ()) - {'local'}:
+            self._delete_remote(backup.filename)
+        return True, "Backup deleted"
+    
+    def apply_retention(self, retention_days=None, user_id=None):
+        """Delete backups older than BACKUP_RETENTION_DAYS, then collect garbage.
+        
+        Expired backups that a retained incremental still chains to are kept.
+        """
+        retention_days = retention_days or self.app.config.get('BACKUP_RETENTION_DAYS', 30)
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        
+        query = Backup.query
+        if user_id is not None:
+            query = query.filter(Backup.user_id == user_id)
+        
+        needed = set()
+        for backup in query.filter(Backup.created_at >= cutoff):
+            needed.update(ancestor.id for ancestor in self._chain(backup))
+        
+        deleted = 0
+        # Newest first, so incrementals go before the backups they build on
+        for backup in query.filter(Backup.created_at < cutoff).order_by(Backup.id.desc()).all():
+            if backup.id not in needed:
+                success, _ = self.delete_backup(backup)
+                deleted += success
+        
+        return deleted, self.collect_garbage()
+    
+    def collect_garbage(self, grace_seconds=None):
+        """Remove chunks no backup references; returns the number removed.
+        
+        A chunk is only removed once its file has been untouched for the
+        grace period: a backup being written re-touches every existing chunk
+        it reuses before its references are committed. Files without any
+        row (left by backups that failed) are swept the same way.
+        """
+        if self._chunk_store is None and not (self.backup_dir / 'chunks').exists():
+            return 0
+        
+        grace = grace_seconds if grace_seconds is not None else self.app.config.get('BACKUP_CHUNK_GRACE_SECONDS', 3600)
+        cutoff = datetime.now().timestamp() - grace
+        store = self.chunk_store
+        table = BackupChunk.__table__
+        
+        def expired(digest):
+            path = store.path(digest)
+            return not path.exists() or path.stat().st_mtime < cutoff
+        
+        unreferenced = db.session.execute(select(table.c.digest).where(table.c.ref_count <= 0)).scalars().all()
+        known = set(db.session.execute(select(table.c.digest)).scalars())
+        candidates = [digest for digest in unreferenced if expired(digest)]
+        candidates += [digest for digest in store.iter_digests() if digest not in known and expired(digest)]
+        
+        removed = 0
+        for digest in candidates:
+            # Re-check the count; a concurrent backup may have taken a reference
+            deleted = db.session.execute(
+                delete(table).where(table.c.digest == digest, table.c.ref_count <= 0)
+            ).rowcount
+            db.session.commit()
+            if deleted or digest not in known:
+                store.delete(digest)
+                self._delete_remote(f'chunks/{digest}')
+                removed += 1
+        return removed
+    
+    def _latest_backup(self, user_id):
+        """Most recent completed backup with a watermark, or None"""
+        return Backup.query.filter(
+            Backup.user_id == user_id,
+            Backup.status == 'completed',
+            Backup.watermark.isnot(None)
+        ).order_by(Backup.watermark.desc(), Backup.id.desc()).first()
+    
+    @staticmethod
+    def _chain(backup):
+        """Backups from the base full backup up to and including backup"""
+        chain = []
+        while backup is not None:
+            chain.append(backup)
+            backup = backup.parent
+        return chain[::-1]
+    
+    def _backup_database(self, user_id, archive, since=None):
+        """Stream user data from database into the archive"""
+        with shards.for_user(user_id):
+            # Export sayings
+            saying_count = archive.write_lines('sayings.ndjson', self._export_user_sayings(user_id, since))
+            
+            # Export deletions since the previous backup
+            tombstones = self._export_tombstones(user_id, since) if since else ()
+            tombstone_count = archive.write_lines('tombstones.ndjson', tombstones)
         
         # Export user settings
-        settings_data = self._export_user_settings(user_id)
+        archive.write_json('settings.json', self._export_user_settings(user_id))
         
-        # Save to JSON files
-        with open(backup_path / 'sayings.json', 'w', encoding='utf-8') as f:
-            json.dump(sayings_data, f, indent=2, ensure_ascii=False)
+        return {'saying_count': saying_count, 'tombstone_count': tombstone_count}
+    
+    @staticmethod
+    def _export_user_sayings(user_id, since=None, batch_size=1000):
+        """Yield user's sayings, or only those updated after since"""
+        query = Saying.query.filter(Saying.user_id == user_id)
+        if since:
+            query = query.filter(Saying.updated_at > since)
         
-        with open(backup_path / 'settings.json', 'w', encoding='utf-8') as f:
-            json.dump(settings_data, f, indent=2, ensure_ascii=False)
+        for saying in query.order_by(Saying.id).yield_per(batch_size):
+            item = saying.to_dict()
+            yield {field: item[field] for field in SAYING_FIELDS}
+    
+    @staticmethod
+    def _export_tombstones(user_id, since):
+        """Yield uuids of user's sayings deleted after since"""
+        rows = db.session.execute(
+            select(SayingTombstone.saying_uuid, SayingTombstone.deleted_at)
+            .where(SayingTombstone.user_id == user_id, SayingTombstone.deleted_at > since)
+            .order_by(SayingTombstone.id)
+            .execution_options(yield_per=1000)
+        )
+        for saying_uuid, deleted_at in rows:
+            yield {'uuid': saying_uuid, 'deleted_at': deleted_at.isoformat()}
     
-    def restore_backup(self, user_id, backup_file):
-        """Restore from backup file"""
+    @staticmethod
+    def _export_user_settings(user_id):
+        user = db.session.get(User, user_id)
+        if user is None:
+            raise ValueError(f"User {user_id} not found")
+        return {key: value for key, value in user.to_dict().items() if key not in ('id', 'uuid')}
+    
+    def _backup_files(self, user_id, archive):
+        """Users have no stored files yet; kept as the extension point"""
+    
+    def restore_backup(self, user_id, backup_file, mode='merge'):
+        """Restore from backup file.
+        
+        merge upserts the backup's sayings by uuid and keeps the user's
+        other sayings; replace deletes all of the user's sayings first.
+        For an incremental backup the base full backup and every backup in
+        between (listed in its manifest) are replayed first, from the
+        backup directory.
+        
+        Entries are streamed straight from the archives and written in
+        transactions of BACKUP_RESTORE_CHUNK_SIZE rows, so memory stays
+        bounded. A restore that fails part way can be run again.
+        """
+        if mode not in RESTORE_MODES:
+            return False, f"Unsupported restore mode: {mode}"
+        
+        with self._restoring_lock:
+            if user_id in self._restoring:
+                return False, "A restore is already running for this user"
+            self._restoring.add(user_id)
+        
         try:
-            # Extract backup
-            extract_path = self.backup_dir / 'temp_restore'
-            extract_path.mkdir(exist_ok=True)
+            manifest = self._read_manifest(backup_file)
             
-            with zipfile.ZipFile(backup_file, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
+            archives = [self.backup_dir / name for name in manifest.get('chain', [])]
+            missing = [path.name for path in archives if not path.exists()]
+            if missing:
+                raise ValueError(f"Backup chain incomplete, missing: {', '.join(missing)}")
             
-            # Read manifest
-            manifest_path = extract_path / 'manifest.json'
-            if not manifest_path.exists():
-                raise ValueError("Invalid backup: manifest not found")
+            chunk_size = self.app.config.get('BACKUP_RESTORE_CHUNK_SIZE', 5000)
+            counts = {'saying_count': 0, 'tombstone_count': 0}
             
-            with open(manifest_path, 'r', encoding='utf-8') as f:
-                manifest = json.load(f)
+            with shards.for_user(user_id):
+                if mode == 'replace':
+                    self._delete_user_sayings(user_id, chunk_size)
+                
+                for index, archive in enumerate(archives + [Path(backup_file)]):
+                    # After a replace the table holds nothing of the user's
+                    # until the base backup is in; skip the existence checks
+                    upsert = mode == 'merge' or index > 0
+                    restored = self._restore_database(user_id, archive, upsert, chunk_size)
+                    for key in counts:
+                        counts[key] += restored[key]
+                    
+                    self._restore_files(user_id, archive)
             
-            # Restore database data
-            self._restore_database(user_id, extract_path)
+            return True, counts
             
-            # Restore files
-            self._restore_files(user_id, extract_path)
+        except Exception as e:
+            db.session.rollback()
+            return False, f"Restore failed: {str(e)}"
+        finally:
+            with self._restoring_lock:
+                self._restoring.discard(user_id)
+    
+    @staticmethod
+    def _read_manifest(backup_file):
+        if str(backup_file).endswith(MANIFEST_SUFFIX):
+            with open(backup_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        
+        with zipfile.ZipFile(backup_file, 'r') as zip_ref:
+            if 'manifest.json' not in zip_ref.namelist():
+                raise ValueError("Invalid backup: manifest not found")
+            return json.loads(zip_ref.read('manifest.json'))
+    
+    def _iter_records(self, backup_file, name):
+        """Stream the records of an NDJSON entry (format 3) or JSON list entry (format 2)"""
+        if str(backup_file).endswith(MANIFEST_SUFFIX):
+            entry = self._read_manifest(backup_file)['files'].get(f'{name}.ndjson')
+            if entry is None:
+                return
+            # Chunks always end on a line boundary
+            for data in iter_entry(self.chunk_store, entry):
+                for line in data.splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+            return
+        
+        with zipfile.ZipFile(backup_file, 'r') as zip_ref:
+            names = set(zip_ref.namelist())
+            if f'{name}.ndjson' in names:
+                with zip_ref.open(f'{name}.ndjson') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+            elif f'{name}.json' in names:
+                # Format 2 wrote entries as one JSON list; it can only be read whole
+                with zip_ref.open(f'{name}.json') as f:
+                    yield from json.load(f)
+    
+    @staticmethod
+    def _batches(items, size):
+        items = iter(items)
+        while True:
+            batch = list(islice(items, size))
+            if not batch:
+                return
+            yield batch
+    
+    @staticmethod
+    def _delete_sayings(user_id, rows):
+        """Delete (id, uuid) rows of user's sayings, leaving the tombstones the ORM delete would"""
+        if not rows:
+            return
+        deleted_at = datetime.utcnow()
+        db.session.execute(insert(SayingTombstone.__table__), [
+            {'user_id': user_id, 'saying_uuid': row.uuid, 'deleted_at': deleted_at} for row in rows
+        ])
+        db.session.execute(delete(Saying.__table__).where(Saying.__table__.c.id.in_([row.id for row in rows])))
+    
+    def _delete_user_sayings(self, user_id, chunk_size):
+        table = Saying.__table__
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, table.c.uuid).where(table.c.user_id == user_id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            self._delete_sayings(user_id, rows)
+            db.session.commit()
+    
+    def _restore_database(self, user_id, backup_file, upsert=True, chunk_size=5000):
+        """Write one archive's sayings and apply its tombstones, a transaction per chunk"""
+        table = Saying.__table__
+        tombstones = SayingTombstone.__table__
+        saying_count = 0
+        # Restored sayings count as changed now, or the next incremental
+        # backup would skip them and its chain would replay stale versions
+        restored_at = datetime.utcnow()
+        for items in self._batches(self._iter_records(backup_file, 'sayings'), chunk_size):
+            rows = [self._saying_row(item, user_id) for item in items]
+            for row in rows:
+                row['updated_at'] = restored_at
+            existing = set()
+            if upsert:
+                existing = set(db.session.execute(
+                    select(table.c.uuid).where(table.c.user_id == user_id, table.c.uuid.in_([row['uuid'] for row in rows]))
+                ).scalars())
             
-            # Cleanup
-            shutil.rmtree(extract_path)
+            # Bind names must differ from column names in an UPDATE
+            updates = [{f'b_{name}': value for name, value in row.items()} for row in rows if row['uuid'] in existing]
+            if updates:
+                db.session.execute(
+                    update(table)
+                    .where(table.c.user_id == bindparam('b_user_id'), table.c.uuid == bindparam('b_uuid'))
+                    .values({name: bindparam(f'b_{name}') for name in SAYING_FIELDS[1:] + ['content_hash']}),
+                    updates
+                )
             
-            return True, "Backup restored successfully"
+            inserts = self._new_contents(user_id, [row for row in rows if row['uuid'] not in existing], upsert)
+            if inserts:
+                db.session.execute(insert(table), inserts)
+                # Restored sayings are no longer deleted; a later incremental
+                # backup must not replay their tombstones after them
+                db.session.execute(delete(tombstones).where(
+                    tombstones.c.user_id == user_id,
+                    tombstones.c.saying_uuid.in_([row['uuid'] for row in inserts])
+                ))
             
-        except Exception as e:
-            return False, f"Restore failed: {str(e)}"
+            db.session.commit()
+            saying_count += len(rows)
+        
+        tombstone_count = 0
+        for items in self._batches(self._iter_records(backup_file, 'tombstones'), chunk_size):
+            uuids = [item['uuid'] for item in items]
+            self._delete_sayings(user_id, db.session.execute(
+                select(table.c.id, table.c.uuid).where(table.c.user_id == user_id, table.c.uuid.in_(uuids))
+            ).all())
+            db.session.commit()
+            tombstone_count += len(uuids)
+        
+        return {'saying_count': saying_count, 'tombstone_count': tombstone_count}
+    
+    @staticmethod
+    def _new_contents(user_id, rows, check_existing=True):
+        """rows without those whose content the user already has; sayings are unique by content_hash"""
+        taken = set()
+        if check_existing and rows:
+            taken = set(db.session.execute(
+                select(Saying.content_hash).where(
+                    Saying.user_id == user_id, Saying.content_hash.in_({row['content_hash'] for row in rows})
+                )
+            ).scalars())
+        kept = []
+        for row in rows:
+            if row['content_hash'] not in taken:
+                taken.add(row['content_hash'])
+                kept.append(row)
+        return kept
+    
+    @staticmethod
+    def _saying_row(item, user_id):
+        row = {field: item.get(field) for field in SAYING_FIELDS}
+        for field in ('created_at', 'updated_at'):
+            row[field] = datetime.fromisoformat(row[field]) if row[field] else None
+        row['content_hash'] = Saying.hash_content(row['content'])
+        row['user_id'] = user_id
+        return row
     
-    def list_backups(self, user_id):
-        """List available backups for user"""
-        backups = []
-        
-        # List local backups
-        for backup_file in self.backup_dir.glob(f"*_{user_id}_*.zip"):
-            stats = backup_file.stat()
-            backups.append({
-                'name': backup_file.name,
-                'path': str(backup_file),
-                'size': stats.st_size,
-                'created': datetime.fromtimestamp(stats.st_ctime).isoformat(),
-                'type': 'local'
-            })
-        
-        # List cloud backups
-        if self.s3_client:
-            s3_backups = self._list_s3_backups(user_id)
-            backups.extend(s3_backups)
-        
-        if self.gcs_client:
-            gcs_backups = self._list_gcs_backups(user_id)
-            backups.extend(gcs_backups)
-        
-        return sorted(backups, key=lambda x: x['created'], reverse=True)
\ No newline at end of file
+    def _restore_files(self, user_id, backup_file):
+        """Users have no stored files yet; kept as the extension point"""
+    
+    @staticmethod
+    def list_backups(user_id, page=1, per_page=20):
+        """One page of user's backups from the catalog, newest first"""
+        backups = Backup.query.filter(Backup.user_id == user_id).order_by(
+            Backup.created_at.desc(), Backup.id.desc()
+        ).offset((page - 1) * per_page).limit(per_page + 1).all()
+        
+        return {
+            'backups': [backup.to_dict() for backup in backups[:per_page]],
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(backups) > per_page
+        }
+    
+    @staticmethod
+    def _file_checksum(path, buffer_size=1 << 20):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(buffer_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def reconcile(self):
+        """Sync the catalog with the backup directory and cloud buckets.
+        
+        Updates each backup's locations, marks backups found nowhere as
+        missing, and catalogs backups present in storage but not in the
+        table. Files of queued, running and failed backups are left to
+        their rows. Returns counts of each.
+        """
+        found = {}  # filename -> {location: size}
+        for pattern in ('backup_*.zip', f'backup_*{MANIFEST_SUFFIX}'):
+            for path in self.backup_dir.glob(pattern):
+                found.setdefault(path.name, {})['local'] = path.stat().st_size
+        for location, name, size in self._list_remote():
+            found.setdefault(name, {})[location] = size
+        
+        now = datetime.utcnow()
+        stats = {'updated': 0, 'missing': 0, 'added': 0}
+        # Listed after storage, so a backup finishing meanwhile is seen
+        # either as completed or as still owning its file
+        for backup in Backup.query.all():
+            locations = sorted(found.pop(backup.filename, {}))
+            if backup.status not in ('completed', 'missing'):
+                continue
+            status = 'completed' if locations else 'missing'
+            if locations != sorted(backup.locations or ()) or status != backup.status:
+                stats['missing' if status == 'missing' else 'updated'] += 1
+            backup.locations = locations
+            backup.status = status
+            backup.verified_at = now
+        
+        for name, sizes in found.items():
+            backup = self._catalog_entry(name, sizes)
+            if backup is not None:
+                backup.verified_at = now
+                db.session.add(backup)
+                stats['added'] += 1
+        
+        db.session.commit()
+        return stats
+    
+    def _catalog_entry(self, name, sizes):
+        """Backup row for a file found in storage, or None if it is not a backup"""
+        match = BACKUP_NAME.match(name)
+        if not match or db.session.get(User, int(match.group(1))) is None:
+            return None
+        
+        backup = Backup(
+            user_id=int(match.group(1)),
+            filename=name,
+            backup_type=match.group(3),
+            created_at=datetime.strptime(match.group(2), '%Y%m%d_%H%M%S'),
+            status='completed',
+            locations=sorted(sizes),
+            file_size=next(iter(sizes.values()))
+        )
+        path = self.backup_dir / name
+        if 'local' in sizes:
+            backup.file_path = str(path)
+            backup.checksum = self._file_checksum(path)
+            try:
+                manifest = self._read_manifest(path)
+            except (ValueError, zipfile.BadZipFile) as e:
+                # Cataloged so it shows up, but never offered for restore
+                backup.status = 'failed'
+                backup.error_message = f"Unreadable backup file: {e}"
+                return backup
+            backup.backup_type = manifest.get('backup_type', backup.backup_type)
+            if manifest.get('watermark'):
+                backup.watermark = datetime.fromisoformat(manifest['watermark'])
+            if manifest.get('parent'):
+                parent = Backup.query.filter_by(filename=manifest['parent']).first()
+                backup.parent_id = parent.id if parent else None
+        return backup
+    
+    def _list_remote(self):
+        """Yield (location, name, size) for backups in the configured buckets"""
+        config = self.app.config
+        if config.get('S3_BACKUP_BUCKET') and self.s3_client:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=config['S3_BACKUP_BUCKET'], Prefix='backup_'):
+                for item in page.get('Contents', []):
+                    yield 's3', item['Key'], item['Size']
+        
+        if config.get('GCS_BACKUP_BUCKET') and self.gcs_client:
+            for blob in self.gcs_client.list_blobs(config['GCS_BACKUP_BUCKET'], prefix='backup_'):
+                yield 'gcs', blob.name, blob.size
\ No newline at end of file
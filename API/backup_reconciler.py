@@ -0,0 +1,47 @@
+import atexit
+import threading
+from models import db
+
+class BackupReconciler:
+    """Periodically syncs the backup catalog with local and cloud storage.
+
+    Listings are served from the backups table alone; this thread keeps it
+    honest every BACKUP_RECONCILE_INTERVAL seconds, picking up backups
+    copied in or deleted out of band.
+    """
+
+    def __init__(self, app, manager, interval=None):
+        self.app = app
+        self.manager = manager
+        self.interval = interval or app.config.get('BACKUP_RECONCILE_INTERVAL', 3600)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background reconcile thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='backup-reconciler', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    stats = self.manager.reconcile()
+                if any(stats.values()):
+                    self.app.logger.info(f"Backup catalog reconciled: {stats}")
+            except Exception:
+                with self.app.app_context():
+                    db.session.rollback()
+                self.app.logger.exception("Failed to reconcile backup catalog")
+
+            self._stop.wait(self.interval)
@@ -0,0 +1,255 @@
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from models import db, Backup, Saying, User
+from sharding import shards
+
+BACKUP_TYPES = ('full', 'incremental')
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields take *, numbers, a-b ranges, comma lists and /step; day-of-week
+    counts from 0 (or 7) for Sunday.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)
+        )
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            item, _, step = item.partition('/')
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def matches(self, moment):
+        weekday = (moment.weekday() + 1) % 7
+        day = moment.day in self.days
+        weekday = weekday in self.weekdays
+        # As in cron, a restricted day-of-month and day-of-week match either way
+        if self._any_day or self._any_weekday:
+            day_matches = day and weekday
+        else:
+            day_matches = day or weekday
+        return (moment.minute in self.minutes and moment.hour in self.hours
+                and moment.month in self.months and day_matches)
+
+class BackupScheduler:
+    """Runs backups on a bounded worker pool instead of in the request.
+
+    enqueue() records a pending Backup row and returns at once. A dispatcher
+    thread claims pending backups for up to BACKUP_WORKERS worker threads,
+    with at most BACKUP_MAX_PER_USER running per user, and each backup moves
+    through pending -> processing -> completed/failed in its row.
+
+    BACKUP_SCHEDULES maps backup types to cron expressions in local time,
+    e.g. {'full': '0 3 * * *', 'incremental': '0 * * * *'} for nightly full
+    and hourly incremental backups of every user with sayings.
+    """
+
+    def __init__(self, app, manager, workers=None, max_per_user=None, poll_interval=None,
+                 stale_after=None, schedules=None):
+        self.app = app
+        self.manager = manager
+        self.workers = workers or app.config.get('BACKUP_WORKERS', 2)
+        self.max_per_user = max_per_user or app.config.get('BACKUP_MAX_PER_USER', 1)
+        self.poll_interval = poll_interval or app.config.get('BACKUP_POLL_INTERVAL', 5)
+        # A backup still processing after this long was abandoned by a dead worker
+        self.stale_after = timedelta(seconds=stale_after or app.config.get('BACKUP_STALE_SECONDS', 6 * 3600))
+
+        schedules = schedules if schedules is not None else app.config.get('BACKUP_SCHEDULES', {})
+        for backup_type in schedules:
+            if backup_type not in BACKUP_TYPES:
+                raise ValueError(f"Unknown backup type in BACKUP_SCHEDULES: {backup_type}")
+        self.schedules = [(backup_type, CronSchedule(expression)) for backup_type, expression in schedules.items()]
+
+        self._lock = threading.Lock()
+        self._running = set()  # ids of backups on this process's workers
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pool = None
+        self._thread = None
+
+    def start(self):
+        """Start the dispatcher thread and worker pool"""
+        if self._thread is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backup-worker')
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop dispatching and wait for running backups to finish"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+        self._thread = None
+        self._pool = None
+
+    def enqueue(self, user_id, backup_type='full'):
+        """Queue a backup for user; returns (True, backup) or (False, message).
+
+        A backup of the same type already waiting for the user is returned
+        instead of queueing another.
+        """
+        if backup_type not in BACKUP_TYPES:
+            return False, f"backup_type must be one of {', '.join(BACKUP_TYPES)}"
+
+        backup = Backup.query.filter_by(user_id=user_id, backup_type=backup_type, status='pending').first()
+        if backup:
+            return True, backup
+
+        # The final file name, so the reconciler knows whose file it is while it is written
+        backup = Backup(
+            user_id=user_id,
+            filename=self.manager.backup_filename(user_id, backup_type),
+            backup_type=backup_type,
+            status='pending'
+        )
+        db.session.add(backup)
+        db.session.commit()
+
+        self._wake.set()
+        return True, backup
+
+    @staticmethod
+    def get(backup_id, user_id):
+        """Get a backup owned by user, or None"""
+        return Backup.query.filter_by(id=backup_id, user_id=user_id).first()
+
+    def _run(self):
+        last_minute = None
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    minute = datetime.now().replace(second=0, microsecond=0)
+                    if minute != last_minute:
+                        last_minute = minute
+                        self._fire_schedules(minute)
+                        self._fail_stale()
+                    self._dispatch()
+            except Exception:
+                self.app.logger.exception("Backup scheduler failed")
+
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _fire_schedules(self, minute):
+        for backup_type, schedule in self.schedules:
+            if not schedule.matches(minute):
+                continue
+
+            # Other processes run the same schedules; skip users one of them
+            # already queued this minute
+            recent = set(db.session.execute(
+                select(Backup.user_id).where(
+                    Backup.backup_type == backup_type,
+                    Backup.created_at >= datetime.utcnow() - timedelta(minutes=1)
+                )
+            ).scalars())
+            user_ids = set().union(*shards.fan_out(self._users_with_sayings).values())
+            # Accounts being deleted get no new backups
+            user_ids -= set(db.session.execute(select(User.id).where(User.deleted_at.isnot(None))).scalars())
+            for user_id in sorted(user_ids):
+                if user_id not in recent:
+                    self.enqueue(user_id, backup_type)
+
+    @staticmethod
+    def _users_with_sayings():
+        return db.session.execute(select(Saying.user_id).distinct()).scalars().all()
+
+    def _fail_stale(self):
+        stale = Backup.query.filter(
+            Backup.status == 'processing',
+            Backup.started_at < datetime.utcnow() - self.stale_after
+        ).all()
+        for backup in stale:
+            with self._lock:
+                if backup.id in self._running:
+                    continue
+            backup.status = 'failed'
+            backup.error_message = 'Backup was interrupted'
+            backup.completed_at = datetime.utcnow()
+        db.session.commit()
+
+    def _dispatch(self):
+        """Claim pending backups for idle workers, respecting per-user limits"""
+        with self._lock:
+            free = self.workers - len(self._running)
+        if free <= 0 or self._stop.is_set():
+            return
+
+        # Counted from the table so the limit holds across processes
+        active = dict(db.session.execute(
+            select(Backup.user_id, func.count()).where(Backup.status == 'processing').group_by(Backup.user_id)
+        ).all())
+        busy = [user_id for user_id, count in active.items() if count >= self.max_per_user]
+
+        candidates = Backup.query.filter(
+            Backup.status == 'pending', Backup.user_id.notin_(busy)
+        ).order_by(Backup.id).limit(free * 10).all()
+
+        backups = Backup.__table__
+        for backup in candidates:
+            if free == 0:
+                break
+            if active.get(backup.user_id, 0) >= self.max_per_user:
+                continue
+
+            claimed = db.session.execute(
+                update(backups)
+                .where(backups.c.id == backup.id, backups.c.status == 'pending')
+                .values(status='processing', started_at=datetime.utcnow())
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                continue
+
+            active[backup.user_id] = active.get(backup.user_id, 0) + 1
+            free -= 1
+            with self._lock:
+                self._running.add(backup.id)
+            self._pool.submit(self._process, backup.id)
+
+    def _process(self, backup_id):
+        try:
+            with self.app.app_context():
+                backup = db.session.get(Backup, backup_id)
+                success, result = self.manager.create_backup(backup.user_id, backup.backup_type, backup=backup)
+                if not success:
+                    self.app.logger.warning(f"Backup {backup_id} failed: {result}")
+        except Exception:
+            self.app.logger.exception(f"Backup {backup_id} failed")
+        finally:
+            with self._lock:
+                self._running.discard(backup_id)
+            self._wake.set()
@@ -1,157 +1,311 @@
-import pandas as pd
 import json
 from sqlalchemy.exc import SQLAlchemyError
 from models import db, Saying, User
+from import_engine import (
+    normalize_frame, BulkWriter, ImportProgress, ImportFormatError,
+    iter_json_array, iter_ndjson, sniff_json_format,
+    split_blocks, parse_csv_block, parse_ndjson_block, run_parallel_import
+)
+from columnar import export_schema, rows_to_batch, iter_encode, iter_frames
 from datetime import datetime
 import csv
 import io
+import zlib
+from itertools import islice
+
+EXPORT_CSV_COLUMNS = ['id', 'content', 'author', 'category', 'tags',
+                      'language', 'source', 'rating', 'view_count',
+                      'is_public', 'created_at', 'updated_at']
 
 class BatchProcessor:
     @staticmethod
-    def import_csv(file_content, user_id, chunk_size=100):
-        """Import sayings from CSV file"""
+    def import_csv(file_content, user_id, chunk_size=20000, progress_callback=None, workers=1,
+                   on_duplicate='skip'):
+        """Import sayings from CSV file.
+        
+        file_content may be bytes or a binary file object (an upload's spooled
+        temp file, the request stream); it is parsed, validated and inserted
+        chunk_size rows at a time, so memory does not grow with file size.
+        With workers > 1, parsing and validation run on a process pool.
+        on_duplicate ('skip', 'update', 'error' or None) handles rows whose
+        content already exists for the user.
+        """
+        import pandas as pd
+        
+        if isinstance(file_content, (bytes, bytearray)):
+            file_content = io.BytesIO(file_content)
+        
+        if workers > 1:
+            return BatchProcessor._import_csv_parallel(
+                file_content, user_id, chunk_size, progress_callback, workers, on_duplicate
+            )
+        
         try:
-            # Read CSV
-            df = pd.read_csv(io.StringIO(file_content.decode('utf-8')))
-            
-            # Validate required columns
-            required_columns = ['content']
-            if not all(col in df.columns for col in required_columns):
-                return False, "CSV must contain 'content' column"
+            # Read every column as text; normalization handles blanks and types
+            reader = pd.read_csv(
+                file_content,
+                chunksize=chunk_size,
+                dtype=str,
+                keep_default_na=False,
+                na_values=[''],
+                encoding='utf-8'
+            )
             
-            # Process in chunks
-            success_count = 0
-            error_count = 0
-            errors = []
+            writer = BulkWriter(chunk_size=chunk_size, on_duplicate=on_duplicate)
+            progress = ImportProgress(callback=progress_callback)
             
-            for i in range(0, len(df), chunk_size):
-                chunk = df.iloc[i:i+chunk_size]
-                sayings_batch = []
-                
-                for _, row in chunk.iterrows():
-                    try:
-                        saying = Saying(
-                            content=row['content'],
-                            author=row.get('author', 'Unknown'),
-                            category=row.get('category', 'General'),
-                            tags=json.loads(row['tags']) if 'tags' in row and pd.notna(row['tags']) else None,
-                            language=row.get('language', 'en'),
-                            source=row.get('source', ''),
-                            user_id=user_id
-                        )
-                        sayings_batch.append(saying)
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Row {_}: {str(e)}")
-                
-                # Bulk insert
-                try:
-                    db.session.bulk_save_objects(sayings_batch)
-                    db.session.commit()
-                    success_count += len(sayings_batch)
-                except SQLAlchemyError as e:
-                    db.session.rollback()
-                    error_count += len(sayings_batch)
-                    errors.append(f"Database error: {str(e)}")
+            with reader:
+                for chunk in reader:
+                    # Validate required columns
+                    if 'content' not in chunk.columns:
+                        return False, "CSV must contain 'content' column"
+                    
+                    # Validate and normalize whole columns, then bulk insert
+                    rows, lines, errors = normalize_frame(chunk, user_id, first_line=2 + progress.total)
+                    inserted, duplicates, db_errors = writer.write(rows, lines)
+                    progress.record(len(chunk), inserted, errors + db_errors, duplicates)
             
-            return True, {
-                'success_count': success_count,
-                'error_count': error_count,
-                'total': len(df),
-                'errors': errors[:10]  # Return first 10 errors
-            }
+            return True, progress.to_dict()
             
         except Exception as e:
             return False, f"Import failed: {str(e)}"
     
     @staticmethod
-    def import_json(file_content, user_id):
-        """Import sayings from JSON file"""
+    def _import_csv_parallel(file_content, user_id, chunk_size, progress_callback, workers, on_duplicate):
+        """Split the CSV into record-aligned blocks and parse them on a process pool"""
         try:
-            data = json.loads(file_content.decode('utf-8'))
-            
-            if not isinstance(data, list):
-                return False, "JSON must contain an array of sayings"
+            header = file_content.readline()
+            if 'content' not in next(csv.reader([header.decode('utf-8')]), []):
+                return False, "CSV must contain 'content' column"
             
-            success_count = 0
-            errors = []
+            progress = ImportProgress(callback=progress_callback)
+            run_parallel_import(
+                split_blocks(file_content, block_size=chunk_size * 128),
+                parse_csv_block, (header, user_id),
+                BulkWriter(chunk_size=chunk_size, on_duplicate=on_duplicate), progress, workers
+            )
+            return True, progress.to_dict()
             
-            for item in data:
-                try:
-                    saying = Saying(
-                        content=item['content'],
-                        author=item.get('author', 'Unknown'),
-                        category=item.get('category', 'General'),
-                        tags=item.get('tags'),
-                        language=item.get('language', 'en'),
-                        source=item.get('source', ''),
-                        user_id=user_id
-                    )
-                    db.session.add(saying)
-                    success_count += 1
-                except KeyError as e:
-                    errors.append(f"Missing required field: {str(e)}")
-                except Exception as e:
-                    errors.append(f"Error: {str(e)}")
+        except Exception as e:
+            return False, f"Import failed: {str(e)}"
+    
+    @staticmethod
+    def import_json(file_content, user_id, chunk_size=5000, progress_callback=None, json_format=None, workers=1,
+                    on_duplicate='skip'):
+        """Import sayings from a JSON array or NDJSON file.
+        
+        file_content may be bytes or a binary file object. Items are parsed
+        incrementally and inserted chunk_size at a time with a commit per
+        chunk, so neither the document nor the sayings are held in memory.
+        json_format is 'json' or 'ndjson'; None detects it from the content.
+        With workers > 1, NDJSON is parsed and validated on a process pool.
+        on_duplicate works as in import_csv.
+        """
+        import pandas as pd
+        
+        if isinstance(file_content, (bytes, bytearray)):
+            file_content = io.BytesIO(file_content)
+        
+        if json_format is None:
+            json_format, file_content = sniff_json_format(file_content)
+        
+        if json_format == 'ndjson' and workers > 1:
+            try:
+                progress = ImportProgress(callback=progress_callback, label='Line')
+                run_parallel_import(
+                    split_blocks(file_content, block_size=chunk_size * 256, quote=None),
+                    parse_ndjson_block, (user_id,),
+                    BulkWriter(chunk_size=chunk_size, on_duplicate=on_duplicate), progress, workers
+                )
+                return True, progress.to_dict()
+            except Exception as e:
+                return False, f"Import failed: {str(e)}"
+        
+        if json_format == 'ndjson':
+            items = iter_ndjson(file_content)
+            progress = ImportProgress(callback=progress_callback, label='Line')
+        else:
+            items = iter_json_array(file_content)
+            progress = ImportProgress(callback=progress_callback, label='Item')
+        
+        try:
+            writer = BulkWriter(chunk_size=chunk_size, on_duplicate=on_duplicate)
             
-            db.session.commit()
+            while True:
+                batch = list(islice(items, chunk_size))
+                if not batch:
+                    break
+                
+                sayings, lines, errors = [], [], []
+                for number, item in batch:
+                    if isinstance(item, dict):
+                        sayings.append(item)
+                        lines.append(number)
+                    elif isinstance(item, ValueError):
+                        errors.append((number, str(item)))
+                    else:
+                        errors.append((number, "Saying must be a JSON object"))
+                
+                rows, row_lines = [], []
+                if sayings:
+                    rows, row_lines, rejected = normalize_frame(pd.DataFrame(sayings), user_id, lines=lines)
+                    errors.extend(rejected)
+                
+                inserted, duplicates, db_errors = writer.write(rows, row_lines)
+                progress.record(len(batch), inserted, errors + db_errors, duplicates)
             
-            return True, {
-                'success_count': success_count,
-                'error_count': len(errors),
-                'errors': errors[:10]
-            }
+            return True, progress.to_dict()
             
-        except json.JSONDecodeError as e:
+        except ImportFormatError as e:
+            if progress.total:
+                return False, f"Invalid JSON after {progress.success_count} imported sayings: {str(e)}"
             return False, f"Invalid JSON: {str(e)}"
         except Exception as e:
             return False, f"Import failed: {str(e)}"
     
     @staticmethod
-    def export_csv(user_id, filters=None):
-        """Export sayings to CSV format"""
-        try:
-            query = Saying.query.filter_by(user_id=user_id)
-            
-            # Apply filters
-            if filters:
-                if 'category' in filters:
-                    query = query.filter_by(category=filters['category'])
-                if 'author' in filters:
-                    query = query.filter_by(author=filters['author'])
-                if 'is_public' in filters:
-                    query = query.filter_by(is_public=filters['is_public'])
-            
-            sayings = query.all()
+    def _export_query(user_id, filters=None):
+        """Build the export query for user, applying optional filters"""
+        query = Saying.query.filter_by(user_id=user_id)
+        
+        # Apply filters
+        if filters:
+            if 'category' in filters:
+                query = query.filter_by(category=filters['category'])
+            if 'author' in filters:
+                query = query.filter_by(author=filters['author'])
+            if 'is_public' in filters:
+                query = query.filter_by(is_public=filters['is_public'])
+        
+        return query.order_by(Saying.id)
+    
+    @staticmethod
+    def iter_export_csv(user_id, filters=None, batch_size=1000):
+        """Yield CSV text for user's sayings, about batch_size rows at a time.
+        
+        Rows are fetched with yield_per (a server-side cursor where the
+        driver supports one), so memory does not grow with account size.
+        """
+        output = io.StringIO()
+        writer = csv.writer(output)
+        
+        # Write header
+        writer.writerow(EXPORT_CSV_COLUMNS)
+        
+        # Write data
+        query = BatchProcessor._export_query(user_id, filters).yield_per(batch_size)
+        for count, saying in enumerate(query, 1):
+            writer.writerow([
+                saying.id,
+                saying.content,
+                saying.author,
+                saying.category,
+                json.dumps(saying.tags) if saying.tags else '',
+                saying.language,
+                saying.source,
+                saying.rating,
+                saying.view_count,
+                saying.is_public,
+                saying.created_at.isoformat() if saying.created_at else '',
+                saying.updated_at.isoformat() if saying.updated_at else ''
+            ])
             
-            # Create CSV content
-            output = io.StringIO()
-            writer = csv.writer(output)
+            if count % batch_size == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        
+        yield output.getvalue()
+    
+    @staticmethod
+    def iter_export_json(user_id, filters=None, batch_size=1000):
+        """Yield a JSON array of user's sayings, about batch_size items at a time.
+        
+        The output is identical to json.dumps(data, indent=2) of the whole
+        list, but only one batch is ever held in memory.
+        """
+        query = BatchProcessor._export_query(user_id, filters).yield_per(batch_size)
+        
+        parts = []
+        first = True
+        for saying in query:
+            item = json.dumps(saying.to_dict(), indent=2, ensure_ascii=False)
+            parts.append(('[\n  ' if first else ',\n  ') + item.replace('\n', '\n  '))
+            first = False
             
-            # Write header
-            writer.writerow(['id', 'content', 'author', 'category', 'tags', 
-                           'language', 'source', 'rating', 'view_count', 
-                           'is_public', 'created_at', 'updated_at'])
+            if len(parts) >= batch_size:
+                yield ''.join(parts)
+                parts = []
+        
+        parts.append('[]' if first else '\n]')
+        yield ''.join(parts)
+    
+    @staticmethod
+    def iter_export_columnar(user_id, filters=None, file_format='parquet', batch_size=50000):
+        """Yield a Parquet or Arrow IPC file of user's sayings as bytes.
+        
+        Rows are fetched as plain tuples with yield_per and written one row
+        group per batch_size rows, with typed tags/rating/is_public/timestamp
+        columns. Raises ColumnarUnavailable when pyarrow is missing.
+        """
+        schema = export_schema()
+        query = BatchProcessor._export_query(user_id, filters).with_entities(
+            *(getattr(Saying, column) for column in EXPORT_CSV_COLUMNS)
+        ).yield_per(batch_size)
+        
+        def batches():
+            rows = iter(query)
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                yield rows_to_batch(chunk, schema)
+        
+        return iter_encode(batches(), file_format, schema)
+    
+    @staticmethod
+    def import_columnar(file_content, user_id, file_format='parquet', chunk_size=20000,
+                        progress_callback=None, on_duplicate='skip'):
+        """Import sayings from a Parquet or Arrow IPC file.
+        
+        file_content may be bytes or a seekable binary file object. Record
+        batches are read chunk_size rows at a time and go through the same
+        validation and bulk insert as CSV imports. Typed rating, view_count,
+        is_public and created_at columns are kept, so an export imports back
+        unchanged.
+        """
+        if isinstance(file_content, (bytes, bytearray)):
+            file_content = io.BytesIO(file_content)
+        
+        progress = ImportProgress(callback=progress_callback, label='Row')
+        try:
+            writer = BulkWriter(chunk_size=chunk_size, on_duplicate=on_duplicate)
             
-            # Write data
-            for saying in sayings:
-                writer.writerow([
-                    saying.id,
-                    saying.content,
-                    saying.author,
-                    saying.category,
-                    json.dumps(saying.tags) if saying.tags else '',
-                    saying.language,
-                    saying.source,
-                    saying.rating,
-                    saying.view_count,
-                    saying.is_public,
-                    saying.created_at.isoformat() if saying.created_at else '',
-                    saying.updated_at.isoformat() if saying.updated_at else ''
-                ])
+            for frame in iter_frames(file_content, file_format, batch_size=chunk_size):
+                rows, lines, errors = normalize_frame(frame, user_id, first_line=progress.total + 1, typed=True)
+                inserted, duplicates, db_errors = writer.write(rows, lines)
+                progress.record(len(frame), inserted, errors + db_errors, duplicates)
             
-            return True, output.getvalue()
+            return True, progress.to_dict()
             
+        except Exception as e:
+            return False, f"Import failed: {str(e)}"
+    
+    @staticmethod
+    def gzip_stream(chunks, level=6):
+        """Gzip-compress an iterable of text chunks on the fly"""
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    @staticmethod
+    def export_csv(user_id, filters=None):
+        """Export sayings to CSV format"""
+        try:
+            return True, ''.join(BatchProcessor.iter_export_csv(user_id, filters))
         except Exception as e:
             return False, f"Export failed: {str(e)}"
     
@@ -159,21 +313,6 @@ class BatchProcessor:
     def export_json(user_id, filters=None):
         """Export sayings to JSON format"""
         try:
-            query = Saying.query.filter_by(user_id=user_id)
-            
-            # Apply filters
-            if filters:
-                if 'category' in filters:
-                    query = query.filter_by(category=filters['category'])
-                if 'author' in filters:
-                    query = query.filter_by(author=filters['author'])
-            
-            sayings = query.all()
-            
-            # Convert to dictionary list
-            data = [saying.to_dict() for saying in sayings]
-            
-            return True, json.dumps(data, indent=2, ensure_ascii=False)
-            
+            return True, ''.join(BatchProcessor.iter_export_json(user_id, filters))
         except Exception as e:
             return False, f"Export failed: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database so they can be run
+anywhere the API's own dependencies are installed.
+"""
+import csv
+import json
+import os
+import random
+import resource
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+CATEGORIES = ['Philosophy', 'Literature', 'Education', 'Science', 'History', 'Art', 'Life', 'Humor']
+WORDS = (
+    'the journey of a thousand miles begins with one step knowledge is power '
+    'to be or not to be that is question think therefore am time waits for no one'
+).split()
+
+
+def make_app(db_path):
+    """Create a minimal Flask app bound to a SQLite file with all tables created"""
+    from flask import Flask
+    from models import db
+
+    app = Flask('benchmark')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def create_user(username='bench'):
+    """Create a user row; needs an app context"""
+    from models import db, User
+
+    user = User(username=username, email=f'{username}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def synthetic_sayings(rows, text_words=12, categories=8, seed=42):
+    """Yield synthetic saying dicts with the columns the importers accept"""
+    rng = random.Random(seed)
+    category_names = [
+        CATEGORIES[i] if i < len(CATEGORIES) else f'Category {i}'
+        for i in range(categories)
+    ]
+    for i in range(rows):
+        yield {
+            'content': f"{' '.join(rng.choices(WORDS, k=text_words))} #{i}",
+            'author': f'Author {rng.randrange(1000)}',
+            'category': rng.choice(category_names),
+            'tags': [rng.choice(WORDS), rng.choice(WORDS)],
+            'language': 'en',
+            'source': '',
+        }
+
+
+def write_csv(path, rows, **options):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['content', 'author', 'category', 'tags', 'language', 'source'])
+        writer.writeheader()
+        for saying in synthetic_sayings(rows, **options):
+            saying['tags'] = json.dumps(saying['tags'])
+            writer.writerow(saying)
+    return os.path.getsize(path)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
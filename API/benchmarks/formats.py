@@ -0,0 +1,108 @@
+"""Export/import throughput and file size per format.
+
+Loads synthetic sayings into a temp SQLite database, then for each format
+exports them (streaming, as the export endpoint does) and imports the file
+back for a second user. Reports file size and rows/sec in both directions.
+
+Usage:
+    python benchmarks/formats.py --rows 200000 --formats csv json ndjson parquet arrow
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import make_app, create_user, write_csv
+
+FORMATS = ['csv', 'json', 'ndjson', 'parquet', 'arrow']
+
+
+def export_chunks(user_id, file_format):
+    from batch_processor import BatchProcessor
+
+    if file_format == 'csv':
+        return (chunk.encode('utf-8') for chunk in BatchProcessor.iter_export_csv(user_id))
+    if file_format == 'json':
+        return (chunk.encode('utf-8') for chunk in BatchProcessor.iter_export_json(user_id))
+    if file_format == 'ndjson':
+        # Not an export format of its own; built from the ORM like the JSON export
+        query = BatchProcessor._export_query(user_id).yield_per(1000)
+        return ((json.dumps(saying.to_dict(), ensure_ascii=False) + '\n').encode('utf-8') for saying in query)
+    return BatchProcessor.iter_export_columnar(user_id, file_format=file_format)
+
+
+def import_file(f, user_id, file_format):
+    from batch_processor import BatchProcessor
+
+    if file_format == 'csv':
+        return BatchProcessor.import_csv(f, user_id, on_duplicate=None)
+    if file_format in ('json', 'ndjson'):
+        return BatchProcessor.import_json(f, user_id, json_format=file_format, on_duplicate=None)
+    return BatchProcessor.import_columnar(f, user_id, file_format, on_duplicate=None)
+
+
+def run(app, source_user, file_format, workdir):
+    path = Path(workdir) / f'sayings.{file_format}'
+    with app.app_context():
+        started = time.perf_counter()
+        with open(path, 'wb') as f:
+            for chunk in export_chunks(source_user, file_format):
+                f.write(chunk)
+        export_seconds = time.perf_counter() - started
+
+        user_id = create_user(f'bench_{file_format}')
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            success, result = import_file(f, user_id, file_format)
+        import_seconds = time.perf_counter() - started
+
+    if not success:
+        raise RuntimeError(result)
+    rows = result['success_count']
+    return {
+        'format': file_format,
+        'rows': rows,
+        'size_mb': round(path.stat().st_size / (1024 * 1024), 2),
+        'export_seconds': round(export_seconds, 2),
+        'export_rows_per_sec': round(rows / export_seconds),
+        'import_seconds': round(import_seconds, 2),
+        'import_rows_per_sec': round(rows / import_seconds),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        app = make_app(Path(workdir) / 'bench.db')
+        csv_path = Path(workdir) / 'seed.csv'
+        write_csv(csv_path, args.rows)
+        with app.app_context():
+            from batch_processor import BatchProcessor
+
+            source_user = create_user()
+            with open(csv_path, 'rb') as f:
+                success, result = BatchProcessor.import_csv(f, source_user)
+            if not success:
+                raise RuntimeError(result)
+
+        for file_format in args.formats:
+            result = run(app, source_user, file_format, workdir)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
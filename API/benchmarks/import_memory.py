@@ -0,0 +1,87 @@
+"""Peak-memory benchmark for the streaming CSV importer.
+
+Each file size is imported in a fresh subprocess so peak RSS is measured
+independently. With a streaming importer peak RSS should stay roughly flat
+as the file grows; the run fails when the largest file's peak exceeds the
+smallest one's by more than ``--max-growth-mb``.
+
+Usage:
+    python benchmarks/import_memory.py --rows 50000 500000 2000000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import API_DIR, make_app, create_user, write_csv, peak_rss_mb
+
+
+def run_import(csv_path, chunk_size):
+    """Import csv_path into a fresh database; runs inside the child process"""
+    from batch_processor import BatchProcessor
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = make_app(Path(workdir) / 'bench.db')
+        with app.app_context():
+            user_id = create_user()
+            baseline_mb = peak_rss_mb()
+            started = time.perf_counter()
+            with open(csv_path, 'rb') as f:
+                success, result = BatchProcessor.import_csv(f, user_id, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - started
+
+    if not success:
+        raise RuntimeError(result)
+    return {
+        'rows': result['total'],
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(result['total'] / elapsed),
+        'baseline_rss_mb': round(baseline_mb, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[50000, 500000])
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--max-growth-mb', type=float, default=64.0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_import(args.child, args.chunk_size)))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sorted(args.rows):
+            csv_path = Path(workdir) / f'sayings_{rows}.csv'
+            size = write_csv(csv_path, rows)
+            child = subprocess.run(
+                [sys.executable, __file__, '--child', str(csv_path), '--chunk-size', str(args.chunk_size)],
+                cwd=API_DIR, capture_output=True, text=True, check=True
+            )
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            result['file_mb'] = round(size / (1024 * 1024), 1)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    growth = results[-1]['peak_rss_mb'] - results[0]['peak_rss_mb']
+    if growth > args.max_growth_mb:
+        print(f"FAIL: peak RSS grew {growth:.1f}MB from {results[0]['rows']} "
+              f"to {results[-1]['rows']} rows", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Import throughput at different parse/validate worker counts.
+
+Imports the same synthetic CSV into a fresh SQLite database once per
+worker count and reports rows/sec. ``workers=1`` is the serial path.
+
+Usage:
+    python benchmarks/import_parallel.py --rows 1000000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import make_app, create_user, write_csv
+
+
+def run(csv_path, workers, chunk_size, workdir):
+    from batch_processor import BatchProcessor
+
+    app = make_app(Path(workdir) / f'bench_{workers}.db')
+    with app.app_context():
+        user_id = create_user()
+        started = time.perf_counter()
+        with open(csv_path, 'rb') as f:
+            success, result = BatchProcessor.import_csv(f, user_id, chunk_size=chunk_size, workers=workers)
+        elapsed = time.perf_counter() - started
+
+    if not success:
+        raise RuntimeError(result)
+    return {
+        'workers': workers,
+        'rows': result['success_count'],
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(result['success_count'] / elapsed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    print(f"cpu_count={os.cpu_count()}", file=sys.stderr)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = Path(workdir) / 'sayings.csv'
+        write_csv(csv_path, args.rows)
+        for workers in args.workers:
+            result = run(csv_path, workers, args.chunk_size, workdir)
+            results.append(result)
+            print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,408 @@
+"""Query-plan regression check for the queries behind the API.
+
+Seeds a SQLite database with users of different sizes, then drives every
+route of appIntegral (through the Flask test client), AnalyticsManager and
+BatchProcessor while recording each SELECT, UPDATE and DELETE they send.
+Every distinct statement is run through EXPLAIN QUERY PLAN with the
+parameters it was issued with. The check fails when a plan scans a whole
+table or index or sorts through a temp B-tree, unless ALLOWED excuses that
+plan step for every case that issued the statement.
+
+It also reports each index's size on disk and how many recorded plans used
+it, so indexes that cost space and write time without serving any query
+stand out. Queries of the background workers (backup scheduler and
+reconciler, import jobs) are not driven, so indexes serving only them show
+as unused here.
+
+Usage:
+    python benchmarks/query_plans.py --rows 20000
+    python benchmarks/query_plans.py --verbose --output plans.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from common import synthetic_sayings, write_csv
+
+# (case, plan step prefix) -> why the step is acceptable there
+ALLOWED = {
+    ('analytics.get_category_distribution(all users)', 'SCAN sayings'):
+        'admin-wide aggregate over every saying',
+    ('analytics.get_category_distribution(all users)', 'USE TEMP B-TREE FOR ORDER BY'):
+        'ordered by the aggregated count',
+    ('analytics.get_category_distribution(user)', 'USE TEMP B-TREE FOR ORDER BY'):
+        'ordered by the aggregated count',
+}
+
+SCAN_STEP = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+INDEX_STEP = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+PLACEHOLDERS = re.compile(r'\(\?(?:, \?)+\)')
+RECORDED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class QueryRecorder:
+    """Collects the statements sent on one thread, labelled with the current case"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = {}  # normalized SQL -> {'sql', 'parameters', 'cases'}
+        self.case = None
+        self._thread = threading.get_ident()
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @contextmanager
+    def labelled(self, case):
+        self.case = case
+        try:
+            yield
+        finally:
+            self.case = None
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # Background workers (imports, backups, view counts) run their own
+        # statements at unpredictable times; only the driven calls count
+        if self.case is None or threading.get_ident() != self._thread:
+            return
+        if not statement.lstrip().upper().startswith(RECORDED):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        # IN lists of different lengths are the same query
+        key = PLACEHOLDERS.sub('(?, ...)', ' '.join(statement.split()))
+        entry = self.statements.setdefault(key, {'sql': statement, 'parameters': parameters, 'cases': []})
+        if self.case not in entry['cases']:
+            entry['cases'].append(self.case)
+
+
+def explain(connection, statement, parameters):
+    """Plan steps of statement as strings"""
+    cursor = connection.cursor()
+    try:
+        return [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    finally:
+        cursor.close()
+
+
+def plan_problems(steps, tables):
+    """Steps that scan a whole table or index or sort in a temp B-tree"""
+    problems = []
+    for step in steps:
+        match = SCAN_STEP.match(step)
+        if (match and match.group(1) in tables) or 'USE TEMP B-TREE' in step:
+            problems.append(step)
+    return problems
+
+
+def is_allowed(step, cases):
+    return all(
+        any(case == allowed_case and step.startswith(prefix) for allowed_case, prefix in ALLOWED)
+        for case in cases
+    )
+
+
+def index_sizes(connection):
+    """{index: {'table', 'bytes', 'table_bytes', 'unique'}} from dbstat"""
+    sizes = dict(connection.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall())
+    indexes = {}
+    for (table,) in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall():
+        for _, name, unique, origin, _ in connection.execute(f'PRAGMA index_list("{table}")').fetchall():
+            indexes[name] = {
+                'table': table,
+                'bytes': sizes.get(name, 0),
+                'table_bytes': sizes.get(table, 0),
+                # Indexes behind UNIQUE/PRIMARY KEY constraints cannot be dropped
+                'unique': bool(unique) or origin != 'c',
+            }
+    return indexes
+
+
+def seed(args):
+    """Fill the database: one heavy user, many light ones, and their history. Needs an app context."""
+    from sqlalchemy import insert
+    from models import (db, User, Saying, LoginHistory, Backup, UsageStatistics,
+                        EndpointStatistics, SayingTombstone)
+
+    rng = random.Random(args.seed)
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+             for i in range(args.users)]
+    db.session.add_all(users)
+    db.session.commit()
+    # Tokens carry the user's uuid (see auth.init_auth) while the routes
+    # read the identity back as a user id; make the two agree
+    for user in users:
+        user.uuid = str(user.id)
+    db.session.commit()
+    user_ids = [user.id for user in users]
+
+    # Half the rows belong to the first user, the rest are spread out
+    now = datetime.utcnow()
+    owners = [user_ids[0]] * (args.rows // 2) + [rng.choice(user_ids[1:]) for _ in range(args.rows - args.rows // 2)]
+    rows = []
+    for owner, saying in zip(owners, synthetic_sayings(args.rows, categories=args.categories, seed=args.seed)):
+        created = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+        saying.update(
+            user_id=owner,
+            content_hash=Saying.hash_content(saying['content']),
+            view_count=rng.randrange(1000),
+            is_public=rng.random() < 0.8,
+            created_at=created,
+            updated_at=created,
+        )
+        rows.append(saying)
+        if len(rows) == 5000:
+            db.session.execute(insert(Saying.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Saying.__table__), rows)
+
+    today = now.date()
+    db.session.execute(insert(UsageStatistics.__table__), [
+        {'user_id': user_id, 'date': today - timedelta(days=day), 'sayings_created': rng.randrange(20),
+         'api_calls': rng.randrange(500), 'sayings_updated': 0, 'sayings_deleted': 0,
+         'login_count': 1, 'total_view_count': 0}
+        for user_id in user_ids for day in range(90)
+    ])
+    endpoints = ['GET /api/sayings', 'GET /api/sayings/<int:saying_id>', 'POST /api/sayings',
+                 'PUT /api/sayings/<int:saying_id>', 'GET /api/sayings/search', 'GET /api/sayings/export']
+    db.session.execute(insert(EndpointStatistics.__table__), [
+        {'endpoint': endpoint, 'date': today - timedelta(days=day), 'call_count': rng.randrange(10000)}
+        for endpoint in endpoints for day in range(90)
+    ])
+    db.session.execute(insert(LoginHistory.__table__), [
+        {'user_id': rng.choice(user_ids), 'ip_address': '127.0.0.1', 'status': 'success',
+         'login_time': now - timedelta(hours=hour)}
+        for hour in range(args.users * 20)
+    ])
+    db.session.execute(insert(Backup.__table__), [
+        {'user_id': user_id, 'filename': f'backup_{user_id}_{day}_full.zip', 'backup_type': 'full',
+         'status': 'completed', 'created_at': now - timedelta(days=day), 'locations': ['local']}
+        for user_id in user_ids for day in range(30)
+    ])
+    db.session.execute(insert(SayingTombstone.__table__), [
+        {'user_id': rng.choice(user_ids), 'saying_uuid': f'deleted-{i}', 'deleted_at': now - timedelta(hours=i)}
+        for i in range(args.rows // 20)
+    ])
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+    return user_ids
+
+
+def drive(recorder, app, user_ids, workdir):
+    """Exercise every query path once per case, labelled for the recorder"""
+    from flask_jwt_extended import create_access_token
+    from analytics import AnalyticsManager, endpoint_sketches
+    from batch_processor import BatchProcessor
+    from columnar import COLUMNAR_FORMATS
+    import appIntegral
+    from models import db, User, Saying
+
+    heavy_id = user_ids[0]
+    with app.app_context():
+        token = create_access_token(identity=db.session.get(User, heavy_id))
+        saying_ids = [saying_id for (saying_id,) in db.session.query(Saying.id).filter_by(user_id=heavy_id).limit(100)]
+        category, author = db.session.query(Saying.category, Saying.author).filter_by(user_id=heavy_id).first()
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    csv_path = os.path.join(workdir, 'import.csv')
+    write_csv(csv_path, 200)
+
+    def upload(path, name):
+        with open(path, 'rb') as f:
+            return {'file': (io.BytesIO(f.read()), name)}
+
+    requests = [
+        ('POST /api/auth/register', lambda: client.post('/api/auth/register', json={
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'secret'})),
+        ('POST /api/auth/login', lambda: client.post('/api/auth/login', json={
+            'username': 'user0', 'password': 'wrong'})),
+        ('GET /api/sayings', lambda: client.get('/api/sayings', headers=headers)),
+        ('GET /api/sayings?ids&fields', lambda: client.get('/api/sayings', headers=headers, query_string={
+            'ids': ','.join(map(str, saying_ids[:50])), 'fields': 'id,content'})),
+        ('GET /api/sayings/most-viewed', lambda: client.get('/api/sayings/most-viewed', headers=headers)),
+        ('GET /api/sayings/<id>', lambda: client.get(f'/api/sayings/{saying_ids[0]}', headers=headers)),
+        ('POST /api/sayings', lambda: client.post('/api/sayings', headers=headers, json={
+            'content': 'a brand new saying', 'author': 'Harness', 'category': 'Life'})),
+        ('POST /api/sayings (duplicate)', lambda: client.post('/api/sayings', headers=headers, json={
+            'content': 'a brand new saying'})),
+        ('PUT /api/sayings/<id>', lambda: client.put(
+            f'/api/sayings/{saying_ids[1]}', headers=headers, json={'author': 'Editor'})),
+        ('DELETE /api/sayings/<id>', lambda: client.delete(f'/api/sayings/{saying_ids[2]}', headers=headers)),
+        ('GET /api/sayings/search', lambda: client.get(
+            '/api/sayings/search', headers=headers, query_string={'q': 'journey'})),
+        ('GET /api/sayings/search (category, author)', lambda: client.get(
+            '/api/sayings/search', headers=headers, query_string={'category': category, 'author': author})),
+        ('POST /api/sayings/import', lambda: client.post(
+            '/api/sayings/import', headers=headers, data=upload(csv_path, 'import.csv'))),
+        ('POST /api/sayings/import (update)', lambda: client.post(
+            '/api/sayings/import', headers=headers,
+            data=dict(upload(csv_path, 'import.csv'), on_duplicate='update'))),
+        ('POST /api/reports', lambda: client.post('/api/reports', headers=headers, json={})),
+        ('POST /api/import-jobs', lambda: client.post(
+            '/api/import-jobs', headers=headers, data=upload(csv_path, 'job.csv'))),
+        ('GET /api/backups', lambda: client.get('/api/backups', headers=headers, query_string={'page': 2})),
+        ('POST /api/backups', lambda: client.post('/api/backups', headers=headers, json={})),
+        ('GET /api/backups/<id>', lambda: client.get('/api/backups/1', headers=headers)),
+    ]
+    formats = ['csv', 'json'] + sorted(COLUMNAR_FORMATS)
+    for file_format in formats:
+        for filters in ({}, {'category': category}, {'author': author}, {'is_public': 'true'}):
+            label = 'GET /api/sayings/export' + ''.join(f' {key}' for key in filters) + f' ({file_format})'
+            requests.append((label, lambda file_format=file_format, filters=filters: client.get(
+                '/api/sayings/export', headers=headers, query_string=dict(filters, format=file_format))))
+
+    for case, call in requests:
+        with recorder.labelled(case):
+            response = call()
+            response.get_data()  # exports stream their queries
+        # The statements sent before a failure were still recorded
+        if response.status_code >= 500:
+            print(f"warning: {case} returned {response.status_code}", file=sys.stderr)
+
+    with recorder.labelled('GET /api/import-jobs/<id>'):
+        job_id = client.post('/api/import-jobs', headers=headers, data=upload(csv_path, 'again.csv'))
+        client.get(f"/api/import-jobs/{job_id.get_json()['data']['job_id']}", headers=headers)
+
+    with app.app_context():
+        calls = [
+            ('analytics.track_api_call', lambda: AnalyticsManager.track_api_call(heavy_id, 'GET /api/sayings')),
+            ('analytics.track_saying_creation', lambda: AnalyticsManager.track_saying_creation(heavy_id)),
+            ('analytics.endpoint_sketches.flush', endpoint_sketches.flush),
+            ('analytics.get_user_stats', lambda: AnalyticsManager.get_user_stats(heavy_id)),
+            ('analytics.get_category_distribution(user)',
+             lambda: AnalyticsManager.get_category_distribution(heavy_id)),
+            ('analytics.get_endpoint_stats', AnalyticsManager.get_endpoint_stats),
+            ('analytics.get_endpoint_stats(endpoint)',
+             lambda: AnalyticsManager.get_endpoint_stats('GET /api/sayings')),
+            ('analytics.get_daily_active_users', AnalyticsManager.get_daily_active_users),
+            ('view_counter.flush', appIntegral.view_counter.flush),
+            ('batch_processor.import_json', lambda: BatchProcessor.import_json(
+                b'[{"content": "from json"}, {"content": "a brand new saying"}]', heavy_id)),
+            ('batch_processor.import_json (ndjson, error)', lambda: BatchProcessor.import_json(
+                b'{"content": "from ndjson"}\n', heavy_id, on_duplicate='error')),
+        ]
+        for case, call in calls:
+            with recorder.labelled(case):
+                call()
+
+    # fan_out runs each shard in its own thread; record on this one
+    with app.app_context(), recorder.labelled('analytics.get_category_distribution(all users)'):
+        AnalyticsManager._count_categories(None)
+
+    # Last, since it closes the account the other cases use
+    with recorder.labelled('DELETE /api/account'):
+        client.delete('/api/account', headers=headers)
+
+
+def check(engine, recorder):
+    """EXPLAIN every recorded statement; returns (results, index report)"""
+    tables = set(engine.dialect.get_table_names(engine.connect()))
+    results = []
+    used = {}
+    raw = engine.raw_connection()
+    try:
+        connection = raw.driver_connection
+        for entry in recorder.statements.values():
+            steps = explain(connection, entry['sql'], entry['parameters'])
+            for step in steps:
+                for name in INDEX_STEP.findall(step):
+                    used[name] = used.get(name, 0) + 1
+            problems = plan_problems(steps, tables)
+            results.append({
+                'cases': entry['cases'],
+                'sql': ' '.join(entry['sql'].split()),
+                'plan': steps,
+                'allowed': [step for step in problems if is_allowed(step, entry['cases'])],
+                'violations': [step for step in problems if not is_allowed(step, entry['cases'])],
+            })
+        indexes = index_sizes(connection)
+    finally:
+        raw.close()
+
+    for name, index in indexes.items():
+        index['plans'] = used.get(name, 0)
+    return results, indexes
+
+
+def report(results, indexes, verbose):
+    failures = [result for result in results if result['violations']]
+    for result in results:
+        if not (verbose or result['violations']):
+            continue
+        status = 'FAIL' if result['violations'] else 'ok'
+        print(f"[{status}] {', '.join(result['cases'])}")
+        print(f"    {result['sql'][:300]}")
+        for step in result['plan']:
+            marker = '!!' if step in result['violations'] else '~~' if step in result['allowed'] else '  '
+            print(f"    {marker} {step}")
+
+    print(f"\n{len(results)} distinct statements, {len(failures)} with full scans or temp B-trees\n")
+    print(f"{'index':<40} {'table':<22} {'KiB':>9} {'% table':>8} {'plans':>6}")
+    for name, index in sorted(indexes.items(), key=lambda item: -item[1]['bytes']):
+        share = index['bytes'] / index['table_bytes'] if index['table_bytes'] else 0
+        note = '' if index['plans'] or index['unique'] else '  unused here'
+        print(f"{name:<40} {index['table']:<22} {index['bytes'] / 1024:>9.0f} {share:>8.0%} {index['plans']:>6}{note}")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help='sayings across all users')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not just failures')
+    parser.add_argument('--output', help='write plans and index sizes as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+        os.environ.pop('SHARD_DATABASE_URLS', None)
+        os.chdir(workdir)  # background workers keep their files here
+        import appIntegral
+        from models import db
+
+        app = appIntegral.app
+        try:
+            with app.app_context():
+                user_ids = seed(args)
+                engine = db.engine
+            with QueryRecorder(engine) as recorder:
+                drive(recorder, app, user_ids, workdir)
+            results, indexes = check(engine, recorder)
+        finally:
+            appIntegral.account_deletion.stop()
+            appIntegral.backup_scheduler.stop()
+            appIntegral.backup_reconciler.stop()
+            appIntegral.import_jobs.stop()
+            appIntegral.view_counter.stop()
+            appIntegral.endpoint_sketches.stop()
+            appIntegral.report_jobs.shutdown()
+
+    status = report(results, indexes, args.verbose)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'statements': results, 'indexes': indexes}, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Write throughput with sayings sharded across SQLite files.
+
+Each writer thread inserts sayings for its own user in committed batches,
+the way imports do. SQLite serialises writers per database file, so with
+one shard the writers queue on a single lock; with N shards the users are
+spread over N files. Reports rows/sec per shard count and how the users
+were distributed.
+
+Usage:
+    python benchmarks/shards.py --shards 1 2 4 --writers 8 --rows 20000
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from common import synthetic_sayings
+
+
+def make_sharded_app(workdir, shard_count):
+    from flask import Flask
+    from models import db
+    from sharding import shards
+
+    app = Flask('benchmark')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{workdir}/main.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Writers on the same file wait for the lock instead of failing
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 120}}
+    app.config['SHARD_BINDS'] = {f'shard{i}': f'sqlite:///{workdir}/shard{i}.db' for i in range(shard_count)}
+    shards.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        shards.create_all()
+    return app
+
+
+def write_rows(app, user_id, rows, batch_size, text_words):
+    from sqlalchemy import insert
+    from models import db, Saying
+    from sharding import shards
+
+    table = Saying.__table__
+    with app.app_context(), shards.for_user(user_id):
+        batch = []
+        for saying in synthetic_sayings(rows, text_words=text_words, seed=user_id):
+            saying['content_hash'] = Saying.hash_content(saying['content'])
+            saying['user_id'] = user_id
+            batch.append(saying)
+            if len(batch) >= batch_size:
+                db.session.execute(insert(table), batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(insert(table), batch)
+            db.session.commit()
+
+
+def run(shard_count, args):
+    from models import db, User
+    from sharding import shards
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = make_sharded_app(workdir, shard_count)
+        with app.app_context():
+            users = [User(username=f'writer{i}', email=f'writer{i}@example.com', password_hash='x')
+                     for i in range(args.writers)]
+            db.session.add_all(users)
+            db.session.commit()
+            user_ids = [user.id for user in users]
+            distribution = Counter(shards.shard_for(user_id) for user_id in user_ids)
+
+        rows_per_writer = args.rows // args.writers
+        threads = [
+            threading.Thread(target=write_rows, args=(app, user_id, rows_per_writer, args.batch_size, args.text_words))
+            for user_id in user_ids
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+    rows = rows_per_writer * args.writers
+    return {
+        'shards': shard_count,
+        'writers': args.writers,
+        'rows': rows,
+        'seconds': round(seconds, 2),
+        'rows_per_sec': round(rows / seconds),
+        'users_per_shard': dict(sorted(distribution.items())),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=20000, help='total rows across all writers')
+    parser.add_argument('--batch-size', type=int, default=100, help='rows per committed transaction')
+    parser.add_argument('--text-words', type=int, default=12)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for shard_count in args.shards:
+        result = run(shard_count, args)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Cold-start import benchmark for the API modules.
+
+Runs ``python -X importtime`` in a fresh interpreter for each sample and
+fails (exit code 1) when:
+
+* any heavy optional dependency is imported at module load, or
+* the median cumulative import time exceeds ``--budget-ms``, or
+* it regresses more than ``--tolerance`` against a ``--baseline`` file.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --output startup.json
+    python benchmarks/startup.py --baseline startup.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = ['analytics', 'batch_processor', 'backup_manager']
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = [
+    'pandas', 'numpy', 'matplotlib', 'boto3', 'botocore',
+    'google.cloud.storage', 'psycopg2', 'pyarrow',
+]
+
+
+def measure_once(modules):
+    """Import modules in a fresh interpreter and parse -X importtime output"""
+    code = 'import ' + ', '.join(modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=API_DIR,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+    
+    total_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        _, cumulative_us, name = line.split('|')
+        imported.add(name.strip())
+        # Nested imports are indented; top-level ones have a single space
+        if not name.startswith('  '):
+            total_us += int(cumulative_us)
+    
+    return total_us / 1000.0, imported
+
+
+def run(modules, samples):
+    timings = []
+    imported = set()
+    for _ in range(samples):
+        total_ms, names = measure_once(modules)
+        timings.append(total_ms)
+        imported |= names
+    
+    heavy = sorted(
+        name for name in imported
+        if any(name == mod or name.startswith(mod + '.') for mod in HEAVY_MODULES)
+    )
+    return {
+        'modules': modules,
+        'samples': samples,
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'heavy_imports': heavy,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1000.0)
+    parser.add_argument('--baseline', help='previous --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown against the baseline')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+    
+    result = run(args.modules, args.samples)
+    print(json.dumps(result, indent=2))
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    
+    failures = []
+    if result['heavy_imports']:
+        failures.append(f"heavy modules imported at startup: {', '.join(result['heavy_imports'])}")
+    
+    if result['median_ms'] > args.budget_ms:
+        failures.append(f"median import time {result['median_ms']}ms exceeds budget {args.budget_ms}ms")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        limit = baseline['median_ms'] * (1 + args.tolerance)
+        if result['median_ms'] > limit:
+            failures.append(
+                f"median import time {result['median_ms']}ms regressed past "
+                f"{limit:.2f}ms (baseline {baseline['median_ms']}ms)"
+            )
+    
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""Benchmark suite for batch import/export and the CRUD/search routes.
+
+``run`` generates synthetic sayings datasets and measures, each case in a
+fresh subprocess against a temp SQLite database:
+
+* import_csv, export_csv, export_json: rows/sec and peak RSS per size
+* app_save_data: APP.py's whole-file JSON rewrite at each size
+* crud: per-request latency percentiles for the sayings routes of
+  appIntegral through the Flask test client
+
+``compare`` checks a run against a baseline and exits 1 when throughput,
+latency or memory regressed by more than ``--tolerance``.
+
+Usage:
+    python benchmarks/suite.py run --rows 10000 100000 1000000 --output results.json
+    python benchmarks/suite.py run --rows 10000 --crud-rows 5000 --text-words 30 --categories 200
+    python benchmarks/suite.py compare baseline.json results.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import API_DIR, make_app, create_user, synthetic_sayings, write_csv, peak_rss_mb
+
+BATCH_CASES = ['import_csv', 'export_csv', 'export_json', 'app_save_data']
+
+# metric -> True when higher is better
+METRICS = {
+    'rows_per_sec': True,
+    'peak_rss_mb': False,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def throughput(case, rows, elapsed):
+    return {
+        'case': case,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed) if elapsed else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def case_import_csv(spec):
+    from batch_processor import BatchProcessor
+
+    app = make_app(spec['db_path'])
+    with app.app_context():
+        user_id = create_user()
+        started = time.perf_counter()
+        with open(spec['csv_path'], 'rb') as f:
+            success, result = BatchProcessor.import_csv(f, user_id, on_duplicate=None)
+        elapsed = time.perf_counter() - started
+
+    if not success:
+        raise RuntimeError(result)
+    return throughput('import_csv', result['success_count'], elapsed)
+
+
+def case_export(spec, file_format):
+    from batch_processor import BatchProcessor
+    from models import User
+
+    app = make_app(spec['db_path'])
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').one().id
+        chunks = (BatchProcessor.iter_export_csv(user_id) if file_format == 'csv'
+                  else BatchProcessor.iter_export_json(user_id))
+        started = time.perf_counter()
+        with open(os.devnull, 'w', encoding='utf-8') as sink:
+            for chunk in chunks:
+                sink.write(chunk)
+        elapsed = time.perf_counter() - started
+    return throughput(f'export_{file_format}', spec['rows'], elapsed)
+
+
+def case_app_save_data(spec):
+    """One save_data() call of APP.py holding spec['rows'] sayings"""
+    os.chdir(spec['workdir'])
+    import APP
+
+    APP.DATA_FILE = str(Path(spec['workdir']) / 'sayings_data.json')
+    APP.sayings_data = [
+        dict(saying, id=i, created_date='2024-01-01T00:00:00', last_modified='2024-01-01T00:00:00')
+        for i, saying in enumerate(synthetic_sayings(spec['rows'], spec['text_words'], spec['categories']), 1)
+    ]
+    APP.next_id = spec['rows'] + 1
+
+    started = time.perf_counter()
+    APP.save_data()
+    elapsed = time.perf_counter() - started
+    return throughput('app_save_data', spec['rows'], elapsed)
+
+
+def case_crud(spec):
+    """Latency of the sayings routes in appIntegral over spec['requests'] calls each"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{spec['db_path']}"
+    os.chdir(spec['workdir'])  # background workers keep their files here
+    import appIntegral
+    from flask_jwt_extended import create_access_token
+    from batch_processor import BatchProcessor
+    from models import db, Saying, User
+
+    app = appIntegral.app
+    with app.app_context():
+        user_id = create_user()
+        with open(spec['csv_path'], 'rb') as f:
+            BatchProcessor.import_csv(f, user_id)
+        # Tokens carry the user's uuid (see auth.init_auth) while the routes
+        # read the identity back as a user id; make the two agree
+        user = db.session.get(User, user_id)
+        user.uuid = str(user_id)
+        db.session.commit()
+        token = create_access_token(identity=user)
+        ids = [saying_id for (saying_id,) in db.session.query(Saying.id).filter_by(user_id=user_id)]
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    rng = random.Random(spec['seed'])
+    words = ['journey', 'knowledge', 'time', 'power', 'step']
+    created = []
+
+    def create(i):
+        response = client.post('/api/sayings', headers=headers, json={
+            'content': f'benchmark saying {i}', 'author': 'Bench', 'category': 'Life'
+        })
+        if response.status_code == 201:
+            created.append(response.get_json()['data']['id'])
+        return response
+
+    routes = [
+        ('GET /api/sayings', lambda i: client.get('/api/sayings', headers=headers)),
+        ('GET /api/sayings/<id>', lambda i: client.get(f'/api/sayings/{rng.choice(ids)}', headers=headers)),
+        ('GET /api/sayings/search', lambda i: client.get(
+            '/api/sayings/search', headers=headers, query_string={'q': rng.choice(words)})),
+        ('POST /api/sayings', create),
+        ('PUT /api/sayings/<id>', lambda i: client.put(
+            f'/api/sayings/{rng.choice(ids)}', headers=headers, json={'author': f'Editor {i}'})),
+        ('DELETE /api/sayings/<id>', lambda i: client.delete(f'/api/sayings/{created.pop()}', headers=headers)),
+    ]
+
+    results = []
+    for route, call in routes:
+        # GET /api/sayings returns every row, so it gets fewer iterations
+        count = min(spec['requests'], 20) if route == 'GET /api/sayings' else spec['requests']
+        if route.startswith('DELETE'):
+            count = min(count, len(created))
+
+        latencies = []
+        statuses = {}
+        for i in range(count):
+            started = time.perf_counter()
+            response = call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        latencies.sort()
+        results.append({
+            'case': 'crud',
+            'route': route,
+            'rows': spec['rows'],
+            'requests': count,
+            'statuses': {str(code): n for code, n in sorted(statuses.items())},
+            'mean_ms': round(sum(latencies) / count, 3) if count else None,
+            'p50_ms': round(percentile(latencies, 0.50), 3) if count else None,
+            'p95_ms': round(percentile(latencies, 0.95), 3) if count else None,
+            'p99_ms': round(percentile(latencies, 0.99), 3) if count else None,
+        })
+
+    appIntegral.view_counter.stop()
+    appIntegral.endpoint_sketches.stop()
+    appIntegral.import_jobs.stop()
+    return results
+
+
+def run_child(spec):
+    case = spec['case']
+    if case == 'import_csv':
+        return case_import_csv(spec)
+    if case in ('export_csv', 'export_json'):
+        return case_export(spec, case.split('_')[1])
+    if case == 'app_save_data':
+        return case_app_save_data(spec)
+    if case == 'crud':
+        return case_crud(spec)
+    raise ValueError(f"Unknown case: {case}")
+
+
+def spawn(spec):
+    """Run one case in a fresh interpreter so peak RSS is its own"""
+    child = subprocess.run(
+        [sys.executable, __file__, 'child', json.dumps(spec)],
+        cwd=API_DIR, capture_output=True, text=True
+    )
+    if child.returncode != 0:
+        raise RuntimeError(f"{spec['case']} failed:\n{child.stderr[-2000:]}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    results = []
+
+    def report(result):
+        for item in result if isinstance(result, list) else [result]:
+            results.append(item)
+            print(json.dumps(item), file=sys.stderr)
+
+    dataset = {'text_words': args.text_words, 'categories': args.categories, 'seed': args.seed}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sorted(args.rows):
+            csv_path = Path(workdir) / f'sayings_{rows}.csv'
+            db_path = Path(workdir) / f'bench_{rows}.db'
+            write_csv(csv_path, rows, **dataset)
+
+            spec = {'rows': rows, 'csv_path': str(csv_path), 'db_path': str(db_path), 'workdir': workdir, **dataset}
+            for case in args.cases:
+                # Exports read the database the import case filled
+                report(spawn(dict(spec, case=case)))
+            os.remove(csv_path)
+            if db_path.exists():
+                os.remove(db_path)
+
+        if args.crud_rows:
+            csv_path = Path(workdir) / 'crud.csv'
+            write_csv(csv_path, args.crud_rows, **dataset)
+            report(spawn({
+                'case': 'crud', 'rows': args.crud_rows, 'requests': args.requests,
+                'csv_path': str(csv_path), 'db_path': str(Path(workdir) / 'crud.db'), 'workdir': workdir,
+                **dataset
+            }))
+
+    output = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rows': sorted(args.rows),
+            'crud_rows': args.crud_rows,
+            'requests': args.requests,
+            **dataset,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            return compare(json.load(f), output, args.tolerance)
+    return 0
+
+
+def result_key(result):
+    return (result['case'], result.get('route'), result['rows'])
+
+
+def compare(baseline, current, tolerance):
+    """Print metric changes against baseline; 1 if anything regressed"""
+    previous = {result_key(result): result for result in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        name = ' '.join(str(part) for part in result_key(result) if part is not None)
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSION' if worse > tolerance else ''
+            print(f"{name:<45} {metric:<13} {old:>12} -> {new:>12} {change:+8.1%} {flag}")
+            if flag:
+                regressions.append(f"{name} {metric}")
+
+    for regression in regressions:
+        print(f"FAIL: {regression} regressed more than {tolerance:.0%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='dataset sizes for the batch cases (10k to 10M)')
+    run_parser.add_argument('--cases', nargs='+', choices=BATCH_CASES, default=BATCH_CASES)
+    run_parser.add_argument('--text-words', type=int, default=12, help='words per saying')
+    run_parser.add_argument('--categories', type=int, default=8, help='category cardinality')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--crud-rows', type=int, default=10000,
+                            help='rows owned by the user in the CRUD case (0 to skip)')
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per CRUD route')
+    run_parser.add_argument('--output', help='write results as JSON to this file')
+    run_parser.add_argument('--baseline', help='compare against a previous --output file')
+    run_parser.add_argument('--tolerance', type=float, default=0.15)
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.15)
+
+    child_parser = commands.add_parser('child')
+    child_parser.add_argument('spec')
+
+    args = parser.parse_args(argv)
+    if args.command == 'child':
+        print(json.dumps(run_child(json.loads(args.spec))))
+        return 0
+    if args.command == 'compare':
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        return compare(baseline, current, args.tolerance)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Backup upload wall time against local S3 and GCS stand-ins.
+
+The stand-ins keep objects in memory and simulate each link: every
+request costs a round trip plus size / per-connection throughput, and the
+link as a whole is capped at its bandwidth. A fraction of requests can be
+made to fail to exercise retries. Compares the old behaviour (S3, then
+GCS, one stream each) with CloudUploader and checks the uploaded objects
+match the file byte for byte.
+
+Usage:
+    python benchmarks/uploads.py --size-mb 64 --s3-mbps 40 --gcs-mbps 25 --failure-rate 0.05
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from common import API_DIR  # noqa: F401  (puts the API on sys.path)
+from cloud_upload import CloudUploader, RateLimiter, S3Target, GCSTarget
+
+MB = 1 << 20
+
+
+class TransientError(Exception):
+    pass
+
+
+class Link:
+    def __init__(self, bandwidth, connection_bandwidth, latency, failure_rate, seed):
+        self.limiter = RateLimiter(bandwidth)
+        self.connection_bandwidth = connection_bandwidth
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, size):
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        self.limiter.consume(size)
+        time.sleep(self.latency + size / self.connection_bandwidth)
+        if fail:
+            raise TransientError('simulated connection reset')
+
+
+class FakeS3:
+    """The subset of the boto3 S3 client CloudUploader uses"""
+
+    def __init__(self, link):
+        self.link = link
+        self.objects = {}
+        self._uploads = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.link.send(len(Body))
+        self.objects[Key] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.link.send(0)
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.link.send(len(Body))
+        self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.link.send(0)
+        parts = self._uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._uploads.pop(UploadId, None)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_file(self, file_obj, size=None):
+        data = file_obj.read()
+        self.bucket.link.send(len(data))
+        self.bucket.objects[self.name] = data
+
+    def compose(self, sources):
+        self.bucket.link.send(0)
+        self.bucket.objects[self.name] = b''.join(self.bucket.objects[blob.name] for blob in sources)
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeGCS:
+    """The subset of google.cloud.storage.Client CloudUploader uses"""
+
+    def __init__(self, link):
+        self.link = link
+        self.objects = {}
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name)
+
+
+def sequential_upload(path, key, s3, gcs):
+    """What create_backup used to do: one whole-file upload per target, in turn"""
+    data = Path(path).read_bytes()
+    for attempt in range(5):
+        try:
+            s3.put_object(Bucket='backups', Key=key, Body=data)
+            break
+        except TransientError:
+            pass
+    for attempt in range(5):
+        try:
+            gcs.blob(key).upload_from_file(io.BytesIO(data))
+            break
+        except TransientError:
+            pass
+
+
+def make_links(args, seed):
+    s3 = FakeS3(Link(args.s3_mbps * MB, args.connection_mbps * MB, args.latency_ms / 1000, args.failure_rate, seed))
+    gcs = FakeGCS(Link(args.gcs_mbps * MB, args.connection_mbps * MB, args.latency_ms / 1000, args.failure_rate, seed + 1))
+    return s3, gcs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--s3-mbps', type=float, default=40, help='S3 link bandwidth, MB/s')
+    parser.add_argument('--gcs-mbps', type=float, default=25, help='GCS link bandwidth, MB/s')
+    parser.add_argument('--connection-mbps', type=float, default=10, help='throughput of a single connection, MB/s')
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--part-mb', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / 'backup.zip'
+        with open(path, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(MB))
+        expected = path.read_bytes()
+
+        results = []
+        s3, gcs = make_links(args, seed=1)
+        started = time.perf_counter()
+        sequential_upload(path, path.name, s3, gcs)
+        results.append({'mode': 'sequential', 'seconds': round(time.perf_counter() - started, 2)})
+
+        s3, gcs = make_links(args, seed=1)
+        uploader = CloudUploader(
+            [S3Target(s3, 'backups', args.part_mb * MB), GCSTarget(gcs, 'backups', args.part_mb * MB)],
+            workers=args.workers, backoff=0.05
+        )
+        started = time.perf_counter()
+        uploader.upload([(path, path.name)])
+        results.append({'mode': 'concurrent', 'seconds': round(time.perf_counter() - started, 2)})
+
+        if s3.objects != {path.name: expected} or gcs.objects != {path.name: expected}:
+            raise RuntimeError('Uploaded objects do not match the source file')
+
+    floor = args.size_mb / min(args.s3_mbps, args.gcs_mbps)
+    for result in results:
+        result.update(size_mb=args.size_mb, slower_link_seconds=round(floor, 2))
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
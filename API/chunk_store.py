@@ -0,0 +1,161 @@
+"""Content-addressed chunk storage for deduplicated backups.
+
+Backup entries are split into content-defined chunks, each stored once
+under its sha256 (zlib-compressed) no matter how many backups use it. A
+backup then only needs a small manifest listing its chunks.
+
+Chunk boundaries are chosen per NDJSON line: a chunk ends after a line
+whose crc32 falls below a threshold proportional to the line's length,
+so the expected chunk size is ``target_size`` bytes and boundaries only
+depend on nearby content. Editing, inserting or deleting a saying
+changes the chunk holding it and leaves the rest of the backup identical
+to the previous one. Compressing the whole archive first would defeat
+this, since a deflate stream differs entirely after the first change.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from pathlib import Path
+
+
+def iter_chunks(lines, target_size=64 << 10, min_size=16 << 10, max_size=256 << 10):
+    """Group encoded lines into content-defined chunks of about target_size bytes"""
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size < min_size:
+            continue
+        if size >= max_size or zlib.crc32(line) < (len(line) << 32) // target_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+class ChunkStore:
+    """Compressed chunks on local disk at root/<2 hex chars>/<sha256>"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        return self.root / digest[:2] / digest
+
+    def has(self, digest):
+        return self.path(digest).exists()
+
+    def put(self, data):
+        """Store data; returns (digest, stored size, whether it was new)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            # Fresh mtime tells garbage collection this chunk is in use again
+            os.utime(path)
+            return digest, path.stat().st_size, False
+
+        path.parent.mkdir(exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        # Write then rename so readers never see a partial chunk
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest, len(compressed), True
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return data
+
+    def delete(self, digest):
+        path = self.path(digest)
+        if path.exists():
+            path.unlink()
+
+    def iter_digests(self):
+        for directory in self.root.iterdir():
+            if directory.is_dir():
+                for path in directory.iterdir():
+                    if not path.name.startswith('.tmp-'):
+                        yield path.name
+
+
+class ChunkedBackupWriter:
+    """Same interface as BackupArchiveWriter, writing to a ChunkStore.
+
+    The backup itself is a JSON manifest at ``path`` mapping each entry to
+    its ordered chunk digests, written last.
+    """
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = Path(path)
+        self.entries = {}       # name -> {'size', 'sha256', 'records', 'chunks'}
+        self.chunks = {}        # digest -> stored size, for every chunk referenced
+        self.new_chunks = []    # digests this backup added to the store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.path.exists():
+            self.path.unlink()
+
+    def write_lines(self, name, items):
+        """Write items as NDJSON to entry name; returns the number written"""
+        digest = hashlib.sha256()
+        counter = {'records': 0, 'size': 0}
+
+        def encoded():
+            for item in items:
+                line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+                digest.update(line)
+                counter['records'] += 1
+                counter['size'] += len(line)
+                yield line
+
+        chunks = [self._put(chunk) for chunk in iter_chunks(encoded())]
+        self.entries[name] = dict(counter, sha256=digest.hexdigest(), chunks=chunks)
+        return counter['records']
+
+    def write_json(self, name, data):
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        self.entries[name] = {
+            'size': len(payload),
+            'sha256': hashlib.sha256(payload).hexdigest(),
+            'chunks': [self._put(payload)],
+        }
+
+    def write_manifest(self, manifest):
+        """Write the backup manifest, which must come last"""
+        document = dict(manifest, storage='chunks', files=self.entries)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def _put(self, data):
+        digest, stored_size, is_new = self.store.put(data)
+        self.chunks[digest] = stored_size
+        if is_new:
+            self.new_chunks.append(digest)
+        return digest
+
+
+def iter_entry(store, entry):
+    """Yield the bytes of one entry of a chunked backup manifest, chunk by chunk"""
+    for digest in entry['chunks']:
+        yield store.get(digest)
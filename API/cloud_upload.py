@@ -0,0 +1,252 @@
+"""Concurrent backup uploads to S3 and GCS.
+
+Files are split into parts uploaded from a shared thread pool: S3 parts
+through a multipart upload, GCS parts as temporary objects (each a
+resumable upload) composed into the final object. Both targets upload at
+the same time, so the wall time approaches that of the slower link rather
+than the sum of the two. Every part is retried with exponential backoff,
+and each target can be held to a bandwidth limit.
+
+Targets only use the client calls below, so any object providing them
+(boto3, google-cloud-storage, or a local stand-in) works.
+"""
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+# S3 allows at most 10000 parts per upload, GCS at most 32 sources per compose
+S3_MAX_PARTS = 10000
+GCS_MAX_COMPOSE = 32
+
+
+class RateLimiter:
+    """Admits bytes at no more than rate bytes per second across threads"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, size):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _read_range(path, offset, length):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class FileRange(io.RawIOBase):
+    """Seekable read-only view of length bytes of a file from offset.
+
+    Reads come straight from the file in the caller's read size, so a
+    stream consumer holds one read's worth of the range in memory at a
+    time. limiter, if given, is charged for every byte read.
+    """
+
+    def __init__(self, path, offset, length, limiter=None):
+        self._file = open(path, 'rb')
+        self.offset = offset
+        self.length = length
+        self.limiter = limiter
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self.length
+        self._position = min(max(position, 0), self.length)
+        return self._position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.length - self._position)
+        if size <= 0:
+            return 0
+        self._file.seek(self.offset + self._position)
+        count = self._file.readinto(memoryview(buffer)[:size])
+        self._position += count
+        if self.limiter:
+            self.limiter.consume(count)
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _noop(*args):
+    pass
+
+
+class S3Target:
+    name = 's3'
+
+    def __init__(self, client, bucket, part_size=8 << 20, bandwidth=None):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.limiter = RateLimiter(bandwidth) if bandwidth else None
+
+    def begin(self, path, key):
+        """Start uploading path; returns (parts, complete, abort).
+
+        Each part is a callable safe to retry; complete takes their results
+        in order.
+        """
+        size = Path(path).stat().st_size
+        if size <= self.part_size:
+            return [partial(self._put_object, path, key, size)], _noop, _noop
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+        part_size = max(self.part_size, -(-size // S3_MAX_PARTS))
+        parts = [
+            partial(self._upload_part, path, key, upload_id, number, offset, min(part_size, size - offset))
+            for number, offset in enumerate(range(0, size, part_size), start=1)
+        ]
+
+        def complete(results):
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': results}
+            )
+
+        def abort():
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+        return parts, complete, abort
+
+    def _read(self, path, offset, length):
+        data = _read_range(path, offset, length)
+        if self.limiter:
+            self.limiter.consume(len(data))
+        return data
+
+    def _put_object(self, path, key, size):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=self._read(path, 0, size))
+
+    def _upload_part(self, path, key, upload_id, number, offset, length):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            PartNumber=number, Body=self._read(path, offset, length)
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+
+class GCSTarget:
+    name = 'gcs'
+
+    def __init__(self, client, bucket, part_size=8 << 20, bandwidth=None, chunk_size=8 << 20):
+        self.bucket = client.bucket(bucket)
+        self.part_size = part_size
+        # Resumable upload chunk size; must be a multiple of 256 KiB
+        self.chunk_size = chunk_size
+        self.limiter = RateLimiter(bandwidth) if bandwidth else None
+
+    def begin(self, path, key):
+        """Start uploading path; returns (parts, complete, abort) as S3Target.begin"""
+        size = Path(path).stat().st_size
+        if size <= self.part_size:
+            return [partial(self._upload, key, path, 0, size)], _noop, _noop
+
+        part_size = max(self.part_size, -(-size // GCS_MAX_COMPOSE))
+        names = [f'{key}.part-{index:02d}' for index in range(-(-size // part_size))]
+        parts = [
+            partial(self._upload, name, path, offset, min(part_size, size - offset))
+            for name, offset in zip(names, range(0, size, part_size))
+        ]
+
+        def complete(results):
+            self.bucket.blob(key).compose([self.bucket.blob(name) for name in names])
+            self._delete(names)
+
+        def abort():
+            self._delete(names)
+
+        return parts, complete, abort
+
+    def _upload(self, name, path, offset, length):
+        # Parts grow to size / GCS_MAX_COMPOSE; the resumable upload reads
+        # them chunk_size bytes at a time instead of holding them whole
+        blob = self.bucket.blob(name, chunk_size=self.chunk_size)
+        with FileRange(path, offset, length, self.limiter) as stream:
+            blob.upload_from_file(stream, size=length)
+
+    def _delete(self, names):
+        for name in names:
+            blob = self.bucket.blob(name)
+            if blob.exists():
+                blob.delete()
+
+
+class CloudUploader:
+    """Uploads files to every target concurrently"""
+
+    def __init__(self, targets, workers=8, retries=5, backoff=0.5, logger=None):
+        self.targets = targets
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logger
+
+    def upload(self, files):
+        """Upload (path, key) pairs to all targets; raises if any upload fails.
+
+        Uploads that were started are aborted on failure, so no target is
+        left with a partial object under any of the keys.
+        """
+        uploads = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for target in self.targets:
+                    for path, key in files:
+                        parts, complete, abort = self._retry(partial(target.begin, path, key), target, key)
+                        futures = [pool.submit(self._retry, part, target, key) for part in parts]
+                        uploads.append((futures, complete, abort))
+
+                for index, (futures, complete, abort) in enumerate(uploads):
+                    complete([future.result() for future in futures])
+                    uploads[index] = None
+        except BaseException:
+            for upload in uploads:
+                if upload is not None:
+                    self._abort(upload[2])
+            raise
+
+    def _retry(self, call, target, key):
+        for attempt in range(self.retries):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    raise
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                if self.logger:
+                    self.logger.warning(f"Upload of {key} to {target.name} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _abort(self, abort):
+        try:
+            abort()
+        except Exception:
+            if self.logger:
+                self.logger.exception("Aborting upload failed")
@@ -0,0 +1,149 @@
+"""Parquet and Arrow IPC support for sayings export/import.
+
+pyarrow is optional: it is imported on first use, and callers get a
+ColumnarUnavailable error when it is not installed.
+"""
+import io
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+# Exported columns, in EXPORT_CSV_COLUMNS order
+EXPORT_COLUMNS = ['id', 'content', 'author', 'category', 'tags',
+                  'language', 'source', 'rating', 'view_count',
+                  'is_public', 'created_at', 'updated_at']
+
+
+class ColumnarUnavailable(RuntimeError):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ColumnarUnavailable("Parquet/Arrow support requires pyarrow")
+    return pyarrow
+
+
+def export_schema():
+    """Typed Arrow schema for exported sayings"""
+    pa = _pyarrow()
+    return pa.schema([
+        ('id', pa.int64()),
+        ('content', pa.string()),
+        ('author', pa.string()),
+        ('category', pa.string()),
+        ('tags', pa.list_(pa.string())),
+        ('language', pa.string()),
+        ('source', pa.string()),
+        ('rating', pa.float64()),
+        ('view_count', pa.int64()),
+        ('is_public', pa.bool_()),
+        ('created_at', pa.timestamp('us')),
+        ('updated_at', pa.timestamp('us')),
+    ])
+
+
+def rows_to_batch(rows, schema):
+    """Build a RecordBatch from row tuples in EXPORT_COLUMNS order"""
+    pa = _pyarrow()
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+
+    # tags is a free-form JSON column; coerce entries to strings
+    tags = EXPORT_COLUMNS.index('tags')
+    columns[tags] = [
+        [str(tag) for tag in value] if isinstance(value, list) else None
+        for value in columns[tags]
+    ]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that keeps written bytes until drained.
+
+    tell() reports the total written so far, which the Parquet and IPC
+    writers use for footer offsets even though the data has been handed on.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_encode(batches, file_format, schema, compression='zstd'):
+    """Encode RecordBatches as a Parquet or Arrow IPC file, yielding bytes.
+
+    Each batch becomes one Parquet row group (or IPC record batch) and is
+    yielded as soon as it is written; the file footer comes last.
+    """
+    pa = _pyarrow()
+    sink = _ChunkSink()
+    if file_format == 'parquet':
+        writer = pa.parquet.ParquetWriter(sink, schema, compression=compression)
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    try:
+        for batch in batches:
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_frames(source, file_format, batch_size=20000):
+    """Read a Parquet or Arrow IPC file as DataFrames of up to batch_size rows.
+
+    source must be seekable (both formats keep their metadata in a footer).
+    Arrow input may be either the IPC file or the IPC stream format.
+    """
+    pa = _pyarrow()
+    if file_format == 'parquet':
+        batches = pa.parquet.ParquetFile(source).iter_batches(batch_size=batch_size)
+    else:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pa.ipc.open_stream(source)
+
+    for batch in batches:
+        # IPC files keep the writer's batch sizes, which may be arbitrarily large
+        for offset in range(0, batch.num_rows, batch_size):
+            part = batch.slice(offset, batch_size)
+            frame = part.to_pandas()
+            if 'tags' in frame.columns:
+                # List columns convert to numpy arrays; the validators expect lists
+                frame['tags'] = part.column('tags').to_pylist()
+            yield frame
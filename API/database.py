@@ -1,11 +1,38 @@
+import contextvars
+import sqlalchemy as sa
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.sql.util import find_tables
 from flask_migrate import Migrate
 
+# Tables whose rows live on the owning user's shard (see sharding.py)
+SHARDED_TABLES = ('sayings', 'saying_tombstones')
+
+# Bind key of the shard statements on SHARDED_TABLES go to; None for the default database
+current_shard = contextvars.ContextVar('current_shard', default=None)
+
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+class ShardedSession(Session):
+    """Session that sends statements on sharded tables to the current shard"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = current_shard.get()
+        if bind is None and shard is not None and _is_sharded(mapper, clause):
+            return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _is_sharded(mapper, clause):
+    if mapper is not None:
+        return sa.inspect(mapper).local_table.name in SHARDED_TABLES
+    if clause is not None:
+        return any(getattr(table, 'name', None) in SHARDED_TABLES
+                   for table in find_tables(clause, include_crud=True))
+    return False
+
+db = SQLAlchemy(model_class=Base, session_options={'class_': ShardedSession})
 migrate = Migrate()
 
 def init_db(app):
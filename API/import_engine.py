@@ -0,0 +1,715 @@
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError
+from models import db, Saying
+
+# Values used when an optional column is missing or blank
+SAYING_DEFAULTS = {
+    'author': 'Unknown',
+    'category': 'General',
+    'language': 'en',
+    'source': '',
+}
+
+# Column sizes from the Saying model
+MAX_LENGTHS = {
+    'author': 200,
+    'category': 100,
+    'language': 10,
+    'source': 200,
+}
+
+INSERT_COLUMNS = [
+    'uuid', 'content', 'author', 'category', 'tags', 'language', 'source',
+    'rating', 'view_count', 'is_public', 'created_at', 'updated_at', 'user_id',
+    'content_hash',
+]
+
+# Columns taken from typed (columnar) input instead of their defaults
+TYPED_COLUMNS = ('rating', 'view_count', 'is_public', 'created_at')
+
+# What to do with a row whose content already exists for the user
+DUPLICATE_POLICIES = ('skip', 'update', 'error')
+
+# Largest single item of a JSON array, in characters
+MAX_JSON_ITEM_SIZE = 1 << 20
+
+# Columns refreshed from the imported row under the 'update' policy
+UPDATE_COLUMNS = ['content', 'author', 'category', 'tags', 'language', 'source', 'updated_at']
+
+_USER_ID = INSERT_COLUMNS.index('user_id')
+_CONTENT_HASH = INSERT_COLUMNS.index('content_hash')
+
+_TAG_ERROR = object()
+
+
+def _parse_tags(value):
+    """Tags arrive as JSON text (CSV) or already decoded (JSON imports)"""
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return _TAG_ERROR
+    return value if isinstance(value, list) else _TAG_ERROR
+
+
+def normalize_frame(df, user_id, first_line=2, lines=None, typed=False):
+    """Validate and normalize a DataFrame of sayings column by column.
+
+    ``first_line`` is the source line of the first row (2 for a CSV with a
+    header); pass ``lines`` instead when rows are not consecutive. Returns
+    ``(rows, lines, errors)``: insertable tuples in INSERT_COLUMNS order, the
+    source line of each row, and ``(line, message)`` tuples for rejected rows.
+
+    With ``typed`` (Parquet and Arrow frames) the TYPED_COLUMNS present in
+    the frame are imported too; missing cells get the usual defaults.
+    """
+    import pandas as pd
+
+    df = df.reset_index(drop=True)
+    if lines is None:
+        lines = range(first_line, first_line + len(df))
+    lines = pd.Series(lines, index=df.index, dtype='int64')
+    errors = []
+    valid = pd.Series(True, index=df.index)
+
+    def reject(mask, message):
+        mask = mask & valid
+        errors.extend((int(line), message) for line in lines[mask])
+        valid[mask] = False
+
+    if 'content' in df.columns:
+        content = df['content'].astype('string').str.strip()
+    else:
+        content = pd.Series(pd.NA, index=df.index, dtype='string')
+    reject(content.isna() | (content == ''), "Content is required")
+
+    columns = {'content': content}
+    for column, default in SAYING_DEFAULTS.items():
+        if column in df.columns:
+            values = df[column].astype('string').str.strip().fillna('')
+            values = values.mask(values == '', default)
+        else:
+            values = pd.Series(default, index=df.index, dtype='string')
+
+        limit = MAX_LENGTHS[column]
+        reject(values.str.len() > limit, f"{column} exceeds {limit} characters")
+        columns[column] = values
+
+    # Only non-missing tags cells need the (per-value) JSON decoder
+    tags = {}
+    if 'tags' in df.columns:
+        parsed = df['tags'].dropna().map(_parse_tags)
+        bad = pd.Series(False, index=df.index)
+        # pandas refuses to assign an empty object Series into a bool one
+        if len(parsed):
+            bad[parsed.index] = parsed.map(lambda value: value is _TAG_ERROR)
+        reject(bad, "tags must be a JSON array")
+        tags = {index: value for index, value in parsed.items() if value is not _TAG_ERROR}
+
+    now = datetime.utcnow()
+    typed_columns = {}
+    if typed:
+        typed_columns = _typed_columns(df, reject, now)
+
+    errors.sort()
+    count = int(valid.sum())
+    if not count:
+        return [], [], errors
+
+    def typed_or(name, default):
+        return typed_columns[name][valid].tolist() if name in typed_columns else repeat(default)
+
+    indexes = df.index[valid].tolist()
+    rows = list(zip(
+        _uuid4_strings(count),
+        *(columns[name][valid].tolist() for name in ('content', 'author', 'category')),
+        [tags.get(index) for index in indexes],
+        *(columns[name][valid].tolist() for name in ('language', 'source')),
+        typed_or('rating', 0.0),
+        typed_or('view_count', 0),
+        typed_or('is_public', True),
+        typed_or('created_at', now),
+        repeat(now),    # updated_at
+        repeat(user_id),
+        columns['content'][valid].map(Saying.hash_content).tolist()
+    ))
+    return rows, lines[valid].tolist(), errors
+
+
+def _typed_columns(df, reject, now):
+    """Validate the TYPED_COLUMNS present in df; returns {column: values}"""
+    import pandas as pd
+
+    columns = {}
+    if 'rating' in df.columns:
+        rating = pd.to_numeric(df['rating'], errors='coerce')
+        reject(rating.isna() & df['rating'].notna(), "rating must be a number")
+        columns['rating'] = rating.fillna(0.0).astype('float64')
+
+    if 'view_count' in df.columns:
+        views = pd.to_numeric(df['view_count'], errors='coerce')
+        bad = views.notna() & ((views < 0) | (views % 1 != 0))
+        reject((views.isna() & df['view_count'].notna()) | bad, "view_count must be a non-negative integer")
+        columns['view_count'] = views.where(~bad, 0).fillna(0).astype('int64')
+
+    if 'is_public' in df.columns:
+        is_public = df['is_public']
+        reject(is_public.notna() & ~is_public.isin([True, False]), "is_public must be a boolean")
+        columns['is_public'] = is_public.where(is_public.notna(), True).astype(bool)
+
+    if 'created_at' in df.columns:
+        created = pd.to_datetime(df['created_at'], errors='coerce', utc=True)
+        reject(created.isna() & df['created_at'].notna(), "created_at must be a timestamp")
+        # Stored as naive UTC, like the model's defaults
+        created = created.dt.tz_localize(None)
+        columns['created_at'] = pd.Series(
+            [now if value is pd.NaT else value.to_pydatetime() for value in created], index=df.index, dtype=object
+        )
+    return columns
+
+
+def _uuid4_strings(count):
+    """Generate random UUID4 strings in bulk (uuid.uuid4() is ~2us each)"""
+    raw = bytearray(os.urandom(16 * count))
+    for offset in range(0, len(raw), 16):
+        raw[offset + 6] = (raw[offset + 6] & 0x0F) | 0x40  # version 4
+        raw[offset + 8] = (raw[offset + 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_digits = raw.hex()
+    return [
+        f"{hex_digits[i:i + 8]}-{hex_digits[i + 8:i + 12]}-{hex_digits[i + 12:i + 16]}-"
+        f"{hex_digits[i + 16:i + 20]}-{hex_digits[i + 20:i + 32]}"
+        for i in range(0, 32 * count, 32)
+    ]
+
+
+class ImportFormatError(ValueError):
+    """The input is not structurally valid for its format"""
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Binary stream that replays already-read bytes before the rest of a stream"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def sniff_json_format(stream):
+    """Return ``('json' | 'ndjson', stream)`` from the first non-blank byte"""
+    head = b''
+    while not head.strip():
+        block = stream.read(64)
+        if not block:
+            break
+        head += block
+    json_format = 'json' if head.lstrip().startswith(b'[') else 'ndjson'
+    return json_format, io.BufferedReader(_PrefixedStream(head, stream))
+
+
+def iter_json_array(stream, buffer_size=1 << 16, max_item_size=MAX_JSON_ITEM_SIZE):
+    """Incrementally parse a top-level JSON array from a binary stream.
+
+    Yields ``(item_number, item)`` starting at 1 while holding only about
+    one buffer (or the largest single item) in memory. Raises
+    ImportFormatError when the document is malformed or an item is longer
+    than max_item_size characters.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    decoder = json.JSONDecoder()
+    buffer = text.read(buffer_size).lstrip()
+    eof = False
+
+    if not buffer.startswith('['):
+        raise ImportFormatError("JSON must contain an array of sayings")
+    position = 1
+    item_number = 0
+    expect_value = True
+
+    while True:
+        # Skip whitespace and the separators between items
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            more = text.read(buffer_size)
+            eof = not more
+            buffer = buffer[position:] + more
+            position = 0
+
+        if position >= len(buffer):
+            raise ImportFormatError("Unexpected end of JSON array")
+
+        char = buffer[position]
+        if char == ']':
+            if expect_value and item_number:
+                raise ImportFormatError(f"Expected a value after item {item_number}")
+            return
+        if char == ',' and not expect_value:
+            position += 1
+            expect_value = True
+            continue
+        if not expect_value:
+            raise ImportFormatError(f"Expected ',' or ']' after item {item_number}")
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # A value touching the end of the buffer may be truncated (e.g. a number)
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ImportFormatError(f"Invalid JSON in item {item_number + 1}: {e.msg}")
+            complete = False
+
+        if not complete:
+            # Text that never parses would otherwise be buffered up to EOF
+            if len(buffer) - position >= max_item_size:
+                raise ImportFormatError(f"Item {item_number + 1} is larger than {max_item_size} characters")
+            more = text.read(max(buffer_size, len(buffer) - position))
+            eof = not more
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+
+        item_number += 1
+        yield item_number, item
+        position = end
+        expect_value = False
+
+        # Drop consumed text so the buffer stays bounded
+        if position > buffer_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def iter_ndjson(stream):
+    """Parse newline-delimited JSON from a binary stream.
+
+    Yields ``(line_number, item)``; a line that is not valid JSON yields
+    ``(line_number, error)`` with a ``ValueError`` instance instead.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {str(e)}")
+
+
+def _last_record_end(block, quote):
+    """Offset just past the last newline in block that ends a record.
+
+    With ``quote`` set (CSV), a newline only ends a record when it is outside
+    a quoted field, i.e. preceded by an even number of quote characters
+    (escaped quotes are doubled, so parity still holds).
+    """
+    position = block.rfind(b'\n')
+    if quote is None or position == -1:
+        return position + 1 if position != -1 else None
+
+    quotes = block.count(quote, 0, position)
+    while position != -1:
+        if quotes % 2 == 0:
+            return position + 1
+        previous = block.rfind(b'\n', 0, position)
+        quotes -= block.count(quote, previous + 1, position)
+        position = previous
+    return None
+
+
+def split_blocks(stream, block_size=4 << 20, quote=b'"'):
+    """Yield byte blocks of about block_size that end on record boundaries"""
+    carry = b''
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            if carry:
+                yield carry
+            return
+
+        block = carry + data
+        end = _last_record_end(block, quote)
+        if end is None:
+            # A single record longer than the block; keep reading
+            carry = block
+            continue
+        yield block[:end]
+        carry = block[end:]
+
+
+def parse_csv_block(block, header, user_id):
+    """Parse and normalize one CSV block in a worker process.
+
+    Line numbers in the result are relative to the block; returns
+    ``(total, span, rows, lines, errors)`` where span is the number of
+    records the block covers.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(
+        io.BytesIO(header + block),
+        dtype=str,
+        keep_default_na=False,
+        na_values=[''],
+        encoding='utf-8'
+    )
+    rows, lines, errors = normalize_frame(df, user_id, first_line=2)
+    return len(df), len(df), rows, lines, errors
+
+
+def parse_ndjson_block(block, user_id):
+    """Parse and normalize one NDJSON block in a worker process.
+
+    Same result shape as parse_csv_block; span is the number of physical
+    lines in the block.
+    """
+    import pandas as pd
+
+    sayings, lines, errors = [], [], []
+    total = 0
+    text = block.decode('utf-8')
+    physical_lines = text.split('\n')
+    if text.endswith('\n'):
+        physical_lines.pop()
+
+    span = 0
+    for span, line in enumerate(physical_lines, 1):
+        if not line.strip():
+            continue
+        total += 1
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            errors.append((span, f"Invalid JSON: {str(e)}"))
+            continue
+        if isinstance(item, dict):
+            sayings.append(item)
+            lines.append(span)
+        else:
+            errors.append((span, "Saying must be a JSON object"))
+
+    rows, row_lines = [], []
+    if sayings:
+        rows, row_lines, rejected = normalize_frame(pd.DataFrame(sayings), user_id, lines=lines)
+        errors.extend(rejected)
+    return total, span, rows, row_lines, errors
+
+
+class ImportProgress:
+    """Running counters for a chunked import; keeps only the first few errors"""
+
+    def __init__(self, max_errors=10, callback=None, label='Line'):
+        self.max_errors = max_errors
+        self.label = label
+        self.callback = callback
+        self.total = 0
+        self.success_count = 0
+        self.duplicate_count = 0
+        self.error_count = 0
+        self.errors = []
+
+    def record(self, total, inserted, errors, duplicates=0):
+        """Account for one chunk of ``total`` source rows"""
+        self.total += total
+        self.success_count += inserted
+        self.duplicate_count += duplicates
+        self.error_count += total - inserted - duplicates
+
+        room = self.max_errors - len(self.errors)
+        if room > 0:
+            self.errors.extend(sorted(errors)[:room])
+
+        if self.callback:
+            self.callback(self)
+
+    def to_dict(self):
+        return {
+            'success_count': self.success_count,
+            'duplicate_count': self.duplicate_count,
+            'error_count': self.error_count,
+            'total': self.total,
+            'errors': [f"{self.label} {line}: {message}" for line, message in self.errors]
+        }
+
+
+def _copy_value(value):
+    """Encode a value for PostgreSQL COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        value = json.dumps(value, ensure_ascii=False)
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class BulkWriter:
+    """Inserts normalized saying rows in large chunks, one commit per chunk.
+
+    Uses COPY on PostgreSQL (psycopg2) and a driver-level executemany
+    elsewhere; neither builds ORM objects nor per-row parameter dicts.
+
+    With ``on_duplicate`` set, rows whose content hash already exists for
+    the user (in the database or earlier in the same chunk) are skipped,
+    used to update the existing saying, or reported as errors. Lookups are
+    batched IN queries on idx_sayings_user_hash, so re-importing a file
+    costs about one index scan. Without it, a chunk holding a duplicate is
+    rejected as a whole by that unique index.
+    """
+
+    def __init__(self, session=None, chunk_size=20000, on_duplicate=None):
+        if on_duplicate is not None and on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError(f"on_duplicate must be one of {', '.join(DUPLICATE_POLICIES)}")
+
+        self.session = session or db.session
+        self.chunk_size = chunk_size
+        self.on_duplicate = on_duplicate
+
+        # Sayings may live on a shard rather than the default database
+        self.dialect = self.session.get_bind(mapper=Saying).dialect
+        self.use_copy = self.dialect.name == 'postgresql'
+        self.dbapi = getattr(self.dialect, 'loaded_dbapi', None) or self.dialect.dbapi
+
+        # Let each column type encode values the way this dialect expects
+        # (JSON text for tags, datetime strings on SQLite, ...)
+        table = Saying.__table__
+        self._processors = []
+        for position, name in enumerate(INSERT_COLUMNS):
+            processor = table.c[name].type.dialect_impl(self.dialect).bind_processor(self.dialect)
+            if processor:
+                self._processors.append((position, processor))
+
+        marker = {'qmark': '?', 'format': '%s', 'pyformat': '%s'}.get(self.dialect.paramstyle)
+        if marker:
+            placeholders = ', '.join([marker] * len(INSERT_COLUMNS))
+        else:
+            placeholders = ', '.join(f':{i}' for i in range(1, len(INSERT_COLUMNS) + 1))
+        self._insert_sql = (
+            f"INSERT INTO {table.name} ({', '.join(INSERT_COLUMNS)}) VALUES ({placeholders})"
+        )
+
+    def write(self, rows, lines, before_commit=None):
+        """Insert rows; returns (inserted, duplicates, [(line, message), ...])
+
+        ``before_commit(inserted, duplicates, errors)`` is called with each
+        chunk's counts inside its transaction, so callers can persist their
+        own bookkeeping atomically with the rows. With ``chunk_size=None``
+        every call is a single transaction.
+
+        A chunk the database rejects for its data (integrity or data errors)
+        is rolled back and reported as an error. Any other error rolls the
+        chunk back and propagates, so callers never record it as done.
+        """
+        inserted = 0
+        duplicates = 0
+        errors = []
+        step = self.chunk_size or max(len(rows), 1)
+        for start in range(0, len(rows), step):
+            chunk = rows[start:start + step]
+            chunk_lines = lines[start:start + step]
+            try:
+                chunk_duplicates = 0
+                chunk_errors = []
+                if self.on_duplicate:
+                    chunk, chunk_lines, chunk_duplicates, chunk_errors = self._deduplicate(chunk, chunk_lines)
+
+                if chunk:
+                    if self.use_copy:
+                        self._copy(chunk)
+                    else:
+                        self._executemany(chunk)
+                if before_commit:
+                    before_commit(len(chunk), chunk_duplicates, chunk_errors)
+                self.session.commit()
+
+                inserted += len(chunk)
+                duplicates += chunk_duplicates
+                errors.extend(chunk_errors)
+            except (IntegrityError, DataError, self.dbapi.IntegrityError, self.dbapi.DataError) as e:
+                self.session.rollback()
+                errors.append((chunk_lines[0], f"Database error in lines {chunk_lines[0]}-{chunk_lines[-1]}: {str(e)}"))
+            except self.dbapi.Error as e:
+                # COPY runs on the raw cursor; raise what SQLAlchemy would have
+                self.session.rollback()
+                raise DBAPIError.instance(None, None, e, self.dbapi.Error) from e
+            except Exception:
+                self.session.rollback()
+                raise
+        return inserted, duplicates, errors
+
+    def _deduplicate(self, chunk, lines):
+        """Apply the duplicate policy to one chunk.
+
+        Returns the rows still to insert with their lines, the number of
+        skipped or updated duplicates, and errors for the 'error' policy.
+        """
+        policy = self.on_duplicate
+        kept, kept_lines, errors = [], [], []
+        duplicates = 0
+        first_seen = {}  # content hash -> index in kept
+
+        for row, line in zip(chunk, lines):
+            index = first_seen.get(row[_CONTENT_HASH])
+            if index is None:
+                first_seen[row[_CONTENT_HASH]] = len(kept)
+                kept.append(row)
+                kept_lines.append(line)
+            elif policy == 'error':
+                errors.append((line, f"Duplicate of line {kept_lines[index]}"))
+            else:
+                if policy == 'update':
+                    kept[index] = row
+                duplicates += 1
+
+        if not kept:
+            return kept, kept_lines, duplicates, errors
+
+        existing = self._existing_hashes(kept[0][_USER_ID], list(first_seen))
+        if not existing:
+            return kept, kept_lines, duplicates, errors
+
+        new_rows, new_lines, matched = [], [], []
+        for row, line in zip(kept, kept_lines):
+            if row[_CONTENT_HASH] not in existing:
+                new_rows.append(row)
+                new_lines.append(line)
+            elif policy == 'error':
+                errors.append((line, "Saying already exists"))
+            else:
+                matched.append(row)
+
+        if matched and policy == 'update':
+            self._update_existing(matched)
+        return new_rows, new_lines, duplicates + len(matched), errors
+
+    def _existing_hashes(self, user_id, hashes, batch_size=500):
+        table = Saying.__table__
+        found = set()
+        for start in range(0, len(hashes), batch_size):
+            found.update(self.session.execute(
+                select(table.c.content_hash).where(
+                    table.c.user_id == user_id,
+                    table.c.content_hash.in_(hashes[start:start + batch_size])
+                )
+            ).scalars())
+        return found
+
+    def _update_existing(self, rows):
+        table = Saying.__table__
+        stmt = update(table).where(
+            table.c.user_id == bindparam('b_user_id'),
+            table.c.content_hash == bindparam('b_content_hash')
+        ).values({name: bindparam(f'b_{name}') for name in UPDATE_COLUMNS})
+
+        positions = [(f'b_{name}', INSERT_COLUMNS.index(name))
+                     for name in UPDATE_COLUMNS + ['user_id', 'content_hash']]
+        self.session.execute(stmt, [
+            {key: row[position] for key, position in positions} for row in rows
+        ])
+
+    def _connection(self):
+        # Connection to the database holding sayings: the current shard, if any
+        return self.session.connection(bind_arguments={'mapper': Saying})
+
+    def _executemany(self, chunk):
+        # Encode column by column; constant columns (timestamps, user_id)
+        # hold the same object in every row and are only encoded once
+        columns = list(zip(*chunk))
+        for position, processor in self._processors:
+            values = columns[position]
+            if len(set(map(id, values))) == 1:
+                columns[position] = repeat(processor(values[0]), len(values))
+            else:
+                columns[position] = map(processor, values)
+        self._connection().exec_driver_sql(self._insert_sql, list(zip(*columns)))
+
+    def _copy(self, chunk):
+        buffer = io.StringIO()
+        for row in chunk:
+            buffer.write('\t'.join(map(_copy_value, row)))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        cursor = self._connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {Saying.__tablename__} ({', '.join(INSERT_COLUMNS)}) FROM STDIN",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+
+def parse_blocks(blocks, parse, args, workers):
+    """Yield ``(len(block), parse(block, *args))`` for each block, in order.
+
+    With workers > 1 the blocks are parsed on a process pool; at most
+    ``2 * workers`` parsed blocks wait for the consumer, so a slow database
+    throttles reading instead of filling memory.
+    """
+    if workers <= 1:
+        for block in blocks:
+            yield len(block), parse(block, *args)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for block in blocks:
+                pending.append((len(block), executor.submit(parse, block, *args)))
+                if len(pending) >= 2 * workers:
+                    size, future = pending.popleft()
+                    yield size, future.result()
+            while pending:
+                size, future = pending.popleft()
+                yield size, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def run_parallel_import(blocks, parse, args, writer, progress, workers):
+    """Parse blocks on a process pool and write the results in order.
+
+    ``parse(block, *args)`` runs in a worker and returns block-relative line
+    numbers; this process shifts them, performs the ordered bulk inserts
+    and records progress (see parse_blocks).
+    """
+    offset = 0
+    for _, (total, span, rows, lines, errors) in parse_blocks(blocks, parse, args, workers):
+        lines = [line + offset for line in lines]
+        errors = [(line + offset, message) for line, message in errors]
+        inserted, duplicates, db_errors = writer.write(rows, lines)
+        progress.record(total, inserted, errors + db_errors, duplicates)
+        offset += span
@@ -0,0 +1,263 @@
+import atexit
+import csv
+import hashlib
+import os
+import threading
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import update, or_, and_, func
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, ImportJob
+from sharding import shards
+from import_engine import (
+    BulkWriter, DUPLICATE_POLICIES, split_blocks, parse_blocks, parse_csv_block, parse_ndjson_block
+)
+
+# Formats that can be split into record-aligned blocks and resumed by byte offset
+JOB_FORMATS = ('csv', 'ndjson')
+
+MAX_ERROR_SAMPLES = 10
+
+class ImportJobWorker:
+    """Runs persisted import jobs in a background thread.
+
+    Uploads are stored under IMPORT_JOB_DIR and processed in blocks of about
+    IMPORT_JOB_BLOCK_SIZE bytes. Each block's rows and the job's checkpoint
+    (byte offset, counters, error samples) commit in one transaction, so a
+    worker that dies mid-import leaves the job exactly at its last commit.
+    Jobs whose heartbeat is older than IMPORT_JOB_STALE_SECONDS are picked
+    up again by any worker and resume from that checkpoint.
+
+    With SHARD_BINDS the rows commit on the user's shard just before the
+    checkpoint commits on the default database. A worker dying between the
+    two leaves the block after the checkpoint imported, so a resumed job
+    skips rows of that block whose content the user already has (counted
+    as duplicates) instead of inserting them again.
+
+    Blocks are parsed ahead on IMPORT_WORKERS processes; inserts and
+    checkpoints stay in file order on the worker thread.
+    """
+
+    def __init__(self, app, upload_dir=None, block_size=None, poll_interval=None, stale_after=None, workers=None):
+        self.app = app
+        self.upload_dir = Path(upload_dir or app.config.get('IMPORT_JOB_DIR', './import_jobs'))
+        self.upload_dir.mkdir(exist_ok=True)
+        self.block_size = block_size or app.config.get('IMPORT_JOB_BLOCK_SIZE', 1 << 20)
+        self.poll_interval = poll_interval or app.config.get('IMPORT_JOB_POLL_INTERVAL', 5)
+        self.stale_after = timedelta(seconds=stale_after or app.config.get('IMPORT_JOB_STALE_SECONDS', 300))
+        self.workers = workers or app.config.get('IMPORT_WORKERS', os.cpu_count() or 1)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background worker thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='import-jobs', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop after the block in progress; the job resumes on next start"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, user_id, stream, filename, file_format, on_duplicate='skip'):
+        """Store an upload and queue an import job for it.
+
+        Returns (True, job) or (False, message). Submitting a file identical
+        to one of the user's pending, running or completed jobs returns that
+        job instead of importing the rows again.
+        """
+        if file_format not in JOB_FORMATS:
+            return False, f"Unsupported import job format: {file_format}"
+        if on_duplicate is not None and on_duplicate not in DUPLICATE_POLICIES:
+            return False, f"Unsupported on_duplicate policy: {on_duplicate}"
+
+        job_uuid = str(uuid.uuid4())
+        file_path = self.upload_dir / f'{job_uuid}.{file_format}'
+        fingerprint, size = self._store(stream, file_path)
+
+        if file_format == 'csv':
+            with open(file_path, 'rb') as f:
+                header = f.readline().decode('utf-8', errors='replace')
+            if 'content' not in next(csv.reader([header]), []):
+                file_path.unlink()
+                return False, "CSV must contain 'content' column"
+
+        existing = ImportJob.query.filter(
+            ImportJob.user_id == user_id,
+            ImportJob.source_fingerprint == fingerprint,
+            ImportJob.status != 'failed'
+        ).first()
+        if existing:
+            file_path.unlink()
+            return True, existing
+
+        job = ImportJob(
+            uuid=job_uuid,
+            user_id=user_id,
+            filename=filename,
+            file_path=str(file_path),
+            file_format=file_format,
+            on_duplicate=on_duplicate,
+            source_fingerprint=fingerprint,
+            source_size=size,
+            status='pending'
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self._wake.set()
+        return True, job
+
+    @staticmethod
+    def get(job_id, user_id):
+        """Get a job owned by user, or None"""
+        return ImportJob.query.filter_by(uuid=job_id, user_id=user_id).first()
+
+    @staticmethod
+    def _store(stream, file_path, buffer_size=1 << 20):
+        """Copy stream to file_path, returning its sha256 and size"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, 'wb') as f:
+            while True:
+                data = stream.read(buffer_size)
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                size += len(data)
+        return digest.hexdigest(), size
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    while not self._stop.is_set():
+                        job = self._claim()
+                        if job is None:
+                            break
+                        self._process(job)
+            except Exception:
+                self.app.logger.exception("Import job worker failed")
+
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self):
+        """Take the oldest pending or abandoned job, or return None.
+
+        The conditional UPDATE makes the claim safe when several processes
+        run workers against the same database.
+        """
+        now = datetime.utcnow()
+        candidates = ImportJob.query.filter(or_(
+            ImportJob.status == 'pending',
+            and_(ImportJob.status == 'processing', ImportJob.heartbeat_at < now - self.stale_after)
+        )).order_by(ImportJob.id).limit(10).all()
+
+        jobs = ImportJob.__table__
+        for job in candidates:
+            heartbeat = jobs.c.heartbeat_at.is_(None) if job.heartbeat_at is None else jobs.c.heartbeat_at == job.heartbeat_at
+            claimed = db.session.execute(
+                update(jobs)
+                .where(jobs.c.id == job.id, jobs.c.status == job.status, heartbeat)
+                .values(status='processing', heartbeat_at=now, started_at=func.coalesce(jobs.c.started_at, now))
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(ImportJob, job.id)
+        return None
+
+    def _process(self, job):
+        try:
+            with open(job.file_path, 'rb') as f, shards.for_user(job.user_id):
+                finished = self._import_blocks(job, f)
+        except SQLAlchemyError:
+            # Leave the job claimed; it goes stale and is retried from its checkpoint
+            db.session.rollback()
+            self.app.logger.exception(f"Import job {job.uuid} interrupted")
+            return
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.exception(f"Import job {job.uuid} failed")
+            job.status = 'failed'
+            job.error_message = str(e)
+        else:
+            if not finished:
+                # Stopped between blocks; hand the job back for the next start
+                job.status = 'pending'
+                db.session.commit()
+                return
+            job.status = 'completed'
+
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+    def _import_blocks(self, job, f):
+        """Import from the job's checkpoint; False if stopped before the end"""
+        if job.file_format == 'csv':
+            header = f.readline()
+            parse, args, quote = parse_csv_block, (header, job.user_id), b'"'
+            offset = max(job.byte_offset, len(header))
+        else:
+            parse, args, quote = parse_ndjson_block, (job.user_id,), None
+            offset = job.byte_offset
+
+        f.seek(offset)
+        writer = BulkWriter(chunk_size=None, on_duplicate=job.on_duplicate)
+        # A claim keeps started_at, so they differ once the job is resumed
+        replay = None
+        if shards.enabled and job.started_at != job.heartbeat_at and job.on_duplicate != 'update':
+            replay = BulkWriter(chunk_size=None, on_duplicate='skip')
+        blocks = parse_blocks(split_blocks(f, self.block_size, quote=quote), parse, args, self.workers)
+        # Closing the parser on return or error shuts its process pool down
+        with closing(blocks):
+            for size, (total, span, rows, lines, errors) in blocks:
+                if self._stop.is_set():
+                    return False
+                block_writer, replay = replay or writer, None
+
+                offset += size
+
+                line_offset = job.line_offset
+                lines = [line + line_offset for line in lines]
+                errors = [(line + line_offset, message) for line, message in errors]
+
+                def checkpoint(inserted, duplicates, db_errors):
+                    self._checkpoint(job, offset, span, total, inserted, duplicates, errors + db_errors)
+
+                db_errors = []
+                if rows:
+                    _, _, db_errors = block_writer.write(rows, lines, before_commit=checkpoint)
+
+                # The block had nothing to insert, or its insert failed and was
+                # rolled back: record it as processed so the job moves on
+                if job.byte_offset != offset:
+                    checkpoint(0, 0, db_errors)
+                    db.session.commit()
+        return True
+
+    @staticmethod
+    def _checkpoint(job, offset, span, total, inserted, duplicates, errors):
+        job.byte_offset = offset
+        job.line_offset += span
+        job.total_count += total
+        job.success_count += inserted
+        job.duplicate_count += duplicates
+        job.error_count += total - inserted - duplicates
+        samples = list(job.error_samples or [])
+        samples.extend(f"Line {line}: {message}" for line, message in errors[:MAX_ERROR_SAMPLES - len(samples)])
+        job.error_samples = samples
+        job.heartbeat_at = datetime.utcnow()
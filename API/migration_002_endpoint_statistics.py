@@ -0,0 +1,26 @@
+"""add endpoint_statistics sketches"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('endpoint_statistics',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('endpoint', sa.String(length=200), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('call_count', sa.Integer(), nullable=True),
+        sa.Column('unique_users_sketch', sa.LargeBinary(), nullable=True),
+        sa.Column('latency_sketch', sa.LargeBinary(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('endpoint', 'date', name='uq_endpoint_statistics_endpoint_date')
+    )
+    op.create_index('idx_endpoint_statistics_date', 'endpoint_statistics', ['date'])
+
+def downgrade():
+    op.drop_index('idx_endpoint_statistics_date', table_name='endpoint_statistics')
+    op.drop_table('endpoint_statistics')
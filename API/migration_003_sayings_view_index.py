@@ -0,0 +1,14 @@
+"""add sayings view_count index"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('idx_sayings_user_views', 'sayings', ['user_id', 'view_count'])
+
+def downgrade():
+    op.drop_index('idx_sayings_user_views', table_name='sayings')
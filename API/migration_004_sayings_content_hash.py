@@ -0,0 +1,51 @@
+"""add sayings content_hash for duplicate detection"""
+from alembic import op
+import sqlalchemy as sa
+import hashlib
+import unicodedata
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+def _hash_content(content):
+    # Must match Saying.hash_content
+    normalized = ' '.join(unicodedata.normalize('NFKC', content).casefold().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def upgrade():
+    op.add_column('sayings', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    # Backfill in id-ordered batches so large tables don't need one huge transaction
+    connection = op.get_bind()
+    sayings = sa.table('sayings', sa.column('id', sa.Integer), sa.column('content', sa.Text),
+                       sa.column('content_hash', sa.String))
+    update = sayings.update().where(sayings.c.id == sa.bindparam('saying_id')).values(
+        content_hash=sa.bindparam('hash')
+    )
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(sayings.c.id, sayings.c.content)
+            .where(sayings.c.id > last_id)
+            .order_by(sayings.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        params = [{'saying_id': saying_id, 'hash': _hash_content(content)}
+                  for saying_id, content in rows if content is not None]
+        if params:
+            connection.execute(update, params)
+        last_id = rows[-1][0]
+
+    op.create_index('idx_sayings_user_hash', 'sayings', ['user_id', 'content_hash'])
+
+def downgrade():
+    op.drop_index('idx_sayings_user_hash', table_name='sayings')
+    op.drop_column('sayings', 'content_hash')
@@ -0,0 +1,45 @@
+"""add import_jobs for resumable imports"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('import_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('uuid', sa.String(length=36), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('file_format', sa.String(length=10), nullable=False),
+        sa.Column('on_duplicate', sa.String(length=10), nullable=True),
+        sa.Column('source_fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('source_size', sa.BigInteger(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('byte_offset', sa.BigInteger(), nullable=True),
+        sa.Column('line_offset', sa.Integer(), nullable=True),
+        sa.Column('total_count', sa.Integer(), nullable=True),
+        sa.Column('success_count', sa.Integer(), nullable=True),
+        sa.Column('duplicate_count', sa.Integer(), nullable=True),
+        sa.Column('error_count', sa.Integer(), nullable=True),
+        sa.Column('error_samples', sa.JSON(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('uuid')
+    )
+    op.create_index('idx_import_jobs_status', 'import_jobs', ['status', 'heartbeat_at'])
+    op.create_index('idx_import_jobs_user_source', 'import_jobs', ['user_id', 'source_fingerprint'])
+
+def downgrade():
+    op.drop_index('idx_import_jobs_user_source', table_name='import_jobs')
+    op.drop_index('idx_import_jobs_status', table_name='import_jobs')
+    op.drop_table('import_jobs')
@@ -0,0 +1,34 @@
+"""add backup watermarks and saying tombstones for incremental backups"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('backups', sa.Column('watermark', sa.DateTime(), nullable=True))
+    op.add_column('backups', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_backups_parent', 'backups', 'backups', ['parent_id'], ['id'])
+    op.create_index('idx_backups_user_created', 'backups', ['user_id', 'created_at'])
+    op.create_index('idx_sayings_user_updated', 'sayings', ['user_id', 'updated_at'])
+
+    op.create_table('saying_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('saying_uuid', sa.String(length=36), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_saying_tombstones_user_deleted', 'saying_tombstones', ['user_id', 'deleted_at'])
+
+def downgrade():
+    op.drop_index('idx_saying_tombstones_user_deleted', table_name='saying_tombstones')
+    op.drop_table('saying_tombstones')
+    op.drop_index('idx_sayings_user_updated', table_name='sayings')
+    op.drop_index('idx_backups_user_created', table_name='backups')
+    op.drop_constraint('fk_backups_parent', 'backups', type_='foreignkey')
+    op.drop_column('backups', 'parent_id')
+    op.drop_column('backups', 'watermark')
@@ -0,0 +1,23 @@
+"""add backup_chunks for the deduplicating chunk store"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('backup_chunks',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('digest')
+    )
+    op.create_index('idx_backup_chunks_ref_count', 'backup_chunks', ['ref_count'])
+
+def downgrade():
+    op.drop_index('idx_backup_chunks_ref_count', table_name='backup_chunks')
+    op.drop_table('backup_chunks')
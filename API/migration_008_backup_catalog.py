@@ -0,0 +1,22 @@
+"""add checksum and locations to backups for the backup catalog"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('backups', sa.Column('checksum', sa.String(length=64), nullable=True))
+    op.add_column('backups', sa.Column('locations', sa.JSON(), nullable=True))
+    op.add_column('backups', sa.Column('verified_at', sa.DateTime(), nullable=True))
+    op.create_index('idx_backups_filename', 'backups', ['filename'])
+    # Existing rows get their locations from the first reconciler run
+
+def downgrade():
+    op.drop_index('idx_backups_filename', table_name='backups')
+    op.drop_column('backups', 'verified_at')
+    op.drop_column('backups', 'locations')
+    op.drop_column('backups', 'checksum')
@@ -0,0 +1,21 @@
+"""add job state to backups for the backup scheduler"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('backups', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.add_column('backups', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    op.add_column('backups', sa.Column('error_message', sa.Text(), nullable=True))
+    op.create_index('idx_backups_status', 'backups', ['status'])
+
+def downgrade():
+    op.drop_index('idx_backups_status', table_name='backups')
+    op.drop_column('backups', 'error_message')
+    op.drop_column('backups', 'completed_at')
+    op.drop_column('backups', 'started_at')
@@ -0,0 +1,24 @@
+"""add the user_shards directory for user-sharded sayings"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('user_shards',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.String(length=50), nullable=False),
+        sa.Column('assigned_at', sa.DateTime(), nullable=True),
+        sa.Column('moved_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('idx_user_shards_shard', 'user_shards', ['shard'])
+
+def downgrade():
+    op.drop_index('idx_user_shards_shard', table_name='user_shards')
+    op.drop_table('user_shards')
@@ -0,0 +1,25 @@
+"""rework sayings and usage_statistics indexes to match the queries"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # No query can use a B-tree on content for '%term%' searches
+    op.drop_index('idx_sayings_search', table_name='sayings')
+    # Exports read a user's rows in id order; with id in the key no database
+    # needs a sort (SQLite's rowid would only cover SQLite)
+    op.drop_index('idx_sayings_user', table_name='sayings')
+    op.create_index('idx_sayings_user', 'sayings', ['user_id', 'id'])
+    op.create_index('idx_sayings_user_category', 'sayings', ['user_id', 'category'])
+    op.create_index('idx_usage_statistics_user_date', 'usage_statistics', ['user_id', 'date'])
+
+def downgrade():
+    op.drop_index('idx_usage_statistics_user_date', table_name='usage_statistics')
+    op.drop_index('idx_sayings_user_category', table_name='sayings')
+    op.drop_index('idx_sayings_user', table_name='sayings')
+    op.create_index('idx_sayings_user', 'sayings', ['user_id', 'created_at'])
+    op.create_index('idx_sayings_search', 'sayings', ['content', 'author', 'category'])
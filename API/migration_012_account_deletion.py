@@ -0,0 +1,31 @@
+"""add users.deleted_at and cascade user deletes in the database"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+# Tables referencing users.id, with PostgreSQL's default constraint names
+USER_FOREIGN_KEYS = ['sayings', 'login_history', 'backups', 'usage_statistics', 'import_jobs', 'user_shards']
+
+def upgrade():
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('idx_users_deleted_at', 'users', ['deleted_at'])
+    # Chunked deletes find a user's rows by user_id
+    op.create_index('idx_login_history_user', 'login_history', ['user_id', 'login_time'])
+    
+    for table in USER_FOREIGN_KEYS:
+        op.drop_constraint(f'{table}_user_id_fkey', table, type_='foreignkey')
+        op.create_foreign_key(f'{table}_user_id_fkey', table, 'users', ['user_id'], ['id'], ondelete='CASCADE')
+
+def downgrade():
+    for table in USER_FOREIGN_KEYS:
+        op.drop_constraint(f'{table}_user_id_fkey', table, type_='foreignkey')
+        op.create_foreign_key(f'{table}_user_id_fkey', table, 'users', ['user_id'], ['id'])
+    
+    op.drop_index('idx_login_history_user', table_name='login_history')
+    op.drop_index('idx_users_deleted_at', table_name='users')
+    op.drop_column('users', 'deleted_at')
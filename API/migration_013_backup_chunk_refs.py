@@ -0,0 +1,21 @@
+"""add backup_chunk_refs so deleting a backup releases its chunks without its manifest"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Backups made before this keep releasing their chunks from the manifest
+    op.create_table('backup_chunk_refs',
+        sa.Column('backup_id', sa.Integer(), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['backup_id'], ['backups.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('backup_id', 'digest')
+    )
+
+def downgrade():
+    op.drop_table('backup_chunk_refs')
@@ -0,0 +1,41 @@
+"""make sayings (user_id, content_hash) unique so concurrent creates cannot duplicate a saying"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+def upgrade():
+    # Earlier duplicates stay, but only the oldest copy keeps the hash;
+    # NULL hashes do not collide
+    connection = op.get_bind()
+    sayings = sa.table('sayings', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer),
+                       sa.column('content_hash', sa.String))
+    groups = connection.execute(
+        sa.select(sayings.c.user_id, sayings.c.content_hash, sa.func.min(sayings.c.id))
+        .where(sayings.c.content_hash.isnot(None))
+        .group_by(sayings.c.user_id, sayings.c.content_hash)
+        .having(sa.func.count() > 1)
+    ).fetchall()
+    clear = sayings.update().where(
+        sayings.c.user_id == sa.bindparam('owner_id'),
+        sayings.c.content_hash == sa.bindparam('hash'),
+        sayings.c.id != sa.bindparam('keep_id')
+    ).values(content_hash=None)
+    for start in range(0, len(groups), BATCH_SIZE):
+        connection.execute(clear, [
+            {'owner_id': user_id, 'hash': content_hash, 'keep_id': keep_id}
+            for user_id, content_hash, keep_id in groups[start:start + BATCH_SIZE]
+        ])
+
+    op.drop_index('idx_sayings_user_hash', table_name='sayings')
+    op.create_index('idx_sayings_user_hash', 'sayings', ['user_id', 'content_hash'], unique=True)
+
+def downgrade():
+    op.drop_index('idx_sayings_user_hash', table_name='sayings')
+    op.create_index('idx_sayings_user_hash', 'sayings', ['user_id', 'content_hash'])
@@ -0,0 +1,245 @@
+"""Sampling profiler for live requests.
+
+Off by default; while off, each request pays one attribute check. start()
+picks a fraction of requests (rate) until the time window (duration) ends.
+A background thread reads the stacks of the threads serving those requests
+every PROFILER_INTERVAL_MS milliseconds through sys._current_frames() and
+counts them per route. Nothing is hooked into the profiled code itself,
+so its timing stays close to normal.
+
+Samples download as collapsed stacks (flamegraph.pl, speedscope) or as
+speedscope JSON. State is per process: under a multi-process server each
+worker profiles its own share of requests.
+"""
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, jsonify, request
+
+PROFILE_FORMATS = ('collapsed', 'speedscope')
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.active = False
+        self.rate = 0.0
+        self.interval = 0.005
+        self.max_duration = 3600
+        self.started_at = None
+        self.until = None
+        self._threads = {}  # thread id -> route of the sampled request it serves
+        self._stacks = {}  # route -> Counter of root-first stacks of frame keys
+        self._requests = Counter()  # route -> sampled requests
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.get('PROFILER_INTERVAL_MS', 5) / 1000
+        self.max_duration = app.config.get('PROFILER_MAX_DURATION', 3600)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def start(self, rate=1.0, duration=60):
+        """Sample rate of requests for duration seconds, discarding earlier samples"""
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be in (0, 1]")
+        if not 0 < duration <= self.max_duration:
+            raise ValueError(f"duration must be in (0, {self.max_duration}] seconds")
+
+        self.stop()
+        with self._lock:
+            self._threads = {}
+            self._stacks = {}
+            self._requests = Counter()
+        self.rate = rate
+        self.started_at = datetime.utcnow()
+        self.until = time.monotonic() + duration
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        self.active = True
+
+    def stop(self):
+        """Stop sampling; collected samples stay available"""
+        self.active = False
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._threads.clear()
+
+    def _before_request(self):
+        if not self.active or random.random() >= self.rate:
+            return
+        rule = request.url_rule
+        route = f"{request.method} {rule.rule if rule is not None else '<unmatched>'}"
+        with self._lock:
+            self._requests[route] += 1
+            self._threads[threading.get_ident()] = route
+
+    def _teardown_request(self, exc=None):
+        if self._threads:
+            with self._lock:
+                self._threads.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self.until:
+                self.active = False
+                break
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, route in self._threads.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((
+                        frame.f_globals.get('__name__', '?'),
+                        getattr(code, 'co_qualname', code.co_name),
+                        code.co_filename,
+                        code.co_firstlineno,
+                    ))
+                    frame = frame.f_back
+                if stack:
+                    stack.reverse()
+                    self._stacks.setdefault(route, Counter())[tuple(stack)] += 1
+
+    def status(self):
+        with self._lock:
+            routes = [
+                {'route': route, 'requests': count, 'samples': sum(self._stacks.get(route, {}).values())}
+                for route, count in self._requests.items()
+            ]
+        routes.sort(key=lambda item: item['samples'], reverse=True)
+        return {
+            'active': self.active,
+            'rate': self.rate,
+            'interval_ms': self.interval * 1000,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'remaining_seconds': round(max(self.until - time.monotonic(), 0), 1) if self.active else 0,
+            'routes': routes
+        }
+
+    def _snapshot(self, route=None):
+        with self._lock:
+            return {
+                name: Counter(stacks) for name, stacks in self._stacks.items()
+                if route is None or name == route
+            }
+
+    def collapsed(self, route=None):
+        """Samples as collapsed stacks, one 'route;frame;...;frame count' line per stack"""
+        lines = []
+        for name, stacks in sorted(self._snapshot(route).items()):
+            for stack, count in stacks.most_common():
+                frames = ';'.join(f'{module}:{qualname}' for module, qualname, _, _ in stack)
+                lines.append(f'{name};{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, route=None):
+        """Samples as a speedscope document with one sampled profile per route"""
+        frames = []
+        index = {}
+        profiles = []
+        for name, stacks in sorted(self._snapshot(route).items()):
+            samples, weights = [], []
+            for stack, count in stacks.most_common():
+                sample = []
+                for frame in stack:
+                    if frame not in index:
+                        module, qualname, filename, line = frame
+                        index[frame] = len(frames)
+                        frames.append({'name': f'{module}:{qualname}', 'file': filename, 'line': line})
+                    sample.append(index[frame])
+                samples.append(sample)
+                weights.append(count * self.interval * 1000)
+            profiles.append({
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            })
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': f"API profile {self.started_at.isoformat() if self.started_at else ''}".strip(),
+            'exporter': 'profiler.py',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': profiles
+        }
+
+
+def token_required(view):
+    """Allow requests whose X-Profiler-Token header matches PROFILER_TOKEN; off when unset"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('PROFILER_TOKEN')
+        if not token or not hmac.compare_digest(request.headers.get('X-Profiler-Token', ''), token):
+            return jsonify({'success': False, 'message': 'Profiler access denied'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def create_blueprint(profiler, guard):
+    """Routes controlling profiler under /api/admin/profiler, each wrapped in guard"""
+    blueprint = Blueprint('profiler', __name__, url_prefix='/api/admin/profiler')
+
+    @blueprint.route('', methods=['GET'])
+    @guard
+    def status():
+        return jsonify({'success': True, 'data': profiler.status()})
+
+    @blueprint.route('', methods=['POST'])
+    @guard
+    def start():
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.start(float(data.get('rate', 0.1)), float(data.get('duration', 60)))
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        return jsonify({'success': True, 'data': profiler.status()})
+
+    @blueprint.route('', methods=['DELETE'])
+    @guard
+    def stop():
+        profiler.stop()
+        return jsonify({'success': True, 'data': profiler.status()})
+
+    @blueprint.route('/profile', methods=['GET'])
+    @guard
+    def download():
+        profile_format = request.args.get('format', 'speedscope')
+        route = request.args.get('route')
+        if profile_format == 'collapsed':
+            return Response(profiler.collapsed(route), mimetype='text/plain', headers={
+                'Content-Disposition': 'attachment; filename=profile.collapsed.txt'
+            })
+        if profile_format == 'speedscope':
+            return Response(json.dumps(profiler.speedscope(route)), mimetype='application/json', headers={
+                'Content-Disposition': 'attachment; filename=profile.speedscope.json'
+            })
+        return jsonify({
+            'success': False,
+            'message': f"format must be one of {', '.join(PROFILE_FORMATS)}"
+        }), 400
+
+    return blueprint
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from analytics import AnalyticsManager
+from sharding import shards
+
+REPORT_TYPES = ('weekly', 'monthly', 'yearly')
+
+# Reports for the same user/type are shared within one bucket of this many
+# seconds, so a burst of identical requests produces a single computation
+PERIOD_BUCKET_SECONDS = {
+    'weekly': 3600,
+    'monthly': 6 * 3600,
+    'yearly': 24 * 3600,
+}
+
+class ReportJob:
+    def __init__(self, user_id, report_type, cache_key):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.report_type = report_type
+        self.cache_key = cache_key
+        self.status = 'pending'  # pending, processing, completed, failed
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+        self.expires_at = None
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'report_type': self.report_type,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class ReportJobQueue:
+    """Runs report generation on a worker pool and caches results with a TTL"""
+    
+    def __init__(self, app, max_workers=None, ttl=None):
+        self.app = app
+        self.ttl = ttl or app.config.get('REPORT_CACHE_TTL', 900)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or app.config.get('REPORT_WORKERS', 4),
+            thread_name_prefix='report-worker'
+        )
+        self._lock = threading.Lock()
+        self._jobs = {}    # job id -> ReportJob
+        self._by_key = {}  # (user_id, report_type, bucket) -> ReportJob
+    
+    @staticmethod
+    def cache_key(user_id, report_type, now=None):
+        """Build the (user_id, report_type, period bucket) result key"""
+        now = time.time() if now is None else now
+        return (user_id, report_type, int(now // PERIOD_BUCKET_SECONDS[report_type]))
+    
+    def submit(self, user_id, report_type='weekly'):
+        """Return the in-flight or cached job for this report, starting one if needed"""
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f"Unknown report type: {report_type}")
+        
+        key = self.cache_key(user_id, report_type)
+        
+        with self._lock:
+            self._evict_expired()
+            
+            job = self._by_key.get(key)
+            if job and job.status != 'failed':
+                return job
+            
+            job = ReportJob(user_id, report_type, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        
+        self._executor.submit(self._run, job)
+        return job
+    
+    def get(self, job_id, user_id):
+        """Get a job owned by user, or None"""
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+        
+        if not job or job.user_id != user_id:
+            return None
+        return job
+    
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+    
+    def _run(self, job):
+        job.status = 'processing'
+        try:
+            with self.app.app_context(), shards.for_user(job.user_id):
+                job.result = AnalyticsManager.generate_report(job.user_id, job.report_type)
+            job.status = 'completed'
+        except Exception as e:
+            self.app.logger.exception(f"Report job {job.id} failed")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.expires_at = time.monotonic() + self.ttl
+    
+    def _evict_expired(self):
+        """Drop finished jobs past their TTL. Caller must hold the lock."""
+        now = time.monotonic()
+        expired = [
+            job for job in self._jobs.values()
+            if job.expires_at is not None and job.expires_at <= now
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_key.get(job.cache_key) is job:
+                del self._by_key[job.cache_key]
@@ -0,0 +1,378 @@
+"""Routes each user's sayings to one of several database binds.
+
+SHARD_BINDS maps shard names to database URLs; they are registered as
+SQLAlchemy binds. The rows of SHARDED_TABLES belonging to a user live on
+that user's shard, everything else stays on the default database, which
+also holds the user_shards directory.
+
+Code working on one user's data runs inside ``shards.for_user(user_id)``
+(requests are scoped by appIntegral); statements on sharded tables then
+go to that user's shard. Outside a scope, or without SHARD_BINDS, they go
+to the default database as before.
+
+With SHARD_STRATEGY = 'directory' (the default) a new user is placed by a
+stable hash of their id and pinned in user_shards, so rebalance() can move
+them later. 'hash' skips the directory but cannot rebalance.
+
+Saying ids are unique across shards: the n-th shard in SHARD_BINDS hands
+out ids from (n * SHARD_ID_RANGE, (n + 1) * SHARD_ID_RANGE], and never
+reuses one, so a saying keeps its id when its user is moved. Add new
+shards at the end of SHARD_BINDS. SQLite hands out ids above the largest
+one in the table whatever its sequence says, so a SQLite shard only takes
+users from shards earlier in SHARD_BINDS; PostgreSQL shards take any.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update, insert, delete, bindparam, or_
+from sqlalchemy.exc import IntegrityError
+
+from database import db, current_shard, SHARDED_TABLES
+from models import Saying, SayingTombstone, UserShard, ImportJob, Backup
+
+SHARD_STRATEGIES = ('directory', 'hash')
+
+# Saying ids are 32-bit integers on PostgreSQL
+MAX_SAYING_ID = 2 ** 31 - 1
+
+
+class ShardRouter:
+    def __init__(self, app=None):
+        self.keys = []
+        self.id_floors = {}  # shard -> last id before its range
+        self.strategy = 'directory'
+        self.cache_ttl = 30
+        self._cache = {}  # user id -> (shard, expiry)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register SHARD_BINDS as binds; must run before db.init_app"""
+        binds = app.config.get('SHARD_BINDS') or {}
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), **binds}
+        self.keys = sorted(binds)
+        id_range = app.config.get('SHARD_ID_RANGE', 100_000_000)
+        if len(binds) * id_range > MAX_SAYING_ID:
+            raise ValueError(f"{len(binds)} shards of SHARD_ID_RANGE ids do not fit in {MAX_SAYING_ID}")
+        self.id_floors = {key: index * id_range for index, key in enumerate(binds)}
+        self.strategy = app.config.get('SHARD_STRATEGY', 'directory')
+        if self.strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"SHARD_STRATEGY must be one of {', '.join(SHARD_STRATEGIES)}")
+        # How long a process may keep routing a moved user to the old shard
+        self.cache_ttl = app.config.get('SHARD_DIRECTORY_TTL', 30)
+        self._cache = {}
+        app.cli.add_command(shards_cli)
+
+    @property
+    def enabled(self):
+        return bool(self.keys)
+
+    def create_all(self):
+        """Create the sharded tables on every shard and reserve its id range. Needs an app context."""
+        metadata = sa.MetaData()
+        for name in SHARDED_TABLES:
+            table = db.metadata.tables[name].to_metadata(metadata)
+            # Referenced tables such as users live on the default database
+            for constraint in list(table.foreign_key_constraints):
+                table.constraints.discard(constraint)
+            table.foreign_keys.clear()
+            for column in table.c:
+                column.foreign_keys.clear()
+        # Never reuse ids, so ids of users moved away are not handed out again
+        metadata.tables[Saying.__tablename__].dialect_kwargs['sqlite_autoincrement'] = True
+        for key in self.keys:
+            metadata.create_all(db.engines[key])
+            self._reserve_ids(db.engines[key], self.id_floors[key])
+
+    @staticmethod
+    def _reserve_ids(engine, floor):
+        """Make the shard hand out saying ids above floor"""
+        name = Saying.__tablename__
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite':
+                current = connection.execute(
+                    sa.text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {'name': name}
+                ).scalar()
+                if current is None:
+                    connection.execute(
+                        sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :floor)"),
+                        {'name': name, 'floor': floor}
+                    )
+                elif current < floor:
+                    connection.execute(
+                        sa.text("UPDATE sqlite_sequence SET seq = :floor WHERE name = :name"),
+                        {'name': name, 'floor': floor}
+                    )
+            elif engine.dialect.name == 'postgresql':
+                sequence = connection.execute(
+                    sa.text("SELECT pg_get_serial_sequence(:name, 'id')"), {'name': name}
+                ).scalar()
+                # Already quoted and schema-qualified by PostgreSQL
+                if connection.execute(sa.text(f"SELECT last_value FROM {sequence}")).scalar() < floor:
+                    connection.execute(sa.text("SELECT setval(:sequence, :floor)"),
+                                       {'sequence': sequence, 'floor': floor})
+            else:
+                raise ValueError(f"Cannot reserve saying ids on {engine.dialect.name} shards")
+
+    def shard_for(self, user_id):
+        """Bind key of user's shard, or None when sharding is off"""
+        if not self.enabled:
+            return None
+        if self.strategy == 'hash':
+            return self._hash(user_id)
+
+        now = time.monotonic()
+        cached = self._cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        shard = self._lookup(user_id)
+        if shard is None:
+            shard = self._assign(user_id)
+        with self._lock:
+            self._cache[user_id] = (shard, now + self.cache_ttl)
+        return shard
+
+    def _hash(self, user_id):
+        digest = hashlib.sha256(str(user_id).encode()).digest()
+        return self.keys[int.from_bytes(digest[:8], 'big') % len(self.keys)]
+
+    @staticmethod
+    def _lookup(user_id):
+        directory = UserShard.__table__
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(directory.c.shard).where(directory.c.user_id == user_id)
+            ).scalar()
+
+    def _assign(self, user_id):
+        directory = UserShard.__table__
+        shard = self._hash(user_id)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(insert(directory).values(
+                    user_id=user_id, shard=shard, assigned_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Assigned concurrently by another worker
+            shard = self._lookup(user_id)
+        return shard
+
+    @contextmanager
+    def using(self, key):
+        """Route sharded tables to shard key (None: the default database)"""
+        token = current_shard.set(key)
+        try:
+            yield
+        finally:
+            current_shard.reset(token)
+
+    def for_user(self, user_id):
+        """Route sharded tables to user's shard"""
+        return self.using(self.shard_for(user_id))
+
+    def push(self, user_id):
+        """Like for_user, for hooks that cannot use a with block; returns a token for pop"""
+        return current_shard.set(self.shard_for(user_id))
+
+    @staticmethod
+    def pop(token):
+        current_shard.reset(token)
+
+    def fan_out(self, func, *args):
+        """Run func(*args) on every shard concurrently; returns {shard: result}.
+
+        Each call gets its own app context and session. Without shards func
+        runs once, on the default database, keyed by None.
+        """
+        app = current_app._get_current_object()
+        keys = self.keys or [None]
+
+        def run(key):
+            with app.app_context(), self.using(key):
+                return func(*args)
+
+        with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+            return dict(zip(keys, pool.map(run, keys)))
+
+    def rebalance(self, user_id, target, batch_size=1000, settle_seconds=None, poll_seconds=5):
+        """Move user's sayings to shard target while the user stays online.
+
+        Rows are copied in batches, then the rows changed meanwhile are
+        copied again until few are left. The directory entry is then
+        switched and, once every process's cached entry has expired and the
+        user's running import jobs and backups (which keep the shard they
+        started on) have finished, the last changes are copied and the rows
+        removed from the old shard. Saying ids and uuids are kept.
+        Returns the number of sayings copied. Needs an app context.
+        """
+        if self.strategy != 'directory':
+            raise ValueError("Rebalancing needs SHARD_STRATEGY = 'directory'")
+        if target not in self.keys:
+            raise ValueError(f"Unknown shard: {target}")
+
+        source = self._lookup(user_id) or self._assign(user_id)
+        if source == target:
+            return 0
+        if db.engines[target].dialect.name == 'sqlite' and self.id_floors[target] < self.id_floors[source]:
+            # The user's ids would make the shard hand out ids in source's range
+            raise ValueError(f"SQLite shard {target} cannot take users from {source}, whose ids are above its range")
+        started = datetime.utcnow()
+
+        copied = self._copy_sayings(user_id, source, target, None, batch_size)
+        since = started
+        while True:
+            mark = datetime.utcnow()
+            changed = self._copy_sayings(user_id, source, target, since, batch_size)
+            copied += changed
+            since = mark
+            if changed <= batch_size:
+                break
+
+        directory = UserShard.__table__
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(directory).where(directory.c.user_id == user_id)
+                .values(shard=target, moved_at=datetime.utcnow())
+            )
+        with self._lock:
+            self._cache.pop(user_id, None)
+        time.sleep(self.cache_ttl if settle_seconds is None else settle_seconds)
+        if self._has_running_jobs(user_id):
+            while self._has_running_jobs(user_id):
+                time.sleep(poll_seconds)
+            # Their rows may carry a time from before the last pass
+            since = started
+
+        copied += self._copy_sayings(user_id, source, target, since, batch_size)
+        self._move_tombstones(user_id, source, target, started, batch_size)
+        self._purge(user_id, source, batch_size)
+        return copied
+
+    @staticmethod
+    def _has_running_jobs(user_id):
+        config = current_app.config
+        now = datetime.utcnow()
+        heartbeat = now - timedelta(seconds=config.get('IMPORT_JOB_STALE_SECONDS', 300))
+        started = now - timedelta(seconds=config.get('BACKUP_STALE_SECONDS', 6 * 3600))
+        with db.engine.connect() as connection:
+            return bool(
+                connection.execute(select(ImportJob.id).where(
+                    ImportJob.user_id == user_id, ImportJob.status == 'processing', ImportJob.heartbeat_at >= heartbeat
+                ).limit(1)).first()
+                or connection.execute(select(Backup.id).where(
+                    Backup.user_id == user_id, Backup.status == 'processing', Backup.started_at >= started
+                ).limit(1)).first()
+            )
+
+    @staticmethod
+    def _copy_sayings(user_id, source, target, since, batch_size):
+        """Upsert user's sayings updated since since (all if None) from source to target"""
+        table = Saying.__table__
+        names = [column.name for column in table.c]
+        copied = 0
+        last_id = 0
+        while True:
+            query = select(table).where(table.c.user_id == user_id, table.c.id > last_id)
+            if since is not None:
+                query = query.where(table.c.updated_at >= since)
+            with db.engines[source].connect() as connection:
+                rows = connection.execute(query.order_by(table.c.id).limit(batch_size)).all()
+            if not rows:
+                return copied
+            last_id = rows[-1].id
+            rows = [dict(row._mapping) for row in rows]
+
+            with db.engines[target].begin() as connection:
+                existing = set(connection.execute(
+                    select(table.c.uuid).where(table.c.uuid.in_([row['uuid'] for row in rows]))
+                ).scalars())
+                # Keep the newer version of rows written to the target
+                # by processes that already switched over
+                updates = [{f'b_{name}': value for name, value in row.items()} for row in rows if row['uuid'] in existing]
+                if updates:
+                    connection.execute(
+                        update(table)
+                        .where(table.c.uuid == bindparam('b_uuid'),
+                               or_(table.c.updated_at.is_(None), table.c.updated_at <= bindparam('b_updated_at')))
+                        .values({name: bindparam(f'b_{name}') for name in names if name not in ('id', 'uuid')}),
+                        updates
+                    )
+                inserts = [row for row in rows if row['uuid'] not in existing]
+                if inserts:
+                    connection.execute(insert(table), inserts)
+            copied += len(rows)
+
+    @staticmethod
+    def _move_tombstones(user_id, source, target, since, batch_size):
+        """Copy user's tombstones and apply the deletions made since the move began"""
+        tombstones = SayingTombstone.__table__
+        sayings = Saying.__table__
+        with db.engines[source].connect() as connection:
+            rows = [dict(row._mapping) for row in connection.execute(
+                select(tombstones.c.user_id, tombstones.c.saying_uuid, tombstones.c.deleted_at)
+                .where(tombstones.c.user_id == user_id)
+            )]
+        with db.engines[target].begin() as connection:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                connection.execute(insert(tombstones), batch)
+                deleted = [row['saying_uuid'] for row in batch if row['deleted_at'] and row['deleted_at'] >= since]
+                if deleted:
+                    connection.execute(delete(sayings).where(
+                        sayings.c.user_id == user_id, sayings.c.uuid.in_(deleted)
+                    ))
+
+    @staticmethod
+    def _purge(user_id, shard, batch_size):
+        for table in (Saying.__table__, SayingTombstone.__table__):
+            while True:
+                with db.engines[shard].begin() as connection:
+                    ids = connection.execute(
+                        select(table.c.id).where(table.c.user_id == user_id).limit(batch_size)
+                    ).scalars().all()
+                    if not ids:
+                        break
+                    connection.execute(delete(table).where(table.c.id.in_(ids)))
+
+
+shards = ShardRouter()
+
+
+shards_cli = AppGroup('shards', help='Manage user shards')
+
+
+@shards_cli.command('create')
+def create_command():
+    """Create the sharded tables on every shard"""
+    shards.create_all()
+
+
+@shards_cli.command('status')
+def status_command():
+    """Show how many users each shard holds"""
+    directory = UserShard.__table__
+    counts = dict(db.session.execute(
+        select(directory.c.shard, sa.func.count()).group_by(directory.c.shard)
+    ).all())
+    for key in shards.keys:
+        click.echo(f'{key}: {counts.get(key, 0)} users')
+
+
+@shards_cli.command('rebalance')
+@click.argument('user_id', type=int)
+@click.argument('target')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebalance_command(user_id, target, batch_size):
+    """Move USER_ID's sayings to shard TARGET without downtime"""
+    copied = shards.rebalance(user_id, target, batch_size=batch_size)
+    click.echo(f'Moved user {user_id} to {target} ({copied} rows copied)')
@@ -0,0 +1,229 @@
+"""Mergeable fixed-memory sketches for approximate analytics.
+
+HyperLogLog estimates distinct counts (e.g. unique users per endpoint/day)
+and DDSketch estimates quantiles with a bounded relative error (e.g. p95
+latency). Both serialize to compact bytes for storage in the database and
+merge losslessly, so per-worker and per-day sketches can be combined.
+"""
+import hashlib
+import math
+import struct
+import zlib
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+class HyperLogLog:
+    """Distinct-count sketch with ~1.04/sqrt(2**precision) standard error"""
+
+    VERSION = 1
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, value):
+        """Add a value (anything with a stable str()) to the sketch"""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Merge another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimate the number of distinct values added"""
+        m = self.num_registers
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small-range correction: fall back to linear counting
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        header = struct.pack('<BB', self.VERSION, self.precision)
+        return header + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, precision = struct.unpack_from('<BB', data)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported HyperLogLog version: {version}")
+        sketch = cls(precision)
+        sketch.registers = bytearray(zlib.decompress(data[2:]))
+        return sketch
+
+
+class DDSketch:
+    """Quantile sketch with relative accuracy guarantees.
+
+    Positive values land in logarithmic buckets, so any reported quantile is
+    within ``relative_accuracy`` of the true value. When more than
+    ``max_bins`` buckets are in use the lowest ones are collapsed, which only
+    affects the accuracy of the smallest quantiles.
+    """
+
+    VERSION = 1
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Merge another sketch with the same accuracy into this one"""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge DDSketches with different accuracy")
+        for key, weight in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + weight
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0 <= q <= 1), or None if empty"""
+        if not 0 <= q <= 1:
+            raise ValueError("quantile must be between 0 and 1")
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def to_bytes(self):
+        out = bytearray()
+        out += struct.pack('<Bd', self.VERSION, self.relative_accuracy)
+        out += struct.pack('<ddd', self.sum, self.min, self.max)
+        _write_varint(out, self.zero_count)
+        _write_varint(out, len(self.bins))
+
+        # Keys are delta-encoded so dense latency ranges take ~2 bytes per bin
+        previous = 0
+        for key in sorted(self.bins):
+            _write_varint(out, _zigzag(key - previous))
+            _write_varint(out, self.bins[key])
+            previous = key
+        return zlib.compress(bytes(out))
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(data)
+        version, relative_accuracy = struct.unpack_from('<Bd', data)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported DDSketch version: {version}")
+
+        sketch = cls(relative_accuracy)
+        sketch.sum, sketch.min, sketch.max = struct.unpack_from('<ddd', data, 9)
+        pos = 33
+        sketch.zero_count, pos = _read_varint(data, pos)
+        num_bins, pos = _read_varint(data, pos)
+
+        key = 0
+        for _ in range(num_bins):
+            delta, pos = _read_varint(data, pos)
+            weight, pos = _read_varint(data, pos)
+            key += _unzigzag(delta)
+            sketch.bins[key] = weight
+
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
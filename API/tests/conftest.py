@@ -0,0 +1,104 @@
+"""Fixtures for the API tests.
+
+Each test gets a throwaway SQLite database (and SQLite shards where it
+asks for them), like the benchmark scripts.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+
+def _make_app(workdir, shard_count=0, **config):
+    from flask import Flask
+    from models import db
+    from sharding import shards
+
+    app = Flask('tests')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{workdir}/main.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SHARD_BINDS'] = {f'shard{i}': f'sqlite:///{workdir}/shard{i}.db' for i in range(shard_count)}
+    app.config.update(config)
+    # Also resets the router left behind by a sharded test
+    shards.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        shards.create_all()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = _make_app(tmp_path)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def sharded_app(tmp_path):
+    from models import db
+    from sharding import shards
+
+    app = _make_app(tmp_path, shard_count=2)
+    with app.app_context():
+        yield app
+    # db is shared by every app; later apps have no such binds
+    for key in shards.keys:
+        db.metadatas.pop(key, None)
+
+
+@pytest.fixture(scope='session')
+def api(tmp_path_factory):
+    """The appIntegral application on a throwaway database"""
+    workdir = tmp_path_factory.mktemp('api')
+    cwd = os.getcwd()
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/app.db'
+    # Backups and import uploads go to directories relative to the working directory
+    os.chdir(workdir)
+    import appIntegral
+    yield appIntegral
+    for worker in (appIntegral.import_jobs, appIntegral.backup_reconciler, appIntegral.backup_scheduler,
+                   appIntegral.account_deletion, appIntegral.view_counter, appIntegral.endpoint_sketches):
+        worker.stop()
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def api_client(api):
+    """Test client and auth headers of a fresh user of the appIntegral application"""
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+    from sharding import shards
+
+    with api.app.app_context():
+        # Other fixtures point the shared router at their own apps
+        shards.init_app(api.app)
+        count = User.query.count()
+        user = User(username=f'client{count}', email=f'client{count}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        # Routes take the token identity as the user id
+        user.uuid = str(user.id)
+        db.session.commit()
+        token = create_access_token(identity=user)
+        user_id = user.id
+    return api.app.test_client(), {'Authorization': f'Bearer {token}'}, user_id
+
+
+@pytest.fixture
+def make_user():
+    """Factory creating user rows; needs an app context"""
+    from models import db, User
+
+    def make_user(username='tester'):
+        user = User(username=username, email=f'{username}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    return make_user
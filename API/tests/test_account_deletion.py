@@ -0,0 +1,101 @@
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import func, select
+
+from account_deletion import AccountDeletionWorker
+from backup_manager import BackupManager
+from models import db, Backup, ImportJob, LoginHistory, Saying, SayingTombstone, User
+from sharding import shards
+
+
+def count(engine, table, user_id):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count()).select_from(table).where(table.c.user_id == user_id)
+        ).scalar()
+
+
+def add_account_data(user_id):
+    with shards.for_user(user_id):
+        db.session.add_all([Saying(content=f'Saying {i} of {user_id}', user_id=user_id) for i in range(5)])
+        db.session.add(SayingTombstone(user_id=user_id, saying_uuid=f'{user_id:036d}', deleted_at=datetime.utcnow()))
+        db.session.commit()
+    db.session.add(LoginHistory(user_id=user_id, status='success'))
+    db.session.commit()
+
+
+def test_deleting_the_account_rejects_its_tokens_at_once(api, api_client):
+    client, headers, user_id = api_client
+
+    response = client.delete('/api/account', headers=headers)
+
+    assert response.status_code == 202
+    with api.app.app_context():
+        user = db.session.get(User, user_id)
+        assert user.deleted_at is not None
+        assert not user.is_active
+    assert client.get('/api/sayings', headers=headers).status_code == 401
+    assert client.delete('/api/account', headers=headers).status_code == 401
+
+
+def test_purge_removes_sayings_and_backups_on_every_shard(sharded_app, tmp_path, make_user):
+    sharded_app.config['BACKUP_DIR'] = str(tmp_path / 'backups')
+    manager = BackupManager(sharded_app)
+    worker = AccountDeletionWorker(sharded_app, manager, chunk_size=2)
+    user_ids = [make_user(f'user{n}') for n in range(4)]
+    for user_id in user_ids:
+        add_account_data(user_id)
+    # Users on both shards are deleted; the last one stays
+    doomed = user_ids[:3]
+    assert {shards.shard_for(user_id) for user_id in doomed} == set(shards.keys)
+    backup_files = []
+    for user_id in doomed:
+        for backup_type in ('full', 'incremental'):
+            success, result = manager.create_backup(user_id, backup_type)
+            assert success, result
+            backup_files.append(result['file_path'])
+
+    for user_id in doomed:
+        assert worker.tombstone(user_id)[0]
+        assert worker.purge(user_id)
+
+    for user_id in doomed:
+        assert db.session.get(User, user_id) is None
+        for key in shards.keys:
+            assert count(db.engines[key], Saying.__table__, user_id) == 0
+            assert count(db.engines[key], SayingTombstone.__table__, user_id) == 0
+        assert count(db.engine, LoginHistory.__table__, user_id) == 0
+    assert Backup.query.count() == 0
+    assert not any(Path(path).exists() for path in backup_files)
+    survivor = user_ids[3]
+    assert count(db.engines[shards.shard_for(survivor)], Saying.__table__, survivor) == 5
+    assert count(db.engine, LoginHistory.__table__, survivor) == 1
+
+
+def test_purge_waits_for_a_running_import(app, tmp_path, make_user):
+    app.config['BACKUP_DIR'] = str(tmp_path / 'backups')
+    worker = AccountDeletionWorker(app, BackupManager(app))
+    user_id = make_user()
+    add_account_data(user_id)
+    db.session.add_all([
+        ImportJob(user_id=user_id, file_path='running.csv', file_format='csv', source_fingerprint='1' * 64,
+                  status='processing', heartbeat_at=datetime.utcnow()),
+        ImportJob(user_id=user_id, file_path='queued.csv', file_format='csv', source_fingerprint='2' * 64),
+        Backup(user_id=user_id, filename='queued.zip', status='pending'),
+    ])
+    db.session.commit()
+    worker.tombstone(user_id)
+
+    assert not worker.purge(user_id)
+
+    # Queued work is dropped so it cannot recreate data; the rest waits
+    assert [job.status for job in ImportJob.query.filter_by(user_id=user_id)] == ['processing']
+    assert Backup.query.count() == 0
+    assert count(db.engine, Saying.__table__, user_id) == 5
+
+    ImportJob.query.filter_by(user_id=user_id).update({'status': 'completed'})
+    db.session.commit()
+    assert worker.purge(user_id)
+    assert db.session.get(User, user_id) is None
+    assert count(db.engine, Saying.__table__, user_id) == 0
@@ -0,0 +1,136 @@
+import random
+import threading
+
+import pytest
+
+from analytics import AnalyticsManager, EndpointSketchBuffer
+from models import db, EndpointStatistics, Saying
+from sketches import HyperLogLog, DDSketch
+
+
+def test_flush_leaves_the_callers_session_alone(app, make_user):
+    user_id = make_user()
+    buffer = EndpointSketchBuffer()
+    buffer.record('GET /api/sayings', user_id, 12.5)
+    db.session.add(Saying(content='Not committed', user_id=user_id))
+
+    buffer.flush()
+    db.session.rollback()
+
+    assert Saying.query.count() == 0
+    row = EndpointStatistics.query.one()
+    assert (row.endpoint, row.call_count) == ('GET /api/sayings', 1)
+
+
+def test_concurrent_flushes_of_a_new_day_add_up(app, make_user):
+    user_id = make_user()
+    buffers = [EndpointSketchBuffer() for _ in range(8)]
+    for buffer in buffers:
+        buffer.record('GET /api/sayings', user_id, 12.5)
+    barrier = threading.Barrier(len(buffers))
+    errors = []
+
+    def flush(buffer):
+        with app.app_context():
+            barrier.wait()
+            try:
+                buffer.flush()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=flush, args=(buffer,)) for buffer in buffers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert EndpointStatistics.query.one().call_count == len(buffers)
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize('distinct', [50, 5_000, 200_000])
+def test_hyperloglog_estimates_distinct_counts(distinct):
+    sketch = HyperLogLog()
+    for value in range(distinct):
+        sketch.add(value)
+        sketch.add(value)
+
+    # 4 standard errors at precision 12
+    assert sketch.count() == pytest.approx(distinct, rel=0.065)
+
+
+def test_hyperloglog_merge_is_the_union_and_survives_storage():
+    first, second = HyperLogLog(), HyperLogLog()
+    for value in range(0, 60_000):
+        first.add(value)
+    for value in range(40_000, 100_000):
+        second.add(value)
+
+    merged = HyperLogLog.from_bytes(first.to_bytes()).merge(HyperLogLog.from_bytes(second.to_bytes()))
+
+    assert merged.count() == pytest.approx(100_000, rel=0.065)
+    assert HyperLogLog.from_bytes(merged.to_bytes()).count() == merged.count()
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(precision=10))
+
+
+def test_ddsketch_quantiles_are_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1) for _ in range(50_000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.95, 0.99):
+        assert sketch.quantile(q) == pytest.approx(exact_quantile(values, q), rel=0.01)
+    assert sketch.quantile(1) == pytest.approx(max(values), rel=0.01)
+    assert sketch.max == max(values)
+    assert DDSketch().quantile(0.5) is None
+
+
+def test_ddsketch_merge_matches_a_single_sketch():
+    rng = random.Random(11)
+    values = [rng.expovariate(1 / 40) for _ in range(20_000)]
+    whole = DDSketch()
+    parts = [DDSketch() for _ in range(4)]
+    for index, value in enumerate(values):
+        whole.add(value)
+        parts[index % 4].add(value)
+
+    merged = DDSketch.from_bytes(parts[0].to_bytes())
+    for part in parts[1:]:
+        merged.merge(DDSketch.from_bytes(part.to_bytes()))
+
+    assert merged.count == whole.count
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_flushes_from_several_processes_merge_in_endpoint_stats(app, make_user):
+    # Requests served by other tests are in the process-wide buffer too
+    endpoint_name = 'GET /tests/merged'
+    rng = random.Random(3)
+    latencies = []
+    # Two processes' buffers, flushed twice each
+    for process in range(2):
+        buffer = EndpointSketchBuffer()
+        for flush in range(2):
+            for user_id in range(1000):
+                latency = rng.uniform(5, 500)
+                latencies.append(latency)
+                buffer.record(endpoint_name, user_id + 500 * process, latency)
+            buffer.flush()
+
+    stats = AnalyticsManager.get_endpoint_stats(endpoint_name)
+
+    [endpoint] = stats['endpoints']
+    assert endpoint['calls'] == 4000
+    assert endpoint['unique_users'] == pytest.approx(1500, rel=0.065)
+    assert endpoint['latency_ms']['p95'] == pytest.approx(exact_quantile(latencies, 0.95), rel=0.01)
+    assert endpoint['latency_ms']['max'] == max(latencies)
+    assert AnalyticsManager.get_daily_active_users()['active_users'] == [pytest.approx(1500, rel=0.065)]
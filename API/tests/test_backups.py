@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from backup_manager import BackupManager
+from backup_scheduler import BackupScheduler
+from models import db, Backup, BackupChunk, Saying
+
+
+def make_manager(app, tmp_path):
+    app.config['BACKUP_DIR'] = str(tmp_path / 'backups')
+    return BackupManager(app)
+
+
+def test_backup_is_written_to_the_name_it_was_queued_under(app, tmp_path, make_user):
+    manager = make_manager(app, tmp_path)
+    scheduler = BackupScheduler(app, manager)
+    user_id = make_user()
+    db.session.add(Saying(content='Backed up', user_id=user_id))
+    db.session.commit()
+
+    success, backup = scheduler.enqueue(user_id)
+    assert success
+    filename = backup.filename
+    assert filename.endswith('.zip')
+
+    success, result = manager.create_backup(user_id, 'full', backup=backup)
+    assert success, result
+    assert backup.filename == filename
+    assert (manager.backup_dir / filename).exists()
+    assert [path.name for path in manager.backup_dir.glob('backup_*')] == [filename]
+
+
+def test_reconcile_leaves_files_of_running_backups_alone(app, tmp_path, make_user):
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    backup = Backup(user_id=user_id, filename=manager.backup_filename(user_id, 'full'),
+                    backup_type='full', status='processing')
+    db.session.add(backup)
+    db.session.commit()
+    # Partly written archive
+    (manager.backup_dir / backup.filename).write_bytes(b'PK\x03\x04')
+
+    stats = manager.reconcile()
+
+    assert stats['added'] == 0
+    assert Backup.query.count() == 1
+    assert backup.status == 'processing'
+
+
+def test_reconcile_never_catalogs_unreadable_archive_as_completed(app, tmp_path, make_user):
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    name = f'backup_{user_id}_20260101_030000_full.zip'
+    (manager.backup_dir / name).write_bytes(b'not a zip file')
+
+    manager.reconcile()
+
+    backup = Backup.query.filter_by(filename=name).one()
+    assert backup.status == 'failed'
+    assert backup.error_message.startswith('Unreadable backup file')
+
+
+def test_replace_restore_leaves_tombstones_for_deleted_sayings(app, tmp_path, make_user):
+    from models import SayingTombstone
+
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    db.session.add(Saying(content='In the backup', user_id=user_id, uuid='a' * 36))
+    db.session.commit()
+    success, result = manager.create_backup(user_id)
+    assert success, result
+    db.session.add(Saying(content='Added after the backup', user_id=user_id, uuid='b' * 36))
+    db.session.commit()
+
+    success, counts = manager.restore_backup(user_id, result['file_path'], mode='replace')
+
+    assert success, counts
+    assert [saying.uuid for saying in Saying.query.filter_by(user_id=user_id)] == ['a' * 36]
+    # Only the saying that stays deleted is tombstoned
+    assert [tombstone.saying_uuid for tombstone in SayingTombstone.query.filter_by(user_id=user_id)] == ['b' * 36]
+    assert not (manager.backup_dir / 'restore').exists()
+
+
+def test_incremental_after_restore_keeps_restored_sayings(app, tmp_path, make_user):
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    saying = Saying(content='First version', user_id=user_id, updated_at=datetime.utcnow() - timedelta(days=1))
+    db.session.add(saying)
+    db.session.commit()
+    success, first = manager.create_backup(user_id)
+    assert success, first
+    # Backups made within the same second share a file name
+    first_copy = tmp_path / 'first.zip'
+    first_copy.write_bytes(Path(first['file_path']).read_bytes())
+    saying.content = 'Second version'
+    db.session.commit()
+    success, second = manager.create_backup(user_id)
+    assert success, second
+
+    success, counts = manager.restore_backup(user_id, first_copy)
+    assert success, counts
+    success, incremental = manager.create_backup(user_id, 'incremental')
+    assert success, incremental
+    success, counts = manager.restore_backup(user_id, incremental['file_path'], mode='replace')
+
+    assert success, counts
+    assert [saying.content for saying in Saying.query.filter_by(user_id=user_id)] == ['First version']
+
+
+def test_deleting_a_chunked_backup_without_its_manifest_releases_its_chunks(app, tmp_path, make_user):
+    app.config['BACKUP_STORAGE'] = 'chunks'
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    db.session.add_all([Saying(content=f'Chunked saying {i}', user_id=user_id) for i in range(20)])
+    db.session.commit()
+    success, result = manager.create_backup(user_id)
+    assert success, result
+    backup = Backup.query.one()
+    assert BackupChunk.query.count() > 0
+
+    Path(result['file_path']).unlink()
+    success, message = manager.delete_backup(backup)
+
+    assert success, message
+    assert {chunk.ref_count for chunk in BackupChunk.query} == {0}
+    assert manager.collect_garbage(grace_seconds=0) > 0
+    assert BackupChunk.query.count() == 0
+
+
+def test_merge_restore_skips_sayings_whose_content_exists_again(app, tmp_path, make_user):
+    manager = make_manager(app, tmp_path)
+    user_id = make_user()
+    saying = Saying(content='Deleted and written again', user_id=user_id)
+    db.session.add(saying)
+    db.session.commit()
+    success, result = manager.create_backup(user_id)
+    assert success, result
+    db.session.delete(saying)
+    db.session.commit()
+    db.session.add(Saying(content='deleted and  written again', user_id=user_id, uuid='n' * 36))
+    db.session.commit()
+
+    success, counts = manager.restore_backup(user_id, result['file_path'])
+
+    assert success, counts
+    assert [saying.uuid for saying in Saying.query.filter_by(user_id=user_id)] == ['n' * 36]
@@ -0,0 +1,138 @@
+import os
+import threading
+
+import pytest
+
+from cloud_upload import CloudUploader, FileRange, GCSTarget, GCS_MAX_COMPOSE, S3Target
+
+
+class FlakyS3:
+    """Multipart uploads in memory; each part fails its first `failures` attempts"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'upload-{len(self.uploads) + len(self.aborted)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            attempt = self.attempts[PartNumber] = self.attempts.get(PartNumber, 0) + 1
+        if attempt <= self.failures:
+            raise ConnectionError('simulated connection reset')
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+
+class RecordingBlob:
+    """Reads uploads in chunk_size pieces, like a resumable upload"""
+
+    def __init__(self, bucket, name, chunk_size):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+
+    def upload_from_file(self, file_obj, size=None):
+        assert file_obj.tell() == 0
+        data = bytearray()
+        while len(data) < size:
+            piece = file_obj.read(self.chunk_size)
+            self.bucket.largest_read = max(self.bucket.largest_read, len(piece))
+            data += piece
+        self.bucket.objects[self.name] = bytes(data)
+
+    def compose(self, sources):
+        self.bucket.objects[self.name] = b''.join(self.bucket.objects[blob.name] for blob in sources)
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class RecordingGCS:
+    def __init__(self):
+        self.objects = {}
+        self.largest_read = 0
+
+    def bucket(self, name):
+        return self
+
+    def blob(self, name, chunk_size=None):
+        return RecordingBlob(self, name, chunk_size or 1 << 30)
+
+
+def test_gcs_parts_are_streamed_in_chunks(tmp_path):
+    path = tmp_path / 'backup.zip'
+    data = os.urandom(GCS_MAX_COMPOSE * 64 << 10)
+    path.write_bytes(data)
+    gcs = RecordingGCS()
+    # Parts have to grow to size / 32 = 64 KiB; reads stay at 16 KiB
+    target = GCSTarget(gcs, 'backups', part_size=16 << 10, chunk_size=16 << 10)
+
+    CloudUploader([target], workers=4).upload([(path, 'backup.zip')])
+
+    assert gcs.objects == {'backup.zip': data}
+    assert gcs.largest_read == 16 << 10
+
+
+def test_file_range_reads_and_seeks_within_its_range(tmp_path):
+    path = tmp_path / 'data'
+    path.write_bytes(bytes(range(100)))
+
+    with FileRange(path, 10, 20) as stream:
+        assert stream.read(5) == bytes(range(10, 15))
+        assert stream.read() == bytes(range(15, 30))
+        assert stream.read(1) == b''
+        stream.seek(-4, os.SEEK_END)
+        assert stream.tell() == 16
+        assert stream.read() == bytes(range(26, 30))
+
+
+def test_parts_go_to_both_targets_and_failed_parts_are_retried(tmp_path):
+    path = tmp_path / 'backup.zip'
+    data = os.urandom(100 << 10)
+    path.write_bytes(data)
+    s3, gcs = FlakyS3(failures=2), RecordingGCS()
+    targets = [S3Target(s3, 'backups', part_size=16 << 10), GCSTarget(gcs, 'backups', part_size=16 << 10)]
+
+    CloudUploader(targets, workers=4, backoff=0).upload([(path, 'backup.zip')])
+
+    assert s3.objects == {'backup.zip': data}
+    assert gcs.objects == {'backup.zip': data}
+    assert s3.attempts == {number: 3 for number in range(1, 8)}
+    assert not s3.uploads
+
+
+def test_failed_upload_is_aborted_on_every_target(tmp_path):
+    path = tmp_path / 'backup.zip'
+    path.write_bytes(os.urandom(64 << 10))
+    s3, gcs = FlakyS3(failures=5), RecordingGCS()
+    targets = [S3Target(s3, 'backups', part_size=16 << 10), GCSTarget(gcs, 'backups', part_size=16 << 10)]
+
+    with pytest.raises(ConnectionError):
+        CloudUploader(targets, workers=4, retries=3, backoff=0).upload([(path, 'backup.zip')])
+
+    assert s3.aborted == ['upload-0']
+    assert not s3.objects and not s3.uploads
+    # GCS part objects are deleted too
+    assert gcs.objects == {}
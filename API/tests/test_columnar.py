@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from batch_processor import BatchProcessor
+from models import db, Saying
+
+pytest.importorskip('pyarrow')
+
+TYPED = ('content', 'rating', 'view_count', 'is_public', 'created_at')
+
+
+def typed_values(user_id):
+    return [
+        tuple(getattr(saying, column) for column in TYPED)
+        for saying in Saying.query.filter_by(user_id=user_id).order_by(Saying.content)
+    ]
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_columnar_round_trip_keeps_typed_columns(app, make_user, file_format):
+    source, target = make_user('source'), make_user('target')
+    db.session.add_all([
+        Saying(content='Rated and private', user_id=source, rating=4.5, view_count=17, is_public=False,
+               created_at=datetime(2020, 5, 17, 8, 30, 15, 250000)),
+        Saying(content='Defaults', user_id=source),
+    ])
+    db.session.commit()
+
+    exported = b''.join(BatchProcessor.iter_export_columnar(source, file_format=file_format))
+    success, result = BatchProcessor.import_columnar(exported, target, file_format=file_format)
+
+    assert success, result
+    assert result['success_count'] == 2
+    assert typed_values(target) == typed_values(source)
+
+
+def test_columnar_import_rejects_bad_typed_values(app, make_user):
+    import pyarrow as pa
+
+    user_id = make_user()
+    table = pa.table({
+        'content': ['Fine', 'Negative views', 'Unknown visibility'],
+        'view_count': [3, -1, None],
+        'is_public': ['true', None, 'maybe'],
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    success, result = BatchProcessor.import_columnar(sink.getvalue().to_pybytes(), user_id, file_format='arrow')
+
+    assert success, result
+    assert result['errors'] == [
+        'Row 1: is_public must be a boolean',
+        'Row 2: view_count must be a non-negative integer',
+        'Row 3: is_public must be a boolean',
+    ]
@@ -0,0 +1,144 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from batch_processor import BatchProcessor
+from import_engine import BulkWriter, ImportFormatError, iter_json_array, normalize_frame
+from import_jobs import ImportJobWorker
+from models import db, Saying
+from sharding import shards
+
+
+def csv_upload(rows):
+    lines = ['content,author'] + [f'Imported saying {i},Author {i}' for i in range(rows)]
+    return io.BytesIO(('\n'.join(lines) + '\n').encode())
+
+
+def test_import_route_parses_on_import_workers(api, api_client, monkeypatch):
+    client, headers, user_id = api_client
+    monkeypatch.setitem(api.app.config, 'IMPORT_WORKERS', 2)
+    calls = []
+    parallel = BatchProcessor._import_csv_parallel
+
+    def spy(file_content, user_id, chunk_size, progress_callback, workers, on_duplicate):
+        calls.append(workers)
+        return parallel(file_content, user_id, chunk_size, progress_callback, workers, on_duplicate)
+
+    monkeypatch.setattr(BatchProcessor, '_import_csv_parallel', staticmethod(spy))
+
+    response = client.post('/api/sayings/import', headers=headers,
+                           data={'file': (csv_upload(50), 'sayings.csv')})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['data']['success_count'] == 50
+    assert calls == [2]
+    with api.app.app_context():
+        assert Saying.query.filter_by(user_id=user_id).count() == 50
+
+
+def test_import_route_ndjson_with_import_workers(api, api_client, monkeypatch):
+    client, headers, user_id = api_client
+    monkeypatch.setitem(api.app.config, 'IMPORT_WORKERS', 2)
+    data = '\n'.join(json.dumps({'content': f'NDJSON saying {i}'}) for i in range(30)) + '\n'
+
+    response = client.post('/api/sayings/import', headers=headers,
+                           data={'file': (io.BytesIO(data.encode()), 'sayings.ndjson')})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['data']['success_count'] == 30
+
+
+def test_import_job_parses_on_workers(app, tmp_path, make_user):
+    user_id = make_user()
+    worker = ImportJobWorker(app, upload_dir=tmp_path / 'uploads', block_size=64, workers=2)
+    success, job = worker.submit(user_id, csv_upload(40), 'sayings.csv', 'csv')
+    assert success, job
+
+    worker._process(worker._claim())
+
+    db.session.refresh(job)
+    assert job.status == 'completed', job.error_message
+    assert job.success_count == 40
+    contents = [saying.content for saying in Saying.query.filter_by(user_id=user_id).order_by(Saying.id)]
+    assert contents == [f'Imported saying {i}' for i in range(40)]
+
+
+def test_resumed_sharded_import_job_does_not_duplicate_the_last_block(sharded_app, tmp_path, make_user):
+    user_id = make_user()
+    worker = ImportJobWorker(sharded_app, upload_dir=tmp_path / 'uploads', workers=1)
+    success, job = worker.submit(user_id, csv_upload(10), 'sayings.csv', 'csv', on_duplicate=None)
+    assert success, job
+
+    # The worker died after the block committed on the shard, before the checkpoint did
+    with shards.for_user(user_id):
+        BatchProcessor.import_csv(csv_upload(10).getvalue(), user_id)
+    stale = datetime.utcnow() - timedelta(hours=1)
+    job.status, job.started_at, job.heartbeat_at = 'processing', stale, stale
+    db.session.commit()
+
+    worker._process(worker._claim())
+
+    db.session.refresh(job)
+    assert job.status == 'completed', job.error_message
+    assert (job.success_count, job.duplicate_count) == (0, 10)
+    with shards.for_user(user_id):
+        assert Saying.query.filter_by(user_id=user_id).count() == 10
+
+
+def failing(error):
+    def write(chunk):
+        raise error('INSERT INTO sayings', {}, Exception('refused'))
+    return write
+
+
+def test_bulk_writer_reports_rejected_rows(app, make_user, monkeypatch):
+    import pandas as pd
+
+    user_id = make_user()
+    rows, lines, _ = normalize_frame(pd.DataFrame({'content': ['One', 'Two']}, dtype=str), user_id)
+    writer = BulkWriter()
+    monkeypatch.setattr(writer, '_executemany', failing(IntegrityError))
+
+    inserted, _, errors = writer.write(rows, lines)
+
+    assert inserted == 0
+    assert errors[0][1].startswith('Database error in lines 2-3')
+
+
+def test_bulk_writer_raises_on_operational_errors(app, make_user, monkeypatch):
+    import pandas as pd
+
+    user_id = make_user()
+    rows, lines, _ = normalize_frame(pd.DataFrame({'content': ['One', 'Two']}, dtype=str), user_id)
+    writer = BulkWriter()
+    monkeypatch.setattr(writer, '_executemany', failing(OperationalError))
+
+    with pytest.raises(OperationalError):
+        writer.write(rows, lines)
+
+
+def test_import_job_keeps_checkpoint_on_operational_error(app, tmp_path, make_user, monkeypatch):
+    user_id = make_user()
+    worker = ImportJobWorker(app, upload_dir=tmp_path / 'uploads', workers=1)
+    success, job = worker.submit(user_id, csv_upload(10), 'sayings.csv', 'csv')
+    monkeypatch.setattr(BulkWriter, '_executemany', lambda self, chunk: failing(OperationalError)(chunk))
+
+    worker._process(worker._claim())
+
+    db.session.refresh(job)
+    assert job.status == 'processing'
+    assert job.byte_offset == 0
+    assert job.success_count == job.error_count == 0
+
+
+def test_json_array_rejects_oversized_item():
+    # An unterminated string is never decodable; it must not be buffered to EOF
+    stream = io.BytesIO(b'[{"content": "short"}, {"content": "' + b'x' * 50_000)
+    items = iter_json_array(stream, buffer_size=1024, max_item_size=4096)
+
+    assert next(items) == (1, {'content': 'short'})
+    with pytest.raises(ImportFormatError, match='Item 2 is larger than 4096 characters'):
+        next(items)
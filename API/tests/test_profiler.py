@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from flask import Flask
+
+from models import db, User
+from profiler import RequestProfiler, create_blueprint, token_required
+
+
+def slow_view():
+    time.sleep(0.2)
+    return 'done'
+
+
+@pytest.fixture
+def profiled():
+    app = Flask('profiled')
+    app.config.update(PROFILER_TOKEN='secret', PROFILER_INTERVAL_MS=1)
+    profiler = RequestProfiler(app)
+    app.register_blueprint(create_blueprint(profiler, token_required))
+    app.add_url_rule('/slow', view_func=slow_view)
+    yield app.test_client(), profiler
+    profiler.stop()
+
+
+def test_token_guard_rejects_missing_or_wrong_tokens(profiled):
+    client, _ = profiled
+
+    assert client.get('/api/admin/profiler').status_code == 403
+    assert client.get('/api/admin/profiler', headers={'X-Profiler-Token': 'guess'}).status_code == 403
+    assert client.get('/api/admin/profiler', headers={'X-Profiler-Token': 'secret'}).status_code == 200
+
+    client.application.config['PROFILER_TOKEN'] = None
+    assert client.get('/api/admin/profiler', headers={'X-Profiler-Token': ''}).status_code == 403
+
+
+def test_start_sample_download_and_stop(profiled):
+    client, profiler = profiled
+    headers = {'X-Profiler-Token': 'secret'}
+
+    response = client.post('/api/admin/profiler', headers=headers, json={'rate': 1, 'duration': 30})
+    assert response.status_code == 200
+    assert response.get_json()['data']['active']
+    client.get('/slow')
+
+    status = client.get('/api/admin/profiler', headers=headers).get_json()['data']
+    # The profiler's own routes are sampled too
+    route = next(route for route in status['routes'] if route['route'] == 'GET /slow')
+    assert route['requests'] == 1
+    assert route['samples'] > 0
+
+    collapsed = client.get('/api/admin/profiler/profile', headers=headers, query_string={'format': 'collapsed'})
+    assert any(line.startswith('GET /slow;') and 'slow_view' in line for line in collapsed.text.splitlines())
+    speedscope = client.get('/api/admin/profiler/profile', headers=headers).get_json()
+    assert 'GET /slow' in [profile['name'] for profile in speedscope['profiles']]
+
+    response = client.delete('/api/admin/profiler', headers=headers)
+    assert not response.get_json()['data']['active']
+    client.get('/slow')
+    # Samples survive the stop; later requests are not sampled
+    assert {route['route']: route['requests'] for route in profiler.status()['routes']}['GET /slow'] == 1
+
+
+def test_start_rejects_bad_parameters(profiled):
+    client, profiler = profiled
+    headers = {'X-Profiler-Token': 'secret'}
+
+    for body in ({'rate': 0}, {'rate': 2}, {'duration': 10 ** 6}, {'rate': 'often'}):
+        assert client.post('/api/admin/profiler', headers=headers, json=body).status_code == 400, body
+    assert not profiler.active
+    response = client.get('/api/admin/profiler/profile', headers=headers, query_string={'format': 'pprof'})
+    assert response.status_code == 400
+
+
+def test_profiler_window_ends_by_itself(profiled):
+    _, profiler = profiled
+    profiler.start(rate=1, duration=0.05)
+
+    time.sleep(0.2)
+
+    assert not profiler.active
+
+
+def test_api_profiler_routes_need_an_admin(api, api_client):
+    client, headers, user_id = api_client
+
+    assert client.get('/api/admin/profiler').status_code == 401
+    assert client.post('/api/admin/profiler', headers=headers, json={'rate': 1}).status_code == 403
+
+    with api.app.app_context():
+        db.session.get(User, user_id).is_admin = True
+        db.session.commit()
+    try:
+        response = client.post('/api/admin/profiler', headers=headers, json={'rate': 1, 'duration': 5})
+        assert response.status_code == 200
+        assert response.get_json()['data']['active']
+        assert client.delete('/api/admin/profiler', headers=headers).status_code == 200
+        assert not api.profiler.active
+    finally:
+        api.profiler.stop()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from analytics import AnalyticsManager
+from report_jobs import ReportJobQueue
+
+
+def wait_for(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.status in ('pending', 'processing'):
+        assert time.monotonic() < deadline, f'job still {job.status}'
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def queue(app):
+    queue = ReportJobQueue(app, max_workers=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_identical_requests_share_one_job(queue, make_user, monkeypatch):
+    user_id = make_user()
+    release = threading.Event()
+    calls = []
+
+    def generate_report(user_id, report_type):
+        calls.append((user_id, report_type))
+        release.wait(10)
+        return {'report_type': report_type}
+    monkeypatch.setattr(AnalyticsManager, 'generate_report', generate_report)
+
+    first = queue.submit(user_id, 'weekly')
+    assert queue.submit(user_id, 'weekly') is first
+    monthly = queue.submit(user_id, 'monthly')
+    assert monthly is not first
+    release.set()
+
+    assert wait_for(first).status == 'completed'
+    assert first.result == {'report_type': 'weekly'}
+    assert wait_for(monthly).result == {'report_type': 'monthly'}
+    # Still cached once finished
+    assert queue.submit(user_id, 'weekly') is first
+    assert sorted(calls) == [(user_id, 'monthly'), (user_id, 'weekly')]
+
+
+def test_failed_job_is_reported_and_retried(queue, make_user, monkeypatch):
+    user_id = make_user()
+
+    def generate_report(user_id, report_type):
+        raise RuntimeError('no data')
+    monkeypatch.setattr(AnalyticsManager, 'generate_report', generate_report)
+
+    job = wait_for(queue.submit(user_id, 'weekly'))
+    assert (job.status, job.error) == ('failed', 'no data')
+    assert job.finished_at is not None
+    assert queue.submit(user_id, 'weekly') is not job
+
+
+def test_jobs_are_private_and_expire(app, make_user, monkeypatch):
+    monkeypatch.setattr(AnalyticsManager, 'generate_report', lambda user_id, report_type: {})
+    queue = ReportJobQueue(app, max_workers=1, ttl=0.05)
+    try:
+        user_id = make_user()
+        job = wait_for(queue.submit(user_id, 'weekly'))
+
+        assert queue.get(job.id, user_id) is job
+        assert queue.get(job.id, user_id + 1) is None
+        time.sleep(0.1)
+        assert queue.get(job.id, user_id) is None
+        assert queue.submit(user_id, 'weekly') is not job
+    finally:
+        queue.shutdown()
+
+
+def test_unknown_report_type_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.submit(1, 'daily')
+
+
+def test_report_routes_return_the_generated_report(api, api_client):
+    pytest.importorskip('matplotlib')
+    client, headers, _ = api_client
+
+    response = client.post('/api/reports', headers=headers, json={'report_type': 'weekly'})
+    assert response.status_code == 202
+    job_id = response.get_json()['data']['job_id']
+
+    deadline = time.monotonic() + 30
+    while True:
+        response = client.get(f'/api/reports/{job_id}/result', headers=headers)
+        if response.status_code != 202:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    assert response.status_code == 200, response.get_json()
+    report = response.get_json()['data']
+    assert report['report_type'] == 'weekly'
+    assert {'summary', 'statistics', 'category_distribution', 'chart_image'} <= set(report)
+    assert client.post('/api/reports', headers=headers, json={'report_type': 'daily'}).status_code == 400
@@ -0,0 +1,72 @@
+from sqlalchemy import event, insert
+
+from models import db, Saying
+
+
+def add_sayings(app, user_id, count):
+    with app.app_context():
+        sayings = [Saying(content=f'Saying {i}', user_id=user_id) for i in range(count)]
+        db.session.add_all(sayings)
+        db.session.commit()
+        return [saying.id for saying in sayings]
+
+
+def test_ids_lookup_counts_views(api, api_client):
+    client, headers, user_id = api_client
+    first, second, _ = add_sayings(api.app, user_id, 3)
+
+    response = client.get('/api/sayings', headers=headers, query_string={'ids': f'{second},{first},999999'})
+
+    body = response.get_json()
+    assert [item['id'] for item in body['data']] == [second, first]
+    assert body['missing'] == [999999]
+    with api.app.app_context():
+        api.view_counter.flush()
+        views = dict(db.session.query(Saying.id, Saying.view_count).filter(Saying.user_id == user_id))
+    assert [views[saying_id] for saying_id in sorted(views)] == [1, 1, 0]
+
+
+def test_empty_or_unknown_fields_are_rejected(api, api_client):
+    client, headers, _ = api_client
+
+    for fields in ('', ' , ', 'content,bogus'):
+        response = client.get('/api/sayings', headers=headers, query_string={'fields': fields})
+        assert response.status_code == 400, fields
+        assert 'available: id, content, author, category, created_date, last_modified' in response.get_json()['message']
+
+    response = client.get('/api/sayings', headers=headers, query_string={'fields': 'content'})
+    assert response.status_code == 200
+
+
+def test_create_racing_a_duplicate_returns_conflict(api, api_client):
+    client, headers, user_id = api_client
+    content = 'Created by two requests at once'
+
+    # The other request inserts between this one's check and its commit
+    def insert_first(session, flush_context, instances):
+        with db.engine.begin() as connection:
+            connection.execute(insert(Saying.__table__).values(
+                uuid='r' * 36, content=content, content_hash=Saying.hash_content(content), user_id=user_id
+            ))
+    event.listen(db.session, 'before_flush', insert_first, once=True)
+    try:
+        response = client.post('/api/sayings', headers=headers, json={'content': content})
+    finally:
+        if event.contains(db.session, 'before_flush', insert_first):
+            event.remove(db.session, 'before_flush', insert_first)
+
+    assert response.status_code == 409
+    with api.app.app_context():
+        assert response.get_json()['data']['id'] == Saying.query.filter_by(uuid='r' * 36).one().id
+        assert Saying.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_update_to_existing_content_returns_conflict(api, api_client):
+    client, headers, user_id = api_client
+    first, second = add_sayings(api.app, user_id, 2)
+
+    response = client.put(f'/api/sayings/{second}', headers=headers, json={'content': '  SAYING 0 '})
+
+    assert response.status_code == 409
+    with api.app.app_context():
+        assert db.session.get(Saying, second).content == 'Saying 1'
@@ -0,0 +1,103 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select, update
+
+import sharding
+from batch_processor import BatchProcessor
+from models import db, Saying, ImportJob
+from sharding import shards
+
+CSV = b'content,author\nFirst saying,A\nSecond saying,B\nThird saying,C\n'
+
+
+def count_sayings(engine, user_id):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count()).select_from(Saying.__table__).where(Saying.__table__.c.user_id == user_id)
+        ).scalar()
+
+
+def test_import_writes_to_users_shard(sharded_app, make_user):
+    user_id = make_user()
+    shard = shards.shard_for(user_id)
+
+    with shards.for_user(user_id):
+        success, result = BatchProcessor.import_csv(CSV, user_id)
+
+    assert success, result
+    assert result['success_count'] == 3
+    assert count_sayings(db.engines[shard], user_id) == 3
+    assert count_sayings(db.engine, user_id) == 0
+    other = next(key for key in shards.keys if key != shard)
+    assert count_sayings(db.engines[other], user_id) == 0
+
+
+def test_rebalance_keeps_saying_ids(sharded_app, make_user):
+    source, target = sorted(shards.keys, key=shards.id_floors.get)
+    user_id = next(user_id for user_id in (make_user(f'user{n}') for n in range(20))
+                   if shards.shard_for(user_id) == source)
+
+    with shards.for_user(user_id):
+        BatchProcessor.import_csv(CSV, user_id)
+        before = dict(db.session.execute(select(Saying.uuid, Saying.id).where(Saying.user_id == user_id)).all())
+    db.session.remove()
+
+    assert shards.rebalance(user_id, target, settle_seconds=0) == 3
+
+    with shards.for_user(user_id):
+        after = dict(db.session.execute(select(Saying.uuid, Saying.id).where(Saying.user_id == user_id)).all())
+        assert after == before
+        saying = Saying(content='Written after the move', user_id=user_id)
+        db.session.add(saying)
+        db.session.commit()
+        # Taken from the target's own range, not reusing the moved ids
+        floor = shards.id_floors[target]
+        assert floor < saying.id <= floor + 100_000_000
+    assert count_sayings(db.engines[source], user_id) == 0
+
+    # Back into the first shard the new id would push its ids into target's range
+    with pytest.raises(ValueError):
+        shards.rebalance(user_id, source, settle_seconds=0)
+    assert count_sayings(db.engines[target], user_id) == 4
+
+
+def test_rebalance_waits_for_running_import_job(sharded_app, make_user, monkeypatch):
+    source, target = sorted(shards.keys, key=shards.id_floors.get)
+    user_id = next(user_id for user_id in (make_user(f'user{n}') for n in range(20))
+                   if shards.shard_for(user_id) == source)
+    job = ImportJob(user_id=user_id, file_path='sayings.csv', file_format='csv', source_fingerprint='0' * 64,
+                    status='processing', heartbeat_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    db.session.remove()
+
+    # The job still holds the old shard: it writes there until it finishes
+    def sleep(seconds):
+        if seconds:
+            with shards.using(source):
+                BatchProcessor.import_csv(CSV, user_id)
+                db.session.execute(update(ImportJob).where(ImportJob.id == job_id).values(status='completed'))
+                db.session.commit()
+    monkeypatch.setattr(sharding.time, 'sleep', sleep)
+
+    shards.rebalance(user_id, target, settle_seconds=0, poll_seconds=1)
+
+    assert count_sayings(db.engines[target], user_id) == 3
+    assert count_sayings(db.engines[source], user_id) == 0
+
+
+def test_shards_hand_out_disjoint_ids(sharded_app, make_user):
+    ids = {}
+    for name in ('first', 'second', 'third', 'fourth'):
+        user_id = make_user(name)
+        with shards.for_user(user_id):
+            saying = Saying(content=f'Saying of {name}', user_id=user_id)
+            db.session.add(saying)
+            db.session.commit()
+            ids.setdefault(shards.shard_for(user_id), set()).add(saying.id)
+
+    for key, shard_ids in ids.items():
+        floor = shards.id_floors[key]
+        assert all(floor < saying_id <= floor + 100_000_000 for saying_id in shard_ids)
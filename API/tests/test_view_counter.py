@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db, Saying, User, UsageStatistics
+from view_counter import ViewCounter
+
+
+def add_saying(user_id, content):
+    saying = Saying(content=content, user_id=user_id)
+    db.session.add(saying)
+    db.session.commit()
+    return saying
+
+
+def test_flush_skips_deleted_sayings_and_users(app, make_user):
+    counter = ViewCounter(app)
+    alive, closed = make_user('alive'), make_user('closed')
+    kept = add_saying(alive, 'Kept')
+    deleted = add_saying(alive, 'Deleted')
+    closed_saying = add_saying(closed, 'Owned by a closed account')
+
+    counter.increment(kept.id, alive, 2)
+    counter.increment(deleted.id, alive, 5)
+    counter.increment(closed_saying.id, closed, 3)
+    # Same id, wrong owner: must not touch the row
+    counter.increment(kept.id, closed, 7)
+    db.session.delete(deleted)
+    db.session.get(User, closed).deleted_at = datetime.utcnow()
+    db.session.commit()
+
+    assert counter.flush() == 2
+
+    db.session.expire_all()
+    assert db.session.get(Saying, kept.id).view_count == 2
+    assert db.session.get(Saying, closed_saying.id).view_count == 0
+    assert {stats.user_id: stats.total_view_count for stats in UsageStatistics.query} == {alive: 2}
+
+
+def test_failed_views_are_dropped_after_max_attempts(app, make_user, monkeypatch):
+    counter = ViewCounter(app, max_attempts=2)
+    user_id = make_user()
+    saying = add_saying(user_id, 'Unlucky')
+    counter.increment(saying.id, user_id, 4)
+
+    def fail(saying_views):
+        raise OperationalError('UPDATE sayings', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(counter, '_write', fail)
+    with pytest.raises(OperationalError):
+        counter.flush()
+    assert counter._pending_total == 4
+    with pytest.raises(OperationalError):
+        counter.flush()
+    assert counter._pending_total == 0
+    monkeypatch.undo()
+    assert counter.flush() == 0
@@ -0,0 +1,196 @@
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Saying, User, UsageStatistics
+from sharding import shards
+
+class ViewCounter:
+    """Buffers view_count increments in memory and flushes them in batches.
+
+    Read paths only bump an in-process counter. A background thread writes
+    the deltas every VIEW_COUNT_FLUSH_INTERVAL seconds, or sooner once
+    VIEW_COUNT_MAX_PENDING views are buffered, so a crash loses at most one
+    interval or that many views.
+
+    Views of sayings or users deleted meanwhile are discarded. When a flush
+    fails its views are put back, until they have failed
+    VIEW_COUNT_MAX_ATTEMPTS flushes; then they are dropped.
+    """
+
+    def __init__(self, app, flush_interval=None, max_pending=None, max_attempts=None):
+        self.app = app
+        self.flush_interval = flush_interval or app.config.get('VIEW_COUNT_FLUSH_INTERVAL', 10)
+        self.max_pending = max_pending or app.config.get('VIEW_COUNT_MAX_PENDING', 1000)
+        self.max_attempts = max_attempts or app.config.get('VIEW_COUNT_MAX_ATTEMPTS', 3)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._saying_views = Counter()  # (owner user id, saying id) -> views
+        self._failures = Counter()      # (owner user id, saying id) -> failed flushes
+        self._pending_total = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flush thread and write out anything still buffered"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        with self.app.app_context():
+            self.flush()
+
+    def increment(self, saying_id, user_id, count=1):
+        """Record views of a saying owned by user_id"""
+        with self._lock:
+            self._saying_views[(user_id, saying_id)] += count
+            self._pending_total += count
+            full = self._pending_total >= self.max_pending
+
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write buffered views to the database. Needs an app context."""
+        with self._flush_lock:
+            with self._lock:
+                saying_views, self._saying_views = self._saying_views, Counter()
+                self._pending_total = 0
+
+            if not saying_views:
+                return 0
+
+            try:
+                written = self._write(saying_views)
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                self._requeue(saying_views)
+                raise
+
+            for key in saying_views:
+                self._failures.pop(key, None)
+            return written
+
+    def _write(self, saying_views):
+        """Add views to the rows that still exist; returns the views written"""
+        sayings = Saying.__table__
+
+        keys_by_shard = {}
+        for key in saying_views:
+            keys_by_shard.setdefault(shards.shard_for(key[0]), []).append(key)
+
+        # Deleted users' rows are going away; writing to them would only
+        # race the account deletion worker
+        live_users = set(db.session.execute(
+            select(User.id).where(User.id.in_({user_id for user_id, _ in saying_views}), User.deleted_at.is_(None))
+        ).scalars())
+
+        user_views = Counter()
+        for shard, keys in keys_by_shard.items():
+            with shards.using(shard):
+                existing = set(db.session.execute(
+                    select(sayings.c.user_id, sayings.c.id)
+                    .where(sayings.c.id.in_([saying_id for _, saying_id in keys]))
+                ).all())
+                params = []
+                for user_id, saying_id in sorted(keys, key=lambda key: key[1]):
+                    if user_id in live_users and (user_id, saying_id) in existing:
+                        views = saying_views[(user_id, saying_id)]
+                        params.append({'saying_id': saying_id, 'owner_id': user_id, 'views': views})
+                        user_views[user_id] += views
+                if not params:
+                    continue
+
+                # One executemany statement per shard; ids are sorted so
+                # concurrent workers take row locks in the same order.
+                # updated_at is set to itself so its onupdate default
+                # doesn't fire: a view is not a modification.
+                db.session.execute(
+                    update(sayings)
+                    .where(sayings.c.id == bindparam('saying_id'), sayings.c.user_id == bindparam('owner_id'))
+                    .values(
+                        view_count=func.coalesce(sayings.c.view_count, 0) + bindparam('views'),
+                        updated_at=sayings.c.updated_at
+                    ),
+                    params
+                )
+
+        if not user_views:
+            return 0
+
+        stats = UsageStatistics.__table__
+        today = datetime.utcnow().date()
+        existing = {
+            user_id for (user_id,) in db.session.query(UsageStatistics.user_id).filter(
+                UsageStatistics.user_id.in_(list(user_views)),
+                UsageStatistics.date == today
+            )
+        }
+
+        updates = [{'owner_id': user_id, 'views': views}
+                   for user_id, views in sorted(user_views.items()) if user_id in existing]
+        if updates:
+            db.session.execute(
+                update(stats)
+                .where(stats.c.user_id == bindparam('owner_id'), stats.c.date == today)
+                .values(total_view_count=func.coalesce(stats.c.total_view_count, 0) + bindparam('views')),
+                updates
+            )
+
+        inserts = [{'user_id': user_id, 'date': today, 'total_view_count': views}
+                   for user_id, views in user_views.items() if user_id not in existing]
+        if inserts:
+            db.session.execute(insert(stats), inserts)
+
+        return sum(user_views.values())
+
+    def _requeue(self, saying_views):
+        retry = Counter()
+        dropped = 0
+        for key, views in saying_views.items():
+            self._failures[key] += 1
+            if self._failures[key] >= self.max_attempts:
+                del self._failures[key]
+                dropped += views
+            else:
+                retry[key] = views
+
+        with self._lock:
+            self._saying_views.update(retry)
+            self._pending_total += sum(retry.values())
+        if dropped:
+            self.app.logger.warning(f"Dropped {dropped} views after {self.max_attempts} failed flushes")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                self.app.logger.exception("Failed to flush view counts")
+
+    @staticmethod
+    def most_viewed(user_id, limit=10):
+        """Most viewed sayings for user, served by idx_sayings_user_views"""
+        return Saying.query.filter_by(
+            user_id=user_id
+        ).order_by(
+            Saying.view_count.desc()
+        ).limit(limit).all()